@@ -0,0 +1,463 @@
+# Offline benchmarks: drives the Flask app through its test client against local stand-ins for
+# the scraped sites, Google and the Anthropic API, and writes one JSON report.
+#
+#     cd backend && python -m benchmarks --pages 500 --output bench.json
+#
+# Everything runs in a temporary directory with its own SQLite database, so no network access,
+# Firebase project or Anthropic key is needed.
+import argparse
+import base64
+import csv
+import io
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.servers import FakeAnthropic, FixtureSite
+
+SCENARIOS = ('csv_ingest', 'scrape', 'rescrape', 'generate', 'rate', 'model_get', 'rank_check',
+             'concurrent_writes', 'crawl')
+PROJECT_ID = 'bench'
+API_KEY = 'bench-key'
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return round(ordered[index], 2)
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def io_write_bytes() -> Optional[int]:
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('write_bytes:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def file_bytes(db_path: str) -> int:
+    return sum(os.path.getsize(p) for p in (db_path, db_path + '-wal', db_path + '-journal')
+               if os.path.exists(p))
+
+
+def emulator_token(uid: str, email: str) -> str:
+    # The Auth emulator issues unsigned tokens, and the Admin SDK accepts them while
+    # FIREBASE_AUTH_EMULATOR_HOST is set
+    now = int(time.time())
+    claims = {
+        "iss": f"https://securetoken.google.com/{PROJECT_ID}", "aud": PROJECT_ID,
+        "sub": uid, "user_id": uid, "email": email, "iat": now, "auth_time": now, "exp": now + 3600,
+        "firebase": {"identities": {}, "sign_in_provider": "password"},
+    }
+
+    def segment(value):
+        return base64.urlsafe_b64encode(json.dumps(value).encode()).rstrip(b'=').decode()
+
+    return f"{segment({'alg': 'none', 'typ': 'JWT'})}.{segment(claims)}."
+
+
+def sse_events(response) -> List[Dict[str, Any]]:
+    events = []
+    for line in response.get_data(as_text=True).splitlines():
+        if line.startswith('data: '):
+            events.append(json.loads(line[len('data: '):]))
+    return events
+
+
+def write_worker(model_id: int, worker: int, writers: int, writes: int, results):
+    """One forked 'gunicorn worker' updating its share of the model's rows, a commit per write."""
+    import app as app_module
+    import model_store
+    from models import db, Model
+    from sqlalchemy.exc import OperationalError
+
+    latencies, errors = [], 0
+    with app_module.app.app_context():
+        # Connections inherited from the parent must not be used by the child
+        db.engine.dispose(close=False)
+        rows = [row for row in model_store.rows(db.session.get(Model, model_id))
+                if row.position % writers == worker]
+        for n in range(writes):
+            started = time.perf_counter()
+            try:
+                model_store.update_row(rows[n % len(rows)], {"bench_write": n})
+                db.session.commit()
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+    results.put({"latencies": latencies, "errors": errors})
+
+
+class Measurement:
+    """Wall time, peak RSS and bytes written around one scenario."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    def __enter__(self):
+        self.rss_before = peak_rss_bytes()
+        self.io_before = io_write_bytes()
+        self.db_before = file_bytes(self.db_path)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.started
+        io_after = io_write_bytes()
+        self.result = {
+            "seconds": round(self.seconds, 3),
+            "peak_rss_bytes": peak_rss_bytes(),
+            "peak_rss_growth_bytes": peak_rss_bytes() - self.rss_before,
+            "db_growth_bytes": file_bytes(self.db_path) - self.db_before,
+            "bytes_written": io_after - self.io_before if io_after is not None else None,
+        }
+        return False
+
+
+class Bench:
+    def __init__(self, args, workdir: str):
+        self.args = args
+        self.workdir = workdir
+        self.db_path = os.path.join(workdir, 'bench.db')
+        self.sites: List[FixtureSite] = []
+        self.anthropic: Optional[FakeAnthropic] = None
+        self.crawl_site: Optional[FixtureSite] = None
+        self.model_id: Optional[int] = None
+
+    def start_servers(self):
+        # One site per loopback address, so the scraper's per-host limit doesn't cap concurrency
+        for n in range(self.args.hosts):
+            self.sites.append(FixtureSite(
+                latency=self.args.latency_ms / 1000, page_bytes=self.args.page_kb * 1024,
+                error_rate=self.args.error_rate, host=f'127.0.0.{n + 1}', seed=n,
+                template_rate=self.args.template_rate).start())
+        # Its own port, so crawling it doesn't skew the request counts of the scrape sites
+        self.crawl_site = FixtureSite(
+            latency=self.args.latency_ms / 1000, page_bytes=self.args.page_kb * 1024,
+            error_rate=self.args.error_rate, page_count=self.args.crawl_pages).start()
+        self.anthropic = FakeAnthropic(latency=self.args.llm_latency_ms / 1000,
+                                       throttle_rate=self.args.throttle_rate).start()
+
+    def stop_servers(self):
+        for server in self.sites + [self.anthropic, self.crawl_site]:
+            if server is not None:
+                server.stop()
+
+    def configure_environment(self):
+        # Read at import time by app and its modules, so this must run before importing them
+        os.environ.update({
+            'DATABASE_URL': self.args.database_url or f'sqlite:///{self.db_path}',
+            'CSV_UPLOAD_DIR': os.path.join(self.workdir, 'uploads'),
+            'JOB_RUNNER': 'off',
+            'GOOGLE_CLOUD_PROJECT': PROJECT_ID,
+            'FIREBASE_AUTH_EMULATOR_HOST': '127.0.0.1:9099',
+            'ANTHROPIC_BASE_URL': self.anthropic.base_url,
+            'GOOGLE_SEARCH_URL': f'http://127.0.0.1:{self.sites[0].port}/search',
+        })
+
+    def load_app(self):
+        import app as app_module
+        self.app = app_module.app
+        # Lazy SDK imports would otherwise land in whichever scenario touches them first
+        app_module.warm_up()
+        if not self.args.verbose:
+            logging.getLogger().setLevel(logging.WARNING)
+        self.client = app_module.app.test_client()
+        self.headers = {"Authorization": f"Bearer {emulator_token('bench-user', 'bench@example.com')}"}
+        # First request creates the user and warms lazy imports; keep that out of the first scenario
+        self.client.get('/api/models', headers=self.headers)
+
+    def url_for(self, n: int) -> str:
+        site = self.sites[n % len(self.sites)]
+        return f"http://127.0.0.{self.sites.index(site) + 1}:{site.port}/page/{n}"
+
+    def post(self, path: str, **kwargs):
+        response = self.client.post(path, headers=self.headers, **kwargs)
+        if response.status_code >= 400:
+            raise RuntimeError(f"POST {path} returned {response.status_code}: {response.get_data(as_text=True)}")
+        return response
+
+    def stream(self, path: str, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return sse_events(self.post(path, json={**payload, "stream": True}))
+
+    def item_result(self, events: List[Dict[str, Any]], measurement: Measurement) -> Dict[str, Any]:
+        items = [e for e in events if e.get('event') == 'item']
+        latencies = [e['elapsed_ms'] for e in items if e.get('elapsed_ms') is not None]
+        summary = next((e for e in events if e.get('event') == 'summary'), {})
+        return {
+            **measurement.result,
+            "items": len(items),
+            "errors": sum(1 for e in items if e.get('status') == 'error'),
+            "items_per_sec": round(len(items) / measurement.seconds, 2) if measurement.seconds else None,
+            "p50_ms": percentile(latencies, 50),
+            "p99_ms": percentile(latencies, 99),
+            "summary": {k: v for k, v in summary.items() if k not in ('event', 'message')},
+        }
+
+    def request_result(self, latencies: List[float], measurement: Measurement) -> Dict[str, Any]:
+        return {
+            **measurement.result,
+            "requests": len(latencies),
+            "requests_per_sec": round(len(latencies) / measurement.seconds, 2) if measurement.seconds else None,
+            "p50_ms": percentile(latencies, 50),
+            "p99_ms": percentile(latencies, 99),
+        }
+
+    def timed_requests(self, count: int, send: Callable[[], Any]) -> List[float]:
+        latencies = []
+        for _ in range(count):
+            started = time.perf_counter()
+            send()
+            latencies.append((time.perf_counter() - started) * 1000)
+        return latencies
+
+    def ensure_model(self):
+        if self.model_id is None:
+            self.bench_csv_ingest()
+
+    # Scenarios
+
+    def bench_csv_ingest(self) -> Dict[str, Any]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['url', 'category'])
+        for n in range(self.args.pages):
+            writer.writerow([self.url_for(n), f'category-{n % 7}'])
+        body = buffer.getvalue().encode()
+
+        with Measurement(self.db_path) as m:
+            upload = self.post('/api/csvs', data={'file': (io.BytesIO(body), 'bench.csv')},
+                               content_type='multipart/form-data').get_json()
+            created = self.post('/api/models', json={
+                'csv_id': upload['id'], 'url_column': 'url', 'model_name': 'bench'}).get_json()
+        self.model_id = created['id']
+        return {**m.result, "rows": self.args.pages, "csv_bytes": len(body),
+                "rows_per_sec": round(self.args.pages / m.seconds, 2), "url_count": created['url_count']}
+
+    def bench_scrape(self, rescrape: bool = False) -> Dict[str, Any]:
+        self.ensure_model()
+        with Measurement(self.db_path) as m:
+            events = self.stream(f'/api/models/{self.model_id}/scrape', {
+                'limit': self.args.pages, 'delay': 0, 'concurrency': self.args.concurrency,
+                'rescrape': rescrape})
+        result = self.item_result(events, m)
+        result["pages_per_sec"] = result.pop("items_per_sec")
+        return result
+
+    def bench_rescrape(self) -> Dict[str, Any]:
+        # Conditional GETs against pages that haven't changed since the previous scrape
+        return self.bench_scrape(rescrape=True)
+
+    def llm_params(self) -> Dict[str, Any]:
+        return {'apiKey': API_KEY, 'concurrency': self.args.llm_concurrency,
+                'requestsPerMinute': 100000, 'tokensPerMinute': 100000000}
+
+    def bench_generate(self) -> Dict[str, Any]:
+        self.ensure_model()
+        with Measurement(self.db_path) as m:
+            events = self.stream(f'/api/models/{self.model_id}/generate-alt-content', {
+                **self.llm_params(), 'prompt': 'Rewrite this page for clarity.',
+                'rateLimit': self.args.llm_items, 'maxTokens': 512, 'useCache': False,
+                'dedupe': self.args.dedupe})
+        return self.item_result(events, m)
+
+    def bench_rate(self) -> Dict[str, Any]:
+        self.ensure_model()
+        with Measurement(self.db_path) as m:
+            events = self.stream(f'/api/models/{self.model_id}/rate-content', {
+                **self.llm_params(), 'contentType': 'text_content', 'ratingMethod': 'claude',
+                'incremental': False, 'dedupe': self.args.dedupe})
+        return self.item_result(events, m)
+
+    def bench_model_get(self) -> Dict[str, Any]:
+        self.ensure_model()
+        path = f'/api/models/{self.model_id}'
+        repeats = self.args.repeats
+        results = {}
+
+        with Measurement(self.db_path) as m:
+            latencies = self.timed_requests(repeats, lambda: self.client.get(path, headers=self.headers))
+        results["full"] = self.request_result(latencies, m)
+
+        with Measurement(self.db_path) as m:
+            latencies = self.timed_requests(repeats, lambda: self.client.get(
+                path, headers=self.headers, query_string={'limit': 100, 'fields': 'url,rating'}))
+        results["page"] = self.request_result(latencies, m)
+
+        etag = self.client.get(path, headers=self.headers).headers.get('ETag')
+        with Measurement(self.db_path) as m:
+            latencies = self.timed_requests(repeats, lambda: self.client.get(
+                path, headers={**self.headers, 'If-None-Match': etag}))
+        results["not_modified"] = self.request_result(latencies, m)
+        return results
+
+    def bench_rank_check(self) -> Dict[str, Any]:
+        self.ensure_model()
+        path = f'/api/models/{self.model_id}/test'
+        payload = {'query': 'fixture query', 'testMethod': 'google', 'maxReturn': 10,
+                   'maxHighlightSearch': 100, 'highlightedUrl': self.url_for(3)}
+        results = {}
+
+        with Measurement(self.db_path) as m:
+            latencies = self.timed_requests(self.args.repeats, lambda: self.post(
+                path, json={**payload, 'refresh': True}))
+        results["fetched"] = self.request_result(latencies, m)
+
+        with Measurement(self.db_path) as m:
+            latencies = self.timed_requests(self.args.repeats, lambda: self.post(path, json=payload))
+        results["cached"] = self.request_result(latencies, m)
+        return results
+
+    def bench_concurrent_writes(self) -> Dict[str, Any]:
+        # Separate processes, like gunicorn workers, so they contend on the database and not the GIL
+        self.ensure_model()
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        writers, writes = self.args.writers, self.args.writes
+        with Measurement(self.db_path) as m:
+            processes = [context.Process(target=write_worker, args=(self.model_id, n, writers, writes, results))
+                         for n in range(writers)]
+            for process in processes:
+                process.start()
+            outcomes = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+        latencies = [latency for outcome in outcomes for latency in outcome["latencies"]]
+        errors = sum(outcome["errors"] for outcome in outcomes)
+        return {
+            **m.result,
+            "writers": writers,
+            "commits": len(latencies) - errors,
+            "errors": errors,
+            "commits_per_sec": round((len(latencies) - errors) / m.seconds, 2),
+            "p50_ms": percentile(latencies, 50),
+            "p99_ms": percentile(latencies, 99),
+        }
+
+    def bench_crawl(self) -> Dict[str, Any]:
+        # The one-call onboarding path: create the model with crawl, then run its job here
+        # (JOB_RUNNER is off) rather than waiting on a background thread
+        import jobs
+        created = self.post('/api/models', json={
+            'model_name': 'crawl', 'base_url': f'http://127.0.0.1:{self.crawl_site.port}/',
+            'crawl': {'maxUrls': self.args.crawl_pages, 'maxDepth': 20, 'concurrency': self.args.concurrency,
+                      'delay': 0}}).get_json()
+        requests_before = self.crawl_site.requests
+        with Measurement(self.db_path) as m:
+            with self.app.app_context():
+                jobs.run_job(created['job_id'])
+        job = self.client.get(f"/api/jobs/{created['job_id']}", headers=self.headers).get_json()
+        summary = {k: v for k, v in (job['result'] or {}).items() if k not in ('messages', 'message')}
+        return {
+            **m.result,
+            "status": job['status'],
+            "pages": summary.get('added_count', 0),
+            "pages_per_sec": round(summary.get('added_count', 0) / m.seconds, 2) if m.seconds else None,
+            "site_requests": self.crawl_site.requests - requests_before,
+            "private_requests": self.crawl_site.private_hits,
+            "summary": summary,
+        }
+
+    def run(self, scenarios: List[str]) -> Dict[str, Any]:
+        results = {}
+        for name in scenarios:
+            print(f"Running {name}", file=sys.stderr)
+            results[name] = getattr(self, f'bench_{name}')()
+        return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description="Offline benchmarks against local stand-ins; prints a JSON report.")
+    parser.add_argument('--pages', type=int, default=200, help="URLs in the benchmark model")
+    parser.add_argument('--hosts', type=int, default=4, help="fixture sites, one per loopback address")
+    parser.add_argument('--latency-ms', type=float, default=20, help="fixture page latency")
+    parser.add_argument('--page-kb', type=int, default=20, help="fixture page size")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of fixture pages that return 500")
+    parser.add_argument('--template-rate', type=float, default=0.0,
+                        help="share of fixture pages that are near-duplicates of a shared template")
+    parser.add_argument('--concurrency', type=int, default=8, help="scrape and crawl concurrency")
+    parser.add_argument('--crawl-pages', type=int, default=200,
+                        help="pages on the crawl fixture site, half of them in its sitemap")
+    parser.add_argument('--llm-latency-ms', type=float, default=100, help="fake Anthropic latency")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="share of LLM calls answered with 429")
+    parser.add_argument('--llm-concurrency', type=int, default=4)
+    parser.add_argument('--llm-items', type=int, default=50, help="items sent through generate")
+    parser.add_argument('--dedupe', choices=('off', 'fanout', 'flag'), default='off',
+                        help="near-duplicate handling in generate and rate")
+    parser.add_argument('--repeats', type=int, default=20, help="requests per read-only scenario")
+    parser.add_argument('--writers', type=int, default=3, help="processes in concurrent_writes")
+    parser.add_argument('--writes', type=int, default=200, help="commits per concurrent_writes process")
+    parser.add_argument('--database-url', help="benchmark a server database instead of a temporary SQLite file")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"comma-separated, run in order; any of {', '.join(SCENARIOS)}")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--verbose', action='store_true', help="keep the app's INFO logging")
+    args = parser.parse_args(argv)
+
+    args.scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix='ai-seo-bench-')
+    bench = Bench(args, workdir)
+    bench.start_servers()
+    try:
+        bench.configure_environment()
+        bench.load_app()
+        results = bench.run(args.scenarios)
+    finally:
+        bench.stop_servers()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            # Peak RSS only ever grows, so later scenarios report the high-water mark so far
+            "scenario_order": args.scenarios,
+        },
+        "config": {k: v for k, v in vars(args).items() if k not in ('output', 'scenarios', 'verbose')},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return report
@@ -0,0 +1,226 @@
+# Local stand-ins for the outside world: an HTML site with tunable latency, page size and error
+# rate, and a fake Anthropic Messages endpoint. Both run on loopback threads inside the benchmark.
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Sequence
+
+WORDS = ("search engine optimisation content ranking page title heading description crawler "
+         "index keyword audience product guide review price shipping customer support article").split()
+
+
+class _Server:
+    handler = None
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(self.handler):
+            owner = server
+
+        return Handler
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    owner = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[dict] = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+SITEMAP_CHUNK = 1000
+
+
+def build_page(n: int, size_bytes: int, template: Optional[int] = None, links: Sequence[str] = ()) -> bytes:
+    # Pages on the same template share their body and differ only in title and heading
+    rng = random.Random(n if template is None else f'template-{template}')
+    paragraphs = []
+    length = 0
+    while length < size_bytes:
+        text = ' '.join(rng.choice(WORDS) for _ in range(60))
+        paragraphs.append(f"<p>{text}</p>")
+        length += len(text) + 7
+    nav = ''.join(f'<a href="{href}">{href}</a>' for href in links)
+    return (
+        f"<html><head><title>Fixture page {n}</title>"
+        f"<meta name=\"description\" content=\"Description of page {n}\"></head><body>"
+        f"<nav><a href=\"/\">Home</a>{nav}</nav><main><h1>Page {n}</h1>{''.join(paragraphs)}</main>"
+        f"<footer>Footer</footer></body></html>"
+    ).encode()
+
+
+def build_serp(depth: int, port: int) -> bytes:
+    results = ''.join(
+        f'<div class="g"><div class="yuRUbf"><a href="http://127.0.0.1:{port}/page/{n}">'
+        f'<h3>Fixture page {n}</h3></a></div></div>' for n in range(depth))
+    return f"<html><body>{results}</body></html>".encode()
+
+
+class _SiteHandler(_QuietHandler):
+    def do_GET(self):
+        site = self.owner
+        site.count()
+        time.sleep(site.latency)
+        if self.path.startswith('/search'):
+            # Google-shaped result page for the rank-check endpoint
+            return self._send(200, build_serp(100, site.port), 'text/html; charset=utf-8')
+        if self.path == '/robots.txt' and site.page_count:
+            return self._send(200, site.robots(self.headers.get('Host')).encode(), 'text/plain')
+        if self.path.startswith('/sitemap') and site.page_count:
+            sitemap = site.sitemap(self.path, self.headers.get('Host'))
+            if sitemap is None:
+                return self._send(404, b"no such sitemap", 'text/plain')
+            return self._send(200, sitemap.encode(), 'application/xml')
+        if self.path.startswith('/private/'):
+            site.private_hits += 1
+        if site.rng_error():
+            return self._send(500, b"fixture error", 'text/plain')
+        try:
+            n = int(self.path.rstrip('/').rsplit('/', 1)[-1])
+        except ValueError:
+            n = 0
+        etag = f'"page-{n}"'
+        if self.headers.get('If-None-Match') == etag:
+            return self._send(304, b'', 'text/html', {'ETag': etag})
+        self._send(200, site.page(n), 'text/html; charset=utf-8', {'ETag': etag})
+
+
+class FixtureSite(_Server):
+    """Serves /page/<n> (deterministic HTML of roughly `page_bytes`) and /search, after `latency` seconds.
+
+    A `template_rate` share of pages are near-duplicates built on one of `templates` shared bodies.
+    With `page_count` the site is crawlable: /robots.txt (disallowing /private/) points at a sitemap
+    index listing the first half of the pages, and page n links to pages 2n+1 and 2n+2, a /private/
+    page and an off-site URL."""
+    handler = _SiteHandler
+
+    def __init__(self, latency: float = 0.05, page_bytes: int = 20000, error_rate: float = 0.0,
+                 host: str = '127.0.0.1', port: int = 0, seed: int = 0, template_rate: float = 0.0,
+                 templates: int = 5, page_count: Optional[int] = None):
+        self.latency = latency
+        self.page_bytes = page_bytes
+        self.error_rate = error_rate
+        self.template_rate = template_rate
+        self.templates = templates
+        self.page_count = page_count
+        self.private_hits = 0
+        self._rng = random.Random(seed)
+        self._pages = {}
+        super().__init__(host, port)
+
+    def rng_error(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+    def page(self, n: int) -> bytes:
+        if n not in self._pages:
+            templated = random.Random(f'templated-{n}').random() < self.template_rate
+            links = []
+            if self.page_count:
+                links = [f'/page/{m}' for m in (2 * n + 1, 2 * n + 2) if m < self.page_count]
+                links += [f'/private/{n}', 'http://offsite.invalid/']
+            self._pages[n] = build_page(n, self.page_bytes, n % self.templates if templated else None, links)
+        return self._pages[n]
+
+
+    def robots(self, host: str) -> str:
+        return f"User-agent: *\nDisallow: /private/\n\nSitemap: http://{host}/sitemap.xml\n"
+
+    def sitemap(self, path: str, host: str) -> Optional[str]:
+        listed = self.page_count // 2
+        chunks = (listed + SITEMAP_CHUNK - 1) // SITEMAP_CHUNK
+        ns = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+        if path == '/sitemap.xml':
+            entries = ''.join(f'<sitemap><loc>http://{host}/sitemap-{i}.xml</loc></sitemap>' for i in range(chunks))
+            return f'<?xml version="1.0" encoding="UTF-8"?><sitemapindex {ns}>{entries}</sitemapindex>'
+        try:
+            chunk = int(path[len('/sitemap-'):-len('.xml')])
+        except ValueError:
+            return None
+        if not 0 <= chunk < chunks:
+            return None
+        pages = range(chunk * SITEMAP_CHUNK, min(listed, (chunk + 1) * SITEMAP_CHUNK))
+        entries = ''.join(f'<url><loc>http://{host}/page/{n}</loc></url>' for n in pages)
+        return f'<?xml version="1.0" encoding="UTF-8"?><urlset {ns}>{entries}</urlset>'
+
+
+class _AnthropicHandler(_QuietHandler):
+    def do_POST(self):
+        fake = self.owner
+        fake.count()
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        time.sleep(fake.latency)
+        if fake.rng_throttle():
+            return self._send(429, json.dumps({
+                "type": "error", "error": {"type": "rate_limit_error", "message": "fixture throttle"}}).encode(),
+                'application/json', {'retry-after': '0.1'})
+
+        prompt = body['messages'][0]['content']
+        input_tokens = max(1, len(prompt) // 4)
+        text = f"Rewritten: {prompt[-200:]}\n\nRating #{70 + input_tokens % 30}#"
+        output_tokens = min(body.get('max_tokens', 1024), max(1, len(text) // 4))
+        self._send(200, json.dumps({
+            "id": f"msg_fixture_{fake.requests}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get('model', 'fixture'),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+        }).encode(), 'application/json')
+
+
+class FakeAnthropic(_Server):
+    """Answers POST /v1/messages like the Messages API; point ANTHROPIC_BASE_URL at it."""
+    handler = _AnthropicHandler
+
+    def __init__(self, latency: float = 0.2, throttle_rate: float = 0.0,
+                 host: str = '127.0.0.1', port: int = 0, seed: int = 0):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self._rng = random.Random(seed)
+        super().__init__(host, port)
+
+    def rng_throttle(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.throttle_rate
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
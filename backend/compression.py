@@ -0,0 +1,163 @@
+# Large text fields of a model_url row are stored zlib-compressed in its `packed` LargeBinary column;
+# `data` keeps {"$zlib": [offset, length], "n": <chars>} in their place and a field is only inflated
+# when it is read. Rows written before `packed` existed hold {"$zlib": <base64>, "n": <chars>} inline.
+import base64
+import json
+import os
+import time
+import zlib
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from sqlalchemy.types import JSON, TypeDecorator
+
+import metrics
+
+COMPRESSION_ENABLED = os.environ.get('TEXT_COMPRESSION', 'on') != 'off'
+COMPRESS_MIN_CHARS = int(os.environ.get('TEXT_COMPRESSION_MIN_CHARS', 512))
+ZLIB_LEVEL = 6
+MARKER = '$zlib'
+# Small or lookup-critical fields stay readable in the raw JSON
+UNCOMPRESSED_FIELDS = {'url', 'scraped_at', 'etag', 'last_modified', 'content_hash'}
+
+
+class Compressed(NamedTuple):
+    """A field's zlib stream, carried as-is until something reads the field."""
+    payload: bytes
+    chars: int
+
+
+def is_compressed(value: Any) -> bool:
+    return isinstance(value, Compressed)
+
+
+def _is_marker(value: Any) -> bool:
+    return isinstance(value, dict) and MARKER in value
+
+
+def compress_value(key: str, value: Any) -> Any:
+    if (not COMPRESSION_ENABLED or not isinstance(value, str) or len(value) < COMPRESS_MIN_CHARS
+            or key in UNCOMPRESSED_FIELDS):
+        return value
+    payload = zlib.compress(value.encode('utf-8'), ZLIB_LEVEL)
+    if len(payload) >= len(value):
+        return value
+    return Compressed(payload, len(value))
+
+
+def decompress_value(value: Any) -> Any:
+    if not is_compressed(value):
+        return value
+    return zlib.decompress(value.payload).decode('utf-8')
+
+
+class LazyItem(dict):
+    """Item dict that inflates compressed fields on first access.
+
+    Overriding __iter__ keeps CPython from copying the raw storage in dict(item) or {**item},
+    so copies see plain text too. Use raw_item() to copy without inflating anything."""
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if is_compressed(value):
+            value = decompress_value(value)
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __iter__(self):
+        return dict.__iter__(self)
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def attach(self, packed: Optional[bytes]):
+        # Markers only hold offsets into the row's `packed` column, which the column type never sees
+        for key, value in dict.items(self):
+            if _is_marker(value) and isinstance(value[MARKER], list):
+                start, length = value[MARKER]
+                dict.__setitem__(self, key, Compressed(bytes(packed[start:start + length]), value['n']))
+
+
+def raw_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    # dict.items() on the base class reads storage directly, leaving compressed fields alone
+    return dict(dict.items(item))
+
+
+def pack(item: Dict[str, Any]) -> Tuple[LazyItem, Optional[bytes]]:
+    """An item's `data` and `packed` column values; already-compressed fields are reused, not redone."""
+    fields = LazyItem((key, compress_value(key, value)) for key, value in dict.items(item))
+    payloads = [value.payload for value in dict.values(fields) if is_compressed(value)]
+    return fields, b''.join(payloads) if payloads else None
+
+
+def _markers(item: Dict[str, Any]) -> Dict[str, Any]:
+    # Offsets follow pack()'s field order; they're stored explicitly because MySQL's JSON type reorders keys
+    stored = {}
+    offset = 0
+    for key, value in dict.items(item):
+        if is_compressed(value):
+            stored[key] = {MARKER: [offset, len(value.payload)], "n": value.chars}
+            offset += len(value.payload)
+        else:
+            stored[key] = value
+    return stored
+
+
+class CompressedJSON(TypeDecorator):
+    impl = JSON
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, dict):
+            return _markers(value)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if not isinstance(value, dict):
+            return value
+        item = LazyItem(value)
+        for key, field in value.items():
+            if _is_marker(field) and isinstance(field[MARKER], str):
+                dict.__setitem__(item, key, Compressed(base64.b64decode(field[MARKER]), field['n']))
+        return item
+
+    # Timed around the JSON (de)serialization too, not just the compression step
+    def bind_processor(self, dialect):
+        return _timed(super().bind_processor(dialect), 'encode')
+
+    def result_processor(self, dialect, coltype):
+        return _timed(super().result_processor(dialect, coltype), 'decode')
+
+
+def _timed(process, direction: str):
+    if process is None:
+        return None
+    histogram = metrics.ITEM_CODEC_SECONDS.labels(direction)
+
+    def timed(value):
+        started = time.perf_counter()
+        try:
+            return process(value)
+        finally:
+            histogram.observe(time.perf_counter() - started)
+
+    return timed
+
+
+def stored_sizes(item: Dict[str, Any], packed: Optional[bytes]) -> Dict[str, int]:
+    """Bytes a raw item takes as stored (`data` plus `packed`) and as it would uncompressed, without inflating it."""
+    stored_item = _markers(item)
+    stored = len(json.dumps(stored_item)) + len(packed or b'')
+    expanded = stored
+    compressed_fields = 0
+    for key, value in dict.items(item):
+        if is_compressed(value):
+            compressed_fields += 1
+            # Approximates the inflated length: marker JSON and payload out, original characters in
+            expanded += value.chars - len(json.dumps(stored_item[key])) - len(value.payload)
+    return {"stored": stored, "raw": expanded, "compressed_fields": compressed_fields}
@@ -0,0 +1,280 @@
+# Discovers a site's pages from its base URL: robots.txt, then sitemap.xml (and any sitemap
+# indexes), then same-site links breadth-first. Pages are fetched through Scraper, so a crawl gets
+# the same pooling, throttling and extraction as a scrape.
+import gzip
+import hashlib
+import logging
+import math
+import os
+import tempfile
+import xml.etree.ElementTree as ElementTree
+from collections import deque
+from itertools import chain
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+from urllib.robotparser import RobotFileParser
+
+import requests
+import urllib3
+
+from csv_processor import canonicalize_url
+from scraper import REQUEST_TIMEOUT, Scraper
+
+logger = logging.getLogger(__name__)
+
+# Token matched against robots.txt user-agent groups; sites without a group for it fall back to '*'
+USER_AGENT = os.environ.get('CRAWLER_USER_AGENT', 'ai-seo-crawler')
+DEFAULT_MAX_URLS = 500
+MAX_URLS = int(os.environ.get('CRAWL_MAX_URLS', 50000))
+DEFAULT_MAX_DEPTH = 3
+# Sitemap files read per crawl, counting the indexes themselves
+MAX_SITEMAPS = 200
+# The sitemaps protocol's limit per file, uncompressed; larger sitemaps spill from memory to disk
+MAX_SITEMAP_BYTES = 50 * 1024 * 1024
+SITEMAP_SPOOL_BYTES = 1024 * 1024
+SITEMAP_CHUNK_BYTES = 64 * 1024
+# Seen-URL filter size per URL the crawl may scrape; links outnumber pages on most sites
+SEEN_PER_URL = 20
+SEEN_ERROR_RATE = 0.001
+
+SKIPPED_EXTENSIONS = {
+    '.7z', '.avi', '.bmp', '.css', '.csv', '.doc', '.docx', '.exe', '.gif', '.gz', '.ico', '.jpeg',
+    '.jpg', '.js', '.json', '.mov', '.mp3', '.mp4', '.pdf', '.png', '.ppt', '.pptx', '.rar', '.rss',
+    '.svg', '.tar', '.tgz', '.txt', '.wav', '.webm', '.webp', '.woff', '.woff2', '.xls', '.xlsx',
+    '.xml', '.zip',
+}
+
+
+class BloomFilter:
+    """Fixed-size set membership with no false negatives; false positives stay near error_rate up to capacity."""
+
+    def __init__(self, capacity: int, error_rate: float = SEEN_ERROR_RATE):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value: str) -> Iterator[int]:
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        a = int.from_bytes(digest[:8], 'little')
+        b = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes):
+            yield (a + i * b) % self.size
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(value))
+
+    def add(self, value: str) -> bool:
+        """Add value; True if it was not (as far as the filter can tell) already present."""
+        added = False
+        for p in self._positions(value):
+            if not self.bits[p >> 3] & (1 << (p & 7)):
+                self.bits[p >> 3] |= 1 << (p & 7)
+                added = True
+        self.count += added
+        return added
+
+
+def _site_host(url: str) -> str:
+    host = (urlsplit(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def normalize_base_url(base_url: str) -> str:
+    # Raises ValueError like canonicalize_url
+    if base_url is not None and not isinstance(base_url, str):
+        raise ValueError(f"URL must be a string, not {type(base_url).__name__}")
+    base_url = (base_url or '').strip()
+    if base_url and not urlsplit(base_url).scheme:
+        base_url = f"https://{base_url.lstrip('/')}"
+    return canonicalize_url(base_url) if base_url else ''
+
+
+class Crawler:
+    """Breadth-first crawl of one site, yielding (url, depth, source, scrape result) as pages are fetched."""
+
+    def __init__(self, base_url: str, max_urls: int = DEFAULT_MAX_URLS, max_depth: int = DEFAULT_MAX_DEPTH,
+                 use_sitemaps: bool = True, follow_links: bool = True, respect_robots: bool = True,
+                 scraper: Optional[Scraper] = None):
+        self.base_url = normalize_base_url(base_url)
+        self.host = _site_host(self.base_url)
+        self.max_urls = max(0, min(max_urls, MAX_URLS))
+        self.max_depth = max_depth
+        self.use_sitemaps = use_sitemaps
+        self.follow_links = follow_links
+        self.respect_robots = respect_robots
+        self.scraper = scraper or Scraper(collect_links=follow_links)
+        self.seen = BloomFilter(self.max_urls * SEEN_PER_URL)
+        self.robots: Optional[RobotFileParser] = None
+        self.scheduled = 0
+        self.stats = {"sitemaps": 0, "sitemap_urls": 0, "links": 0, "robots_blocked": 0, "off_site": 0}
+
+    def mark_seen(self, urls: Iterable[str]):
+        """URLs already in the model: never scheduled again."""
+        for url in urls:
+            if url:
+                self.seen.add(url)
+
+    def load_robots(self) -> Optional[float]:
+        """Fetch robots.txt; returns its crawl delay for us, if any. A missing file allows everything."""
+        robots_url = urljoin(self.base_url, '/robots.txt')
+        parser = RobotFileParser(robots_url)
+        try:
+            response = self.scraper.session.get(robots_url, timeout=REQUEST_TIMEOUT)
+            if response.status_code in (401, 403):
+                parser.disallow_all = True
+            elif response.status_code < 400:
+                parser.parse(response.text.splitlines())
+            else:
+                parser.allow_all = True
+        except requests.RequestException as e:
+            logger.warning(f"Could not fetch {robots_url}: {str(e)}")
+            parser.allow_all = True
+        self.robots = parser
+        delay = parser.crawl_delay(USER_AGENT)
+        return float(delay) if delay is not None else None
+
+    def allowed(self, url: str) -> bool:
+        if not self.respect_robots or self.robots is None:
+            return True
+        if self.robots.can_fetch(USER_AGENT, url):
+            return True
+        self.stats["robots_blocked"] += 1
+        return False
+
+    def _candidate(self, url: str) -> Optional[str]:
+        """Canonical form of url if it is a same-site HTML page not seen before, else None."""
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            return None
+        if _site_host(url) != self.host:
+            self.stats["off_site"] += 1
+            return None
+        if os.path.splitext(parts.path)[1].lower() in SKIPPED_EXTENSIONS:
+            return None
+        url = canonicalize_url(url)
+        if url in self.seen or not self.allowed(url):
+            return None
+        self.seen.add(url)
+        return url
+
+    def sitemap_urls(self) -> Iterator[str]:
+        """Page URLs from the sitemaps robots.txt names (or /sitemap.xml), following sitemap indexes."""
+        declared = (self.robots.site_maps() if self.robots is not None else None) or []
+        queue = deque(declared or [urljoin(self.base_url, '/sitemap.xml')])
+        fetched = set()
+        while queue and len(fetched) < MAX_SITEMAPS:
+            sitemap_url = queue.popleft()
+            if sitemap_url in fetched:
+                continue
+            fetched.add(sitemap_url)
+            self.stats["sitemaps"] += 1
+            try:
+                for kind, loc in self._read_sitemap(sitemap_url):
+                    if kind == 'sitemap':
+                        queue.append(loc)
+                    else:
+                        self.stats["sitemap_urls"] += 1
+                        yield loc
+            except (requests.RequestException, urllib3.exceptions.HTTPError, ElementTree.ParseError,
+                    OSError, EOFError) as e:
+                logger.warning(f"Could not read sitemap {sitemap_url}: {str(e)}")
+
+    def _download_sitemap(self, sitemap_url: str) -> Optional[Tuple[tempfile.SpooledTemporaryFile, bool]]:
+        # Read whole before parsing: read lazily, the connection would sit idle while pages are
+        # scraped and the server would time it out partway through
+        with self.scraper.session.stream(sitemap_url, timeout=REQUEST_TIMEOUT) as response:
+            if response.status_code >= 400:
+                logger.info(f"No sitemap at {sitemap_url} ({response.status_code})")
+                return None
+            spool = tempfile.SpooledTemporaryFile(max_size=SITEMAP_SPOOL_BYTES)
+            try:
+                # read1 hands over whatever has arrived, so a body cut short keeps everything before the cut
+                while chunk := response.raw.read1(SITEMAP_CHUNK_BYTES, decode_content=True):
+                    spool.write(chunk)
+                    if spool.tell() >= MAX_SITEMAP_BYTES:
+                        logger.warning(f"Sitemap {sitemap_url} is over {MAX_SITEMAP_BYTES} bytes; reading the start")
+                        break
+            except (requests.RequestException, urllib3.exceptions.HTTPError) as e:
+                # Parsing stops with an error where the body was cut off, after the entries before it
+                logger.warning(f"Sitemap {sitemap_url} cut off after {spool.tell()} bytes: {str(e)}")
+            gzipped = sitemap_url.endswith('.gz') or response.headers.get('Content-Type', '').startswith(
+                ('application/gzip', 'application/x-gzip'))
+        spool.seek(0)
+        return spool, gzipped
+
+    def _read_sitemap(self, sitemap_url: str) -> Iterator[Tuple[str, str]]:
+        downloaded = self._download_sitemap(sitemap_url)
+        if downloaded is None:
+            return
+        spool, gzipped = downloaded
+        with spool:
+            source = gzip.GzipFile(fileobj=spool, mode='rb') if gzipped else spool
+            # Parsed incrementally, each <url> dropped once read, so a 50k-URL sitemap never sits in memory
+            parents = []
+            for event, el in ElementTree.iterparse(source, events=('start', 'end')):
+                tag = el.tag.rsplit('}', 1)[-1]
+                if event == 'start':
+                    parents.append(tag)
+                    continue
+                parents.pop()
+                if tag == 'loc' and el.text and parents:
+                    yield ('sitemap' if parents[-1] == 'sitemap' else 'page'), el.text.strip()
+                elif tag in ('url', 'sitemap'):
+                    el.clear()
+
+    def _schedule(self, urls: Iterable[Tuple[str, str]], targets: deque,
+                  filtered: bool = False) -> Iterator[Tuple[str, None]]:
+        # Lazy, so sitemap entries are only read as fast as the scrapes consume them
+        for url, source in urls:
+            if self.scheduled >= self.max_urls:
+                return
+            if not filtered:
+                url = self._candidate(url)
+            if url is not None:
+                self.scheduled += 1
+                targets.append((url, source))
+                yield url, None
+
+    def crawl(self, concurrency: int = 4, delay: float = 0.0) -> Iterator[Tuple[str, int, str, Dict[str, Any]]]:
+        if self.respect_robots:
+            crawl_delay = self.load_robots()
+            if crawl_delay is not None:
+                delay = max(delay, crawl_delay)
+
+        # Depth 0 is the base URL and every sitemap entry; each later depth is the new links of the one before
+        level: Iterable[Tuple[str, str]] = [(self.base_url, 'base')]
+        if self.use_sitemaps:
+            level = chain(level, ((url, 'sitemap') for url in self.sitemap_urls()))
+        filtered = False
+        for depth in range(self.max_depth + 1):
+            follow = self.follow_links and depth < self.max_depth
+            next_level: List[Tuple[str, str]] = []
+            targets = deque()
+            # One site, so per-host concurrency is the crawl's concurrency
+            results = self.scraper.scrape_many(self._schedule(level, targets, filtered), concurrency=concurrency,
+                                               delay=delay, per_host=concurrency)
+            try:
+                # Results come back in scheduling order
+                for result in results:
+                    url, source = targets.popleft()
+                    links = result.pop('links', None) or []
+                    if follow:
+                        self.stats["links"] += len(links)
+                        for link in links:
+                            if len(next_level) >= self.max_urls - self.scheduled:
+                                break
+                            # Marked seen on first sight, so each page is queued at its shallowest depth
+                            link = self._candidate(link)
+                            if link is not None:
+                                next_level.append((link, 'link'))
+                    yield url, depth, source, result
+            finally:
+                results.close()
+
+            if not next_level or self.scheduled >= self.max_urls:
+                return
+            # Already canonical and marked seen; _schedule only applies the URL cap
+            level, filtered = next_level, True
@@ -1,26 +1,185 @@
 import csv
+import hashlib
+import io
 import os
-from urllib.parse import urljoin
-from typing import List, Dict
+import uuid
+from collections import Counter
+from itertools import islice
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+from typing import Any, List, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+# Query parameters that only identify the click, never the page
+TRACKING_PARAMS = {'gclid', 'dclid', 'fbclid', 'msclkid', 'yclid', 'mc_cid', 'mc_eid', '_ga', '_gl', 'igshid'}
+TRACKING_PREFIXES = ('utm_',)
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def canonicalize_url(url: str, base_url: str = "") -> str:
+    """Normalize a URL so trivially different spellings of one page compare equal.
+
+    Raises ValueError for anything that isn't a string or won't parse, such as a non-numeric port."""
+    for value in (url, base_url):
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"URL must be a string, not {type(value).__name__}")
+    url = (url or '').strip()
+    if base_url and urlsplit(base_url).scheme:
+        url = urljoin(base_url, url)
+    elif base_url and not urlsplit(url).scheme:
+        # Scheme-less bases like "example.com" are left for the scraper's resolver to expand
+        url = f"{base_url.rstrip('/')}/{url.lstrip('/')}"
+    parts = urlsplit(url)
+
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc
+    if parts.hostname:
+        host = parts.hostname.lower()
+        if ':' in host:
+            host = f"[{host}]"
+        port = parts.port if parts.port and parts.port != DEFAULT_PORTS.get(scheme) else None
+        netloc = f"{host}:{port}" if port else host
+        if parts.username:
+            netloc = f"{parts.username}{':' + parts.password if parts.password else ''}@{netloc}"
+
+    path = parts.path
+    if netloc and not path:
+        path = '/'
+    elif len(path) > 1 and path.endswith('/'):
+        path = path.rstrip('/') or '/'
+
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in TRACKING_PARAMS and not k.lower().startswith(TRACKING_PREFIXES)))
+    # Fragments never reach the server
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+def rows_to_items(rows: Iterable[Dict[str, str]], url_column: str,
+                  stats: Counter) -> Iterator[Dict[str, Any]]:
+    for row in rows:
+        stats['rows_read'] += 1
+        url = row.get(url_column)
+        if not url or not url.strip():
+            stats['empty'] += 1
+            continue
+        yield {"url": url, "additional_data": {k: v for k, v in row.items() if k != url_column}}
+
+
+def canonicalize_items(items: Iterable[Dict[str, Any]], base_url: str,
+                       stats: Counter) -> Iterator[Dict[str, Any]]:
+    for item in items:
+        try:
+            canonical = canonicalize_url(item['url'], base_url)
+        except ValueError:
+            stats['invalid'] += 1
+            continue
+        if canonical != item['url']:
+            stats['canonicalized'] += 1
+        yield {**item, "url": canonical}
+
+
+def dedupe_items(items: Iterable[Dict[str, Any]], stats: Counter,
+                 seen: Optional[Set[bytes]] = None) -> Iterator[Dict[str, Any]]:
+    # 16-byte digests keep the seen-set small even for millions of URLs
+    seen = set() if seen is None else seen
+    for item in items:
+        digest = hashlib.blake2b(item['url'].encode('utf-8'), digest_size=16).digest()
+        if digest in seen:
+            stats['duplicate'] += 1
+            continue
+        seen.add(digest)
+        yield item
+
+
+def ingest_rows(rows: Iterable[Dict[str, str]], url_column: str, base_url: str = "",
+                stats: Optional[Counter] = None) -> Iterator[Dict[str, Any]]:
+    """CSV rows -> canonical, de-duplicated model items, one at a time."""
+    stats = Counter() if stats is None else stats
+    return dedupe_items(canonicalize_items(rows_to_items(rows, url_column, stats), base_url, stats), stats)
+
+
+def dropped_counts(stats: Counter) -> Dict[str, int]:
+    return {key: stats[key] for key in ('empty', 'invalid', 'duplicate')}
+
 
 def process_csv(file_path: str, url_column: str, base_url: str = "") -> List[Dict]:
-    processed_data = []
-    
-    with open(file_path, 'r', newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        
-        if url_column not in reader.fieldnames:
-            raise ValueError(f"URL column '{url_column}' not found in CSV")
-        
-        for row in reader:
-            url = row[url_column]
-            if base_url:
-                url = urljoin(base_url, url)
-            
-            processed_row = {
-                "url": url,
-                "additional_data": {k: v for k, v in row.items() if k != url_column}
-            }
-            processed_data.append(processed_row)
-    
-    return processed_data
\ No newline at end of file
+    delimiter, columns = sniff_csv(file_path)
+    if url_column not in columns:
+        raise ValueError(f"URL column '{url_column}' not found in CSV")
+
+    return list(ingest_rows(iter_csv_rows(file_path, delimiter), url_column, base_url))
+
+
+# Streaming helpers for uploaded CSVs kept on disk; nothing here reads a whole file into memory
+SNIFF_BYTES = 64 * 1024
+DEFAULT_DELIMITER = ','
+CSV_DELIMITERS = ',;\t|'
+
+
+def _open(file_path: str):
+    # utf-8-sig drops the BOM spreadsheet exports like to prepend
+    return open(file_path, 'r', newline='', encoding='utf-8-sig', errors='replace')
+
+
+def sniff_csv(file_path: str) -> Tuple[str, List[str]]:
+    """Detect the delimiter and header from the first block of the file."""
+    with _open(file_path) as f:
+        sample = f.read(SNIFF_BYTES)
+    # Don't hand the sniffer a partial last line
+    if len(sample) == SNIFF_BYTES and '\n' in sample:
+        sample = sample[:sample.rindex('\n') + 1]
+    try:
+        delimiter = csv.Sniffer().sniff(sample, delimiters=CSV_DELIMITERS).delimiter
+    except csv.Error:
+        delimiter = DEFAULT_DELIMITER
+    header = next(csv.reader(io.StringIO(sample), delimiter=delimiter), [])
+    return delimiter, header
+
+
+def iter_csv_rows(file_path: str, delimiter: str = DEFAULT_DELIMITER) -> Iterator[Dict[str, str]]:
+    with _open(file_path) as f:
+        yield from csv.DictReader(f, delimiter=delimiter)
+
+
+def count_csv_rows(file_path: str, delimiter: str = DEFAULT_DELIMITER) -> int:
+    # Parsed rather than line-counted so quoted newlines don't inflate the total
+    with _open(file_path) as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        next(reader, None)
+        return sum(1 for _ in reader)
+
+
+def preview_csv_rows(rows: Iterable[Dict[str, str]], limit: int,
+                     columns: Optional[List[str]] = None) -> List[Dict[str, str]]:
+    rows = islice(rows, max(0, limit))
+    if columns is None:
+        return list(rows)
+    return [{column: row.get(column) for column in columns} for row in rows]
+
+
+def save_upload(file_storage, upload_dir: str) -> Dict[str, Any]:
+    """Write an upload to disk in chunks and describe it without loading it."""
+    os.makedirs(upload_dir, exist_ok=True)
+    path = os.path.join(upload_dir, f"{uuid.uuid4().hex}.csv")
+    file_storage.save(path)
+
+    delimiter, columns = sniff_csv(path)
+    return {
+        "path": path,
+        "size_bytes": os.path.getsize(path),
+        "delimiter": delimiter,
+        "columns": columns,
+        "row_count": count_csv_rows(path, delimiter),
+    }
+
+
+def csv_record_rows(record) -> Iterator[Dict[str, str]]:
+    """Rows of a stored CSV record, whether it lives on disk or inline in `content`."""
+    if record.path:
+        return iter_csv_rows(record.path, record.delimiter or DEFAULT_DELIMITER)
+    return csv.DictReader(io.StringIO(record.content))
+
+
+def csv_record_columns(record) -> List[str]:
+    if record.columns is not None:
+        return record.columns
+    return next(csv.reader(io.StringIO(record.content)), [])
@@ -0,0 +1,198 @@
+import importlib.util
+import os
+from typing import Any, Dict, List, Optional
+
+# Parsers are imported on first extract, not when a web worker starts
+LXML_AVAILABLE = importlib.util.find_spec('lxml') is not None
+
+NOT_FOUND = 'Not found'
+CONTENT_TAGS = ('p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+MAIN_CLASSES = {'content', 'main', 'article'}
+EXCLUDED_TAGS = {'nav', 'header', 'footer'}
+EXCLUDED_CLASSES = {'navigation', 'menu', 'sidebar'}
+# BeautifulSoup's get_text() leaves out the contents of these
+NON_TEXT_TAGS = {'script', 'style', 'template'}
+
+
+class Extractor:
+    """Pulls title, h1, meta description and main-content text out of an HTML page.
+
+    With links=True the result also carries "links": every followable <a href>, unresolved."""
+    name = None
+
+    def extract(self, html: str, links: bool = False) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+def _followable(rel: Optional[str]) -> bool:
+    return 'nofollow' not in (rel or '').lower().split()
+
+
+class SoupExtractor(Extractor):
+    name = 'soup'
+
+    def extract(self, html: str, links: bool = False) -> Dict[str, Any]:
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, 'html.parser')
+
+        title = soup.title.string if soup.title else NOT_FOUND
+        h1 = soup.find('h1')
+        h1 = h1.text if h1 else NOT_FOUND
+        description = soup.find('meta', {'name': 'description'})
+        description = description.get('content', NOT_FOUND) if description else NOT_FOUND
+
+        main_content = soup.find('main') or soup.find(
+            'div', class_=list(MAIN_CLASSES))
+        if main_content:
+            for elem in main_content.select('nav, header, footer, .navigation, .menu, .sidebar'):
+                elem.decompose()
+            content_elements = main_content.find_all(CONTENT_TAGS)
+        else:
+            content_elements = soup.find_all(CONTENT_TAGS)
+
+        text_content = '\n\n'.join(
+            [elem.get_text(strip=True) for elem in content_elements])
+
+        fields = {
+            "title": title,
+            "h1": h1,
+            "meta_description": description,
+            "text_content": text_content,
+        }
+        if links:
+            # Collected from the whole page: nav menus are how crawls find most pages
+            fields["links"] = [a['href'] for a in soup.find_all('a', href=True)
+                               if _followable(' '.join(a.get('rel') or []))]
+        return fields
+
+
+class LxmlExtractor(Extractor):
+    """Single-pass extraction over lxml's tree, applying the soup path's selection and get_text() rules.
+
+    Fields match SoupExtractor wherever the two parsers build the same tree. They don't always:
+    libxml2 closes a <p> when another opens inside it and html.parser nests them, libxml2 can wrap
+    bare text outside any element in a <p>, and html.parser keeps CDATA sections as text where libxml2
+    drops them. So this is opt-in (SCRAPER_EXTRACTOR=lxml) rather than the default."""
+    name = 'lxml'
+
+    def extract(self, html: str, links: bool = False) -> Dict[str, Any]:
+        import lxml.html
+        from lxml import etree
+        try:
+            root = lxml.html.document_fromstring(html)
+        except ValueError:
+            # lxml refuses str input that carries an XML encoding declaration
+            root = lxml.html.document_fromstring(html.encode('utf-8'))
+        except etree.ParserError:
+            empty = {"title": NOT_FOUND, "h1": NOT_FOUND, "meta_description": NOT_FOUND, "text_content": ''}
+            return {**empty, "links": []} if links else empty
+
+        title = h1 = description = None
+        main_el = div_el = None
+        in_main = in_div = False
+        excluded_in_main = excluded_in_div = 0
+        in_template = 0
+        templated = set()
+        all_elements: List[Any] = []
+        main_elements: List[Any] = []
+        div_elements: List[Any] = []
+        hrefs: List[str] = []
+
+        # One walk over the tree collects every field plus the candidate content containers
+        for event, el in etree.iterwalk(root, events=('start', 'end')):
+            tag = el.tag
+            if not isinstance(tag, str):
+                continue
+
+            if event == 'end':
+                if el is main_el:
+                    in_main = False
+                elif el is div_el:
+                    in_div = False
+                if self._is_excluded(el):
+                    excluded_in_main -= in_main
+                    excluded_in_div -= in_div
+                in_template -= tag == 'template'
+                continue
+
+            if self._is_excluded(el):
+                excluded_in_main += in_main
+                excluded_in_div += in_div
+            if in_template:
+                # Still found by the soup path's searches, but its get_text() skips template contents
+                templated.add(el)
+            in_template += tag == 'template'
+
+            if tag == 'title' and title is None:
+                title = el
+            elif tag == 'h1' and h1 is None:
+                h1 = el
+            elif tag == 'meta' and description is None and el.get('name') == 'description':
+                description = el
+            elif tag == 'main' and main_el is None:
+                main_el, in_main = el, True
+            elif tag == 'div' and div_el is None and MAIN_CLASSES & set(el.get('class', '').split()):
+                div_el, in_div = el, True
+
+            if links and tag == 'a' and el.get('href') and _followable(el.get('rel')):
+                # Excluded sections too, as in the soup path: nav menus are how crawls find most pages
+                hrefs.append(el.get('href'))
+
+            if tag in CONTENT_TAGS:
+                all_elements.append(el)
+                if in_main and not excluded_in_main:
+                    main_elements.append(el)
+                if in_div and not excluded_in_div:
+                    div_elements.append(el)
+
+        if main_el is not None:
+            content_elements, skip_excluded = main_elements, True
+        elif div_el is not None:
+            content_elements, skip_excluded = div_elements, True
+        else:
+            content_elements, skip_excluded = all_elements, False
+
+        fields = {
+            "title": title.text if title is not None else NOT_FOUND,
+            "h1": self._text(h1, False, strip=False, templated=templated) if h1 is not None else NOT_FOUND,
+            "meta_description": description.get('content', NOT_FOUND) if description is not None else NOT_FOUND,
+            "text_content": '\n\n'.join(
+                self._text(el, skip_excluded, templated=templated) for el in content_elements),
+        }
+        if links:
+            fields["links"] = hrefs
+        return fields
+
+    @staticmethod
+    def _is_excluded(el) -> bool:
+        return el.tag in EXCLUDED_TAGS or bool(EXCLUDED_CLASSES & set(el.get('class', '').split()))
+
+    @classmethod
+    def _text(cls, el, skip_excluded: bool, strip: bool = True, templated=frozenset()) -> str:
+        # Same as BeautifulSoup's get_text(), minus subtrees the soup path decomposes
+        if el in templated:
+            return ''
+        clean = str.strip if strip else str
+        parts = [clean(el.text)] if el.text and el.tag not in NON_TEXT_TAGS else []
+        for child in el:
+            if (isinstance(child.tag, str) and child.tag not in NON_TEXT_TAGS
+                    and not (skip_excluded and cls._is_excluded(child))):
+                parts.append(cls._text(child, skip_excluded, strip))
+            if child.tail:
+                parts.append(clean(child.tail))
+        return ''.join(parts)
+
+
+EXTRACTORS = {
+    SoupExtractor.name: SoupExtractor,
+    LxmlExtractor.name: LxmlExtractor,
+}
+
+
+def get_extractor(name: Optional[str] = None) -> Extractor:
+    name = name or os.environ.get('SCRAPER_EXTRACTOR') or SoupExtractor.name
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown extractor: {name}")
+    if name == LxmlExtractor.name and not LXML_AVAILABLE:
+        return SoupExtractor()
+    return EXTRACTORS[name]()
@@ -0,0 +1,113 @@
+# SimHash fingerprints of page text and near-duplicate clustering over them. Templated pages
+# (paginated listings, faceted category pages) land within a few bits of each other, so one
+# representative per cluster can stand in for the rest when calling the LLM.
+import hashlib
+import os
+import re
+from collections import Counter
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+SIMHASH_BITS = 64
+SHINGLE_WORDS = 3
+DEFAULT_MAX_DISTANCE = int(os.environ.get('NEAR_DUPLICATE_DISTANCE', 3))
+# More bits apart than this and the LSH bands get too narrow to be selective
+MAX_DISTANCE = 10
+DEDUPE_MODES = ('off', 'fanout', 'flag')
+
+WORD_RE = re.compile(r'\w+')
+
+
+def simhash(text: Optional[str]) -> Optional[int]:
+    """64-bit SimHash over word 3-shingles, weighted by how often each shingle occurs."""
+    words = WORD_RE.findall(text.lower()) if text else []
+    if not words:
+        return None
+    shingles = Counter(' '.join(words[i:i + SHINGLE_WORDS])
+                       for i in range(max(1, len(words) - SHINGLE_WORDS + 1)))
+
+    # Imported here so web workers that never fingerprint don't pay for numpy
+    import numpy as np
+    digests = b''.join(hashlib.blake2b(shingle.encode('utf-8'), digest_size=SIMHASH_BITS // 8).digest()
+                       for shingle in shingles)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(len(shingles), -1),
+                         axis=1, bitorder='little')
+    weights = np.fromiter(shingles.values(), dtype=np.int64, count=len(shingles))
+    # Each shingle votes +weight for its set bits and -weight for the rest
+    totals = weights @ (bits.astype(np.int64) * 2 - 1)
+    return int.from_bytes(np.packbits(totals > 0, bitorder='little').tobytes(), 'little')
+
+
+def to_hex(fingerprint: Optional[int]) -> Optional[str]:
+    return None if fingerprint is None else f'{fingerprint:016x}'
+
+
+def from_hex(value: Optional[str]) -> Optional[int]:
+    return None if not value else int(value, 16)
+
+
+def simhash_hex(text: Optional[str]) -> Optional[str]:
+    return to_hex(simhash(text))
+
+
+def distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class LSHIndex:
+    """Fingerprints split into max_distance + 1 bands: any two within max_distance bits share a band."""
+
+    def __init__(self, max_distance: int = DEFAULT_MAX_DISTANCE):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        width = SIMHASH_BITS // bands
+        self._bands = [(i * width, SIMHASH_BITS if i == bands - 1 else (i + 1) * width) for i in range(bands)]
+        self._buckets: Dict[Tuple[int, int], List[Hashable]] = {}
+        self._fingerprints: Dict[Hashable, int] = {}
+        # Insertion rank, for ties: band order says nothing about which key came first
+        self._order: Dict[Hashable, int] = {}
+
+    def _keys(self, fingerprint: int) -> Iterable[Tuple[int, int]]:
+        for n, (start, end) in enumerate(self._bands):
+            yield n, (fingerprint >> start) & ((1 << (end - start)) - 1)
+
+    def add(self, key: Hashable, fingerprint: int):
+        self._fingerprints[key] = fingerprint
+        self._order.setdefault(key, len(self._order))
+        for band in self._keys(fingerprint):
+            self._buckets.setdefault(band, []).append(key)
+
+    def nearest(self, fingerprint: int) -> Optional[Tuple[Hashable, int]]:
+        """Closest indexed key within max_distance (earliest added on ties), with its distance."""
+        best = None
+        best_rank = None
+        seen = set()
+        for band in self._keys(fingerprint):
+            for key in self._buckets.get(band, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                d = distance(fingerprint, self._fingerprints[key])
+                rank = (d, self._order[key])
+                if d <= self.max_distance and (best_rank is None or rank < best_rank):
+                    best, best_rank = (key, d), rank
+        return best
+
+
+def cluster(fingerprints: Iterable[Tuple[Hashable, Optional[int]]],
+            max_distance: int = DEFAULT_MAX_DISTANCE) -> Dict[Hashable, Tuple[Hashable, int]]:
+    """Map each near-duplicate key to (representative key, distance).
+
+    Keys are taken in the order given; a key joins the closest earlier representative within
+    max_distance, otherwise it becomes a representative. Every member is therefore within
+    max_distance of its own representative, not just of some other member."""
+    index = LSHIndex(max_distance)
+    duplicates = {}
+    for key, fingerprint in fingerprints:
+        if fingerprint is None:
+            continue
+        match = index.nearest(fingerprint)
+        if match is None:
+            index.add(key, fingerprint)
+        else:
+            duplicates[key] = match
+    return duplicates
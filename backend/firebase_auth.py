@@ -0,0 +1,173 @@
+# Firebase ID token verification off the hot path: Google's signing keys are kept warm by a
+# background thread, verified tokens are cached until they expire, and user rows are cached briefly.
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import requests
+from sqlalchemy.orm import make_transient_to_detached
+
+import metrics
+from models import db, User
+
+logger = logging.getLogger(__name__)
+
+ID_TOKEN_CERT_URI = 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+ID_TOKEN_ISSUER_PREFIX = 'https://securetoken.google.com/'
+TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000))
+USER_CACHE_SIZE = int(os.environ.get('AUTH_USER_CACHE_SIZE', 1000))
+USER_CACHE_SECONDS = int(os.environ.get('AUTH_USER_CACHE_SECONDS', 300))
+KEY_RETRY_SECONDS = 30
+FIREBASE_CREDENTIALS = os.environ.get('FIREBASE_CREDENTIALS', 'adminsdk.json')
+
+
+class PublicKeySet:
+    """Google's token-signing certificates, refetched in the background at half their max-age."""
+
+    def __init__(self, url: str = ID_TOKEN_CERT_URI):
+        self.url = url
+        self._certs: Optional[Dict[str, str]] = None
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def certs(self) -> Optional[Dict[str, str]]:
+        with self._lock:
+            return self._certs
+
+    def refresh(self) -> int:
+        response = requests.get(self.url, timeout=10)
+        response.raise_for_status()
+        match = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+        with self._lock:
+            self._certs = response.json()
+        return int(match.group(1)) if match else 3600
+
+    def start(self):
+        # Re-check the pid so each forked gunicorn worker runs its own refresher
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name='firebase-keys', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                wait = max(KEY_RETRY_SECONDS, self.refresh() // 2)
+            except Exception as e:
+                # Keep the previous keys; unknown key ids fall back to the SDK anyway
+                logger.warning(f"Could not refresh Firebase signing keys: {str(e)}")
+                wait = KEY_RETRY_SECONDS
+            time.sleep(wait)
+
+
+_keys = PublicKeySet()
+_tokens: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+_users: 'OrderedDict[str, tuple]' = OrderedDict()
+_lock = threading.Lock()
+_init_lock = threading.Lock()
+
+
+def init_firebase():
+    """The Admin SDK app, initialized on first use rather than at import."""
+    import firebase_admin
+    with _init_lock:
+        try:
+            return firebase_admin.get_app()
+        except ValueError:
+            pass
+        # The Auth emulator (used by the benchmarks) needs no service account
+        if os.environ.get('FIREBASE_AUTH_EMULATOR_HOST'):
+            return firebase_admin.initialize_app()
+        from firebase_admin import credentials
+        return firebase_admin.initialize_app(credentials.Certificate(FIREBASE_CREDENTIALS))
+
+
+def preload_keys():
+    if not os.environ.get('FIREBASE_AUTH_EMULATOR_HOST'):
+        _keys.start()
+
+
+def _project_id() -> Optional[str]:
+    try:
+        return init_firebase().project_id
+    except AttributeError:
+        return None
+
+
+def _verify(token: str) -> Dict[str, Any]:
+    from firebase_admin import auth
+    from google.auth import jwt
+    certs = _keys.certs()
+    project_id = _project_id()
+    header = jwt.decode_header(token)
+    if (certs is None or not project_id or header.get('alg') != 'RS256'
+            or header.get('kid') not in certs):
+        # Keys not loaded yet, or rotated since the last refresh: let the SDK handle it
+        return auth.verify_id_token(token)
+
+    # Same checks as firebase_admin's verifier, minus the certificate fetch
+    claims = jwt.decode(token, certs=certs, audience=project_id)
+    if claims.get('iss') != ID_TOKEN_ISSUER_PREFIX + project_id:
+        raise auth.InvalidIdTokenError('ID token has incorrect "iss" claim')
+    subject = claims.get('sub')
+    if not isinstance(subject, str) or not subject or len(subject) > 128:
+        raise auth.InvalidIdTokenError('ID token has an invalid "sub" claim')
+    claims['uid'] = subject
+    return claims
+
+
+def verify_id_token(token: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    now = time.time()
+    with _lock:
+        claims = _tokens.get(key)
+        if claims is not None:
+            if claims['exp'] > now:
+                _tokens.move_to_end(key)
+                metrics.AUTH_VERIFY_SECONDS.labels('cache').observe(time.perf_counter() - started)
+                return claims
+            del _tokens[key]
+
+    try:
+        claims = _verify(token)
+    except Exception:
+        metrics.AUTH_VERIFY_SECONDS.labels('rejected').observe(time.perf_counter() - started)
+        raise
+    metrics.AUTH_VERIFY_SECONDS.labels('verified').observe(time.perf_counter() - started)
+    with _lock:
+        _tokens[key] = claims
+        while len(_tokens) > TOKEN_CACHE_SIZE:
+            _tokens.popitem(last=False)
+    return claims
+
+
+def get_or_create_user(claims: Dict[str, Any]) -> User:
+    user_id = claims['uid']
+    now = time.time()
+    with _lock:
+        cached = _users.get(user_id)
+    if cached is not None and cached[1] > now:
+        # Attach a known row to the session without a SELECT
+        user = User(id=user_id, email=cached[0])
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    user = db.session.get(User, user_id)
+    if not user:
+        user = User(id=user_id, email=claims.get('email'))
+        db.session.add(user)
+        db.session.commit()
+
+    with _lock:
+        _users[user_id] = (user.email, now + USER_CACHE_SECONDS)
+        _users.move_to_end(user_id)
+        while len(_users) > USER_CACHE_SIZE:
+            _users.popitem(last=False)
+    return user
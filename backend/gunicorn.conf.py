@@ -0,0 +1,52 @@
+# Loaded by the Dockerfile's gunicorn command.
+#
+# preload_app builds the app once in the master and forks workers from it, so imports, the schema
+# check and the Firebase SDK are shared copy-on-write and a restarted worker is up almost at once.
+# Set GUNICORN_PRELOAD=false to load the app in every worker instead.
+#
+# Workers share Prometheus samples through PROMETHEUS_MULTIPROC_DIR, which has to be emptied on
+# start and cleaned up as workers exit.
+import os
+import shutil
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() != 'false'
+
+# Scrape/generate streams and /api/jobs/<id>/events hold a request open for a whole run. Sync workers
+# would each be tied up by one stream and killed by the arbiter after `timeout`; gthread serves
+# GUNICORN_THREADS requests per worker, and its heartbeat doesn't depend on requests finishing, so
+# `timeout` only catches a worker that is truly hung.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+# Seconds an idle keep-alive connection from the proxy is held open
+keepalive = 5
+multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+# Cleared here rather than in on_starting: a preloaded app creates its metric files before that hook
+if multiproc_dir:
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        from app import warm_up
+        warm_up()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        # Connections opened in the master must not be shared with the children
+        from app import app
+        from models import db
+        with app.app_context():
+            db.engine.dispose(close=False)
+        # Background threads don't survive fork; start this worker's key refresher
+        import firebase_auth
+        firebase_auth.preload_keys()
+
+
+def child_exit(server, worker):
+    if multiproc_dir:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,196 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.cookiejar import DefaultCookiePolicy
+from typing import Any, Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# Number of per-host pools kept alive, and keep-alive connections held per host
+DEFAULT_POOL_CONNECTIONS = int(os.environ.get('SCRAPER_POOL_CONNECTIONS', 50))
+DEFAULT_POOL_MAXSIZE = int(os.environ.get('SCRAPER_POOL_MAXSIZE', 10))
+DEFAULT_HTTP2 = os.environ.get('SCRAPER_HTTP2', '').lower() in ('1', 'true', 'yes')
+
+
+class SessionStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.handshake_seconds = 0.0
+        self.handshake_max = 0.0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_connect(self, seconds: float):
+        with self._lock:
+            self.connections += 1
+            self.handshake_seconds += seconds
+            self.handshake_max = max(self.handshake_max, seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            reused = max(0, self.requests - self.connections)
+            return {
+                "requests": self.requests,
+                "new_connections": self.connections,
+                "reused_connections": reused,
+                "reuse_ratio": round(reused / self.requests, 4) if self.requests else 0.0,
+                "handshake_ms_total": round(self.handshake_seconds * 1000, 2),
+                "handshake_ms_avg": round(self.handshake_seconds * 1000 / self.connections, 2) if self.connections else 0.0,
+                "handshake_ms_max": round(self.handshake_max * 1000, 2),
+            }
+
+
+class _TimedConnectMixin:
+    stats: SessionStats = None
+
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        self.stats.record_connect(time.perf_counter() - started)
+
+
+def _timed_pool_classes(stats: SessionStats) -> Dict[str, type]:
+    http_conn = type('TimedHTTPConnection', (_TimedConnectMixin, HTTPConnection), {'stats': stats})
+    https_conn = type('TimedHTTPSConnection', (_TimedConnectMixin, HTTPSConnection), {'stats': stats})
+    return {
+        'http': type('TimedHTTPConnectionPool', (HTTPConnectionPool,), {'ConnectionCls': http_conn}),
+        'https': type('TimedHTTPSConnectionPool', (HTTPSConnectionPool,), {'ConnectionCls': https_conn}),
+    }
+
+
+class _PooledAdapter(HTTPAdapter):
+    def __init__(self, stats: SessionStats, **kwargs):
+        self._stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _timed_pool_classes(self._stats)
+
+
+class _NoCookies(DefaultCookiePolicy):
+    # Scraped pages shouldn't see cookies set by earlier pages on the shared session
+    def set_ok(self, cookie, request):
+        return False
+
+
+class SessionManager:
+    """Keep-alive HTTP client shared by every Scraper in the worker; safe to use from many threads."""
+
+    def __init__(self, pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize: int = DEFAULT_POOL_MAXSIZE, http2: bool = DEFAULT_HTTP2):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.stats = SessionStats()
+
+        self._session = requests.Session()
+        self._session.cookies.set_policy(_NoCookies())
+        adapter = _PooledAdapter(self.stats, pool_connections=pool_connections,
+                                 pool_maxsize=pool_maxsize)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+        self._http2 = None
+        if http2:
+            try:
+                import h2  # noqa: F401
+                import httpx
+                self._http2 = httpx.Client(
+                    http2=True, follow_redirects=True,
+                    limits=httpx.Limits(max_connections=pool_connections * pool_maxsize,
+                                        max_keepalive_connections=pool_connections))
+            except ImportError:
+                logger.warning("HTTP/2 requested but httpx[http2] is not installed; using HTTP/1.1")
+
+    @property
+    def http2(self) -> bool:
+        return self._http2 is not None
+
+    def get(self, url: str, timeout: float = 10, headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        self.stats.record_request()
+        if self._http2 is not None:
+            return self._get_http2(url, timeout, headers)
+        return self._session.get(url, timeout=timeout, headers=headers)
+
+    @contextmanager
+    def stream(self, url: str, timeout: float = 10,
+               headers: Optional[Dict[str, str]] = None) -> Iterator[requests.Response]:
+        """GET that leaves the body unread, for documents too big to hold whole (sitemaps). Always HTTP/1.1."""
+        self.stats.record_request()
+        response = self._session.get(url, timeout=timeout, headers=headers, stream=True)
+        try:
+            yield response
+        finally:
+            response.close()
+
+    def _get_http2(self, url, timeout, headers) -> requests.Response:
+        import httpx
+
+        connect_started = []
+        connected_event = ('connection.start_tls.complete' if url.startswith('https')
+                           else 'connection.connect_tcp.complete')
+
+        def trace(event, info):
+            if event == 'connection.connect_tcp.started':
+                connect_started.append(time.perf_counter())
+            elif event == connected_event and connect_started:
+                self.stats.record_connect(time.perf_counter() - connect_started.pop())
+
+        try:
+            response = self._http2.get(url, timeout=timeout, headers=headers,
+                                       extensions={'trace': trace})
+        except httpx.TimeoutException as e:
+            raise requests.Timeout(str(e))
+        except httpx.HTTPError as e:
+            raise requests.ConnectionError(str(e))
+        return self._as_requests_response(response)
+
+    @staticmethod
+    def _as_requests_response(response) -> requests.Response:
+        converted = requests.Response()
+        converted.status_code = response.status_code
+        converted.reason = response.reason_phrase
+        converted.headers = CaseInsensitiveDict(response.headers)
+        converted.url = str(response.url)
+        converted.encoding = response.charset_encoding
+        converted.elapsed = response.elapsed
+        converted._content = response.content
+        return converted
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "pool_connections": self.pool_connections,
+            "pool_maxsize": self.pool_maxsize,
+            "http2": self.http2,
+            **self.stats.snapshot(),
+        }
+
+    def close(self):
+        self._session.close()
+        if self._http2 is not None:
+            self._http2.close()
+
+
+_default_manager: Optional[SessionManager] = None
+_default_lock = threading.Lock()
+
+
+def get_session_manager() -> SessionManager:
+    global _default_manager
+    if _default_manager is None:
+        with _default_lock:
+            if _default_manager is None:
+                _default_manager = SessionManager()
+    return _default_manager
@@ -0,0 +1,234 @@
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import crawler
+import operations
+from models import db, Job, Model
+
+logger = logging.getLogger(__name__)
+
+# 'thread' runs workers inside each web process; 'off' leaves the queue to `flask run-jobs`
+JOB_RUNNER = os.environ.get('JOB_RUNNER', 'thread')
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))
+STALE_AFTER = timedelta(seconds=int(os.environ.get('JOB_STALE_SECONDS', 600)))
+MESSAGE_TAIL = 20
+
+RESUMABLE_STATUSES = ('cancelled', 'failed', 'interrupted')
+# Credentials each kind needs. They're dropped from Job.params as soon as a run ends, however it
+# ends, so resuming one of these jobs takes them from the caller again
+SECRET_PARAMS = {'generate': ('apiKey',), 'rate': ('apiKey',)}
+
+
+def enqueue(kind: str, model: Model, user, params: Dict[str, Any]) -> Job:
+    job = Job(id=str(uuid.uuid4()), kind=kind, model_id=model.id, user_id=user.id,
+              status='queued', params=params, result={})
+    db.session.add(job)
+    db.session.commit()
+    logger.info(f"Queued {kind} job {job.id} for model {model.id}")
+    return job
+
+
+def job_to_dict(job: Job) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "model_id": job.model_id,
+        "status": job.status,
+        "progress": job.progress,
+        "total": job.total,
+        "result": job.result,
+        "error": job.error,
+        "cancel_requested": job.cancel_requested,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def _finish(job: Job, status: str, error: Optional[str] = None):
+    job.status = status
+    job.finished_at = datetime.utcnow()
+    if error is not None:
+        job.error = error
+    job.params = {k: v for k, v in job.params.items() if k not in SECRET_PARAMS.get(job.kind, ())}
+
+
+def request_cancel(job: Job):
+    if job.status == 'queued':
+        _finish(job, 'cancelled')
+    elif job.status == 'running':
+        job.cancel_requested = True
+    db.session.commit()
+
+
+def missing_secrets(job: Job, supplied: Dict[str, Any]) -> List[str]:
+    return [name for name in SECRET_PARAMS.get(job.kind, ()) if not supplied.get(name)]
+
+
+def resume(job: Job, secrets: Optional[Dict[str, Any]] = None):
+    # Picks up after job.cursor, the position of the last item the job finished
+    job.params = {**job.params, **(secrets or {})}
+    job.status = 'queued'
+    job.cancel_requested = False
+    job.error = None
+    job.finished_at = None
+    db.session.commit()
+
+
+def _merge_summary(result: Dict[str, Any], summary: Dict[str, Any]) -> Dict[str, Any]:
+    merged = dict(result)
+    for key, value in summary.items():
+        if key == 'event':
+            continue
+        if key.endswith('_count') or key.startswith('total_'):
+            merged[key] = merged.get(key, 0) + value
+        else:
+            merged[key] = value
+    return merged
+
+
+def delete_for_model(model: Model):
+    # A worker still running one of these finds its job gone at its next commit and stops (see run_job)
+    Job.query.filter_by(model_id=model.id).delete(synchronize_session=False)
+
+
+def run_job(job_id: str):
+    job = db.session.get(Job, job_id)
+    if job is None:
+        # Deleted with its model after being claimed
+        return
+    model = db.session.get(Model, job.model_id)
+    if model is None:
+        _finish(job, 'failed', "Model no longer exists")
+        db.session.commit()
+        return
+
+    params = dict(job.params)
+    result = dict(job.result or {})
+    done = result.get('processed_count', 0) + result.get('cached_count', 0) + result.get('duplicate_count', 0)
+    if job.kind == 'generate' and done:
+        # rateLimit caps the whole job, not each resumed run
+        params['rateLimit'] = params.get('rateLimit', 10) - done
+
+    messages = list(result.pop('messages', []))
+    progress = job.progress or 0
+    if job.kind == 'scrape' and progress:
+        # Every scrape item is one fetched URL, and limit caps the whole job
+        params['limit'] = params.get('limit', 100) - progress
+    if job.kind == 'crawl' and progress:
+        params['maxUrls'] = params.get('maxUrls', crawler.DEFAULT_MAX_URLS) - progress
+    events = operations.OPERATIONS[job.kind](model, params, start_position=job.cursor + 1)
+    try:
+        for event in events:
+            if event['event'] == 'start':
+                job.total = progress + event['total']
+            elif event['event'] == 'item':
+                progress += 1
+                job.progress = progress
+                job.cursor = event['position']
+                messages = (messages + [event['message']])[-MESSAGE_TAIL:]
+            elif event['event'] == 'summary':
+                result = _merge_summary(result, event)
+            job.result = {**result, "messages": messages}
+            job.heartbeat_at = datetime.utcnow()
+            # Each item is durable before the next starts, so resume never redoes finished work
+            db.session.commit()
+
+            if event['event'] == 'item' and job.cancel_requested:
+                events.close()
+                _finish(job, 'cancelled')
+                db.session.commit()
+                logger.info(f"Cancelled job {job_id} at position {job.cursor}")
+                return
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        if job is None:
+            # The model was deleted mid-run, taking the job row with it; this commit's writes went nowhere
+            events.close()
+            logger.info(f"Stopped job {job_id}: its model was deleted")
+            return
+        logger.exception(f"Job {job_id} failed: {str(e)}")
+        _finish(job, 'failed', str(e))
+        db.session.commit()
+        return
+
+    _finish(job, 'completed')
+    db.session.commit()
+    logger.info(f"Completed job {job_id}")
+
+
+def _claim(worker_id: str) -> Optional[str]:
+    cutoff = datetime.utcnow() - STALE_AFTER
+    # Row by row rather than one UPDATE, so the params lose their secrets too
+    for stale in Job.query.filter(Job.status == 'running', Job.heartbeat_at < cutoff):
+        _finish(stale, 'interrupted', "Worker stopped responding")
+
+    job = Job.query.filter_by(status='queued').order_by(Job.created_at).first()
+    if job is None:
+        db.session.commit()
+        return None
+
+    # Conditional update so two workers (threads or processes) can't take the same job
+    now = datetime.utcnow()
+    claimed = Job.query.filter_by(id=job.id, status='queued').update(
+        {"status": "running", "worker": worker_id, "started_at": now, "heartbeat_at": now},
+        synchronize_session=False)
+    db.session.commit()
+    return job.id if claimed else None
+
+
+class JobRunner:
+    def __init__(self, app, workers: int = JOB_WORKERS):
+        self.app = app
+        self.workers = workers
+        self.pid = os.getpid()
+        self.worker_id = f"{socket.gethostname()}:{self.pid}"
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for n in range(self.workers):
+            thread = threading.Thread(target=self.run_forever, name=f'job-worker-{n}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.workers} job workers in process {self.pid}")
+
+    def stop(self):
+        self._stop.set()
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    job_id = _claim(self.worker_id)
+                    if job_id:
+                        logger.info(f"Worker {self.worker_id} running job {job_id}")
+                        run_job(job_id)
+                        continue
+            except Exception as e:
+                logger.exception(f"Job worker loop error: {str(e)}")
+            self._stop.wait(POLL_INTERVAL)
+
+
+_runner: Optional[JobRunner] = None
+_runner_lock = threading.Lock()
+
+
+def ensure_started(app):
+    global _runner
+    if JOB_RUNNER != 'thread':
+        return
+    # Re-check the pid so a forked gunicorn worker starts its own threads
+    if _runner is not None and _runner.pid == os.getpid():
+        return
+    with _runner_lock:
+        if _runner is None or _runner.pid != os.getpid():
+            _runner = JobRunner(app)
+            _runner.start()
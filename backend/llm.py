@@ -0,0 +1,349 @@
+import hashlib
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import metrics
+
+if TYPE_CHECKING:
+    import anthropic
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REQUESTS_PER_MINUTE = int(os.environ.get('LLM_REQUESTS_PER_MINUTE', 50))
+DEFAULT_TOKENS_PER_MINUTE = int(os.environ.get('LLM_TOKENS_PER_MINUTE', 40000))
+DEFAULT_LLM_CONCURRENCY = int(os.environ.get('LLM_CONCURRENCY', 4))
+MAX_LLM_CONCURRENCY = 16
+MAX_RETRIES = 5
+BATCH_POLL_INTERVAL = float(os.environ.get('LLM_BATCH_POLL_SECONDS', 30))
+MAX_BATCH_REQUESTS = 10000
+# 'anthropic' uses the Message Batches API, 'local' runs batches through the regular endpoint
+LLM_BATCH_BACKEND = os.environ.get('LLM_BATCH_BACKEND', 'anthropic')
+# 529 is Anthropic's "overloaded" status
+RETRYABLE_STATUSES = (429, 529)
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute; reservations may overdraw and the caller waits it off."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def adjust(self, delta: float):
+        # Settle an estimate once the real usage is known
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, estimated_tokens: int):
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        with self._lock:
+            wait = max(wait, self._paused_until - time.monotonic())
+        if wait > 0:
+            time.sleep(wait)
+
+    def settle(self, estimated_tokens: int, actual_tokens: int):
+        self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def pause(self, seconds: float):
+        # A 429/529 for one call means every caller sharing this key should back off
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+_clients: Dict[str, 'anthropic.Anthropic'] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key: str) -> 'anthropic.Anthropic':
+    """One client per API key so its connection pool is reused across calls and requests."""
+    # Retries are left to LLMDispatcher so 429/529 back-off is shared across calls
+    key = hashlib.sha256(api_key.encode()).hexdigest()
+    with _clients_lock:
+        if key not in _clients:
+            # Imported on first use: the SDK is slow to import and most requests never call Claude
+            import anthropic
+            _clients[key] = anthropic.Anthropic(api_key=api_key, max_retries=0)
+        return _clients[key]
+
+
+_limiters: Dict[Tuple[str, float, float], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def is_api_error(error: Optional[BaseException]) -> bool:
+    # Nothing can raise an SDK error before get_client() has imported the SDK
+    anthropic = sys.modules.get('anthropic')
+    return anthropic is not None and isinstance(error, anthropic.AnthropicError)
+
+
+def get_rate_limiter(api_key: str, requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                     tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE) -> RateLimiter:
+    # Limits apply per API key, so concurrent requests in this worker share one limiter
+    key = (hashlib.sha256(api_key.encode()).hexdigest(), requests_per_minute, tokens_per_minute)
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(requests_per_minute, tokens_per_minute)
+        return _limiters[key]
+
+
+def estimate_tokens(*texts: str) -> int:
+    return sum(len(text or '') for text in texts) // 4 + 1
+
+
+def _retry_delay(error: Exception, attempt: int) -> Optional[float]:
+    if getattr(error, 'status_code', None) not in RETRYABLE_STATUSES:
+        return None
+    backoff = min(60.0, 2 ** attempt) + random.uniform(0, 1)
+    retry_after = error.response.headers.get('retry-after')
+    try:
+        return max(float(retry_after), 0.0) if retry_after is not None else backoff
+    except ValueError:
+        return backoff
+
+
+class LLMDispatcher:
+    """Runs LLM calls concurrently under a RateLimiter, retrying 429/529s, yielding results in order."""
+
+    def __init__(self, limiter: RateLimiter, concurrency: int = DEFAULT_LLM_CONCURRENCY,
+                 max_retries: int = MAX_RETRIES):
+        self.limiter = limiter
+        self.concurrency = max(1, min(int(concurrency), MAX_LLM_CONCURRENCY))
+        self.max_retries = max_retries
+
+    def map(self, fn: Callable[[Any], Dict[str, Any]], inputs: Iterable[Any],
+            estimate: Callable[[Any], int],
+            usage: Optional[Callable[[Any], int]] = None) -> Iterator[Tuple[Optional[Any], Optional[Exception], float]]:
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='llm')
+        pending = deque()
+        try:
+            for value in inputs:
+                pending.append(executor.submit(self._call, fn, value, estimate(value), usage))
+                if len(pending) >= self.concurrency * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _call(self, fn, value, estimated: int, usage) -> Tuple[Optional[Any], Optional[Exception], float]:
+        started = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(estimated)
+            try:
+                result = fn(value)
+            except Exception as e:
+                delay = _retry_delay(e, attempt)
+                if delay is None or attempt == self.max_retries:
+                    return None, e, round((time.perf_counter() - started) * 1000, 1)
+                logger.warning(f"LLM call throttled ({getattr(e, 'status_code', '')}); retrying in {delay:.1f}s")
+                self.limiter.pause(delay)
+                continue
+            if usage is not None:
+                self.limiter.settle(estimated, usage(result))
+            return result, None, round((time.perf_counter() - started) * 1000, 1)
+
+
+def generate_claude_response(client, prompt, content, model, max_tokens, temperature=0):
+    try:
+        logger.info(f"Sending request to Claude API with model: {model}")
+        with metrics.llm_call('generate', model) as usage:
+            message = client.messages.create(
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                messages=[
+                    {"role": "user", "content": f"{prompt}\n\nContent: {content}"}
+                ]
+            )
+            usage.update(input=message.usage.input_tokens, output=message.usage.output_tokens)
+        logger.info(
+            f"Received response from Claude API. Tokens generated: {message.usage.output_tokens}")
+        return {
+            "content": message.content[0].text,
+            "tokens_generated": message.usage.output_tokens,
+            "input_tokens": message.usage.input_tokens
+        }
+    except Exception as e:
+        if is_api_error(e):
+            logger.error(f"Anthropic API Error: {str(e)}")
+        else:
+            logger.error(f"Unexpected error in Claude API call: {str(e)}")
+        raise
+
+
+RATING_METHODS = ('claude',)
+RATING_MODEL = "claude-3-haiku-20240307"
+RATING_MAX_TOKENS = 300
+RATING_SYSTEM_PROMPT = (
+    "Rate the following content out of 100 based on how much you would recommend it to a user. "
+    "Consider factors such as clarity, informativeness, and engagement. "
+    "Provide your reasoning, and then at the end of your response, include the total numerical rating between two hash symbols, like this: #90#"
+)
+
+
+def rating_request(content: str) -> Dict[str, Any]:
+    return {
+        "model": RATING_MODEL,
+        "max_tokens": RATING_MAX_TOKENS,
+        "temperature": 0,
+        "system": RATING_SYSTEM_PROMPT,
+        "messages": [
+            {"role": "user", "content": content}
+        ],
+    }
+
+
+def parse_rating(response_text: str) -> int:
+    logger.info(f"Received response from Claude API: {response_text}")
+
+    # Extract rating from anywhere in the message
+    match = re.search(r'#(\d+)#', response_text)
+    if match:
+        rating = int(match.group(1))
+        logger.info(f"Extracted rating: {rating}")
+        return rating
+    else:
+        logger.error("No rating found in the response")
+        logger.error(f"Full response: {response_text}")
+        raise ValueError("No rating found in the response")
+
+
+def generate_content_rating(api_key, content, rating_method, client=None):
+    if rating_method not in RATING_METHODS:
+        raise ValueError("Unsupported rating method")
+
+    client = client or get_client(api_key)
+
+    logger.info("Sending request to Claude API for content rating")
+    try:
+        with metrics.llm_call('rate', RATING_MODEL) as usage:
+            message = client.messages.create(**rating_request(content))
+            usage.update(input=message.usage.input_tokens, output=message.usage.output_tokens)
+        return parse_rating(message.content[0].text.strip())
+    except Exception as e:
+        logger.error(f"Error generating content rating: {str(e)}")
+        raise
+
+
+class MessageBatchRunner:
+    """Sends requests through the Message Batches API: half price, but results can take hours."""
+
+    def __init__(self, batches, poll_interval: float = BATCH_POLL_INTERVAL):
+        self.batches = batches
+        self.poll_interval = poll_interval
+
+    def submit(self, requests: Dict[str, Dict[str, Any]]) -> List[str]:
+        ids = list(requests)
+        batch_ids = []
+        for start in range(0, len(ids), MAX_BATCH_REQUESTS):
+            batch = self.batches.create(requests=[
+                {"custom_id": custom_id, "params": requests[custom_id]}
+                for custom_id in ids[start:start + MAX_BATCH_REQUESTS]])
+            logger.info(f"Submitted message batch {batch.id}")
+            batch_ids.append(batch.id)
+        return batch_ids
+
+    def wait(self, batch_ids: List[str]) -> Iterator[str]:
+        # Yields a status line per poll so callers can report progress and keep jobs alive
+        pending = list(batch_ids)
+        while pending:
+            batch = self.batches.retrieve(pending[0])
+            if batch.processing_status == 'ended':
+                pending.pop(0)
+                continue
+            counts = batch.request_counts
+            yield f"Batch {batch.id} {batch.processing_status}: {counts.succeeded} succeeded, {counts.processing} processing"
+            time.sleep(self.poll_interval)
+
+    def results(self, batch_ids: List[str]) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+        """custom_id -> (response text, error)"""
+        outcomes = {}
+        for batch_id in batch_ids:
+            for entry in self.batches.results(batch_id):
+                result = entry.result
+                metrics.LLM_REQUESTS.labels('batch', 'ok' if result.type == 'succeeded' else 'error').inc()
+                if result.type == 'succeeded':
+                    outcomes[entry.custom_id] = (result.message.content[0].text.strip(), None)
+                    metrics.LLM_TOKENS.labels('batch', 'input').inc(result.message.usage.input_tokens)
+                    metrics.LLM_TOKENS.labels('batch', 'output').inc(result.message.usage.output_tokens)
+                else:
+                    error = getattr(result, 'error', None)
+                    outcomes[entry.custom_id] = (None, f"{result.type}: {error}" if error else result.type)
+        return outcomes
+
+
+class LocalMessageBatches:
+    """Stand-in for client.beta.messages.batches that runs each request through messages.create.
+
+    Enabled with LLM_BATCH_BACKEND=local, for development and for APIs without batch support."""
+
+    def __init__(self, client, dispatcher: 'LLMDispatcher'):
+        self.client = client
+        self.dispatcher = dispatcher
+        self._batches: Dict[str, Dict[str, Any]] = {}
+
+    def create(self, requests):
+        requests = list(requests)
+        outcomes = self.dispatcher.map(
+            lambda params: self.client.messages.create(**params),
+            [request['params'] for request in requests],
+            estimate=lambda params: estimate_tokens(params.get('system', ''), params['messages'][0]['content']))
+        results = []
+        for request, (message, error, _) in zip(requests, outcomes):
+            if error is None:
+                result = SimpleNamespace(type='succeeded', message=message)
+            else:
+                result = SimpleNamespace(type='errored', error=str(error))
+            results.append(SimpleNamespace(custom_id=request['custom_id'], result=result))
+        batch_id = f"local_{uuid.uuid4().hex}"
+        self._batches[batch_id] = {"results": results}
+        return self.retrieve(batch_id)
+
+    def retrieve(self, batch_id):
+        results = self._batches[batch_id]['results']
+        succeeded = sum(r.result.type == 'succeeded' for r in results)
+        return SimpleNamespace(
+            id=batch_id, processing_status='ended',
+            request_counts=SimpleNamespace(succeeded=succeeded, errored=len(results) - succeeded, processing=0))
+
+    def results(self, batch_id):
+        return iter(self._batches.pop(batch_id)['results'])
+
+
+def get_batches(client, dispatcher: 'LLMDispatcher'):
+    if LLM_BATCH_BACKEND == 'local':
+        return LocalMessageBatches(client, dispatcher)
+    return client.beta.messages.batches
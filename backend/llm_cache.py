@@ -0,0 +1,95 @@
+# Persistent cache of Claude responses. Lookups and writes happen on the request/job thread;
+# the dispatcher's worker threads only ever see prompt text.
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional
+
+import metrics
+from models import db, LLMCacheEntry
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_TTL = timedelta(seconds=int(os.environ.get('LLM_CACHE_TTL_SECONDS', 30 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', 50000))
+
+# Counted in Prometheus so stats() covers every gunicorn worker, not just the one answering
+EVENTS = ('hits', 'misses', 'stores', 'evictions')
+
+
+def _count(name: str, amount: int = 1):
+    metrics.LLM_CACHE_EVENTS.labels(name).inc(amount)
+
+
+def cache_key(model: str, prompt: str, content: str, max_tokens: int, temperature: float) -> str:
+    payload = json.dumps([model, prompt, content, max_tokens, temperature], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def lookup(keys: Iterable[str]) -> Dict[str, LLMCacheEntry]:
+    keys = list(dict.fromkeys(keys))
+    cutoff = datetime.utcnow() - LLM_CACHE_TTL
+    found = {}
+    # Chunked to stay under SQLite's bound-parameter limit
+    for start in range(0, len(keys), 500):
+        entries = LLMCacheEntry.query.filter(
+            LLMCacheEntry.key.in_(keys[start:start + 500]),
+            LLMCacheEntry.created_at >= cutoff).all()
+        found.update((entry.key, entry) for entry in entries)
+    return found
+
+
+def record_hit(entry: LLMCacheEntry):
+    entry.hits = (entry.hits or 0) + 1
+    entry.last_used_at = datetime.utcnow()
+    _count('hits')
+
+
+def record_miss():
+    _count('misses')
+
+
+def store(key: str, model: str, response: Dict[str, Any]) -> LLMCacheEntry:
+    now = datetime.utcnow()
+    # merge() so an expired entry under the same key is overwritten rather than duplicated
+    entry = db.session.merge(LLMCacheEntry(
+        key=key, model=model, content=response['content'],
+        tokens_generated=response.get('tokens_generated', 0),
+        input_tokens=response.get('input_tokens', 0),
+        hits=0, created_at=now, last_used_at=now))
+    _count('stores')
+    return entry
+
+
+def prune(max_entries: Optional[int] = None) -> int:
+    """Drop expired entries, then the least recently used ones beyond max_entries."""
+    max_entries = LLM_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    removed = LLMCacheEntry.query.filter(
+        LLMCacheEntry.created_at < datetime.utcnow() - LLM_CACHE_TTL).delete(synchronize_session=False)
+
+    overflow = LLMCacheEntry.query.count() - max_entries
+    if overflow > 0:
+        stale = db.session.query(LLMCacheEntry.key).order_by(
+            LLMCacheEntry.last_used_at).limit(overflow).subquery()
+        removed += LLMCacheEntry.query.filter(LLMCacheEntry.key.in_(
+            db.session.query(stale.c.key))).delete(synchronize_session=False)
+
+    if removed:
+        _count('evictions', removed)
+        logger.info(f"Evicted {removed} LLM cache entries")
+    return removed
+
+
+def stats() -> Dict[str, Any]:
+    totals = metrics.counter_totals(metrics.LLM_CACHE_EVENTS, 'event')
+    counters = {name: int(totals.get(name, 0)) for name in EVENTS}
+    lookups = counters['hits'] + counters['misses']
+    return {
+        **counters,
+        "hit_rate": round(counters['hits'] / lookups, 3) if lookups else None,
+        "entries": LLMCacheEntry.query.count(),
+        "max_entries": LLM_CACHE_MAX_ENTRIES,
+        "ttl_seconds": int(LLM_CACHE_TTL.total_seconds()),
+    }
@@ -0,0 +1,121 @@
+# Prometheus metrics for /api/metrics. Under gunicorn set PROMETHEUS_MULTIPROC_DIR (see
+# gunicorn.conf.py): every worker then writes its samples to files there and the endpoint merges
+# them, so one scrape covers all workers instead of whichever one answered.
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge,
+                               Histogram, generate_latest)
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+# Bearer token Prometheus must send to read /api/metrics; unset leaves the endpoint disabled
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+FAST_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5)
+SLOW_BUCKETS = (.05, .1, .25, .5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_seconds', "Flask request latency", ['method', 'endpoint', 'status'])
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    'http_requests_in_flight', "Requests being handled", multiprocess_mode='livesum')
+
+SCRAPE_STAGE_SECONDS = Histogram(
+    'scrape_stage_seconds',
+    "Scraper._perform_scrape time by stage: headers (DNS, connect, TTFB), body download, parse",
+    ['stage'], buckets=FAST_BUCKETS + (5, 10))
+SCRAPE_REQUESTS = Counter('scrape_requests_total', "Page fetches by outcome", ['outcome'])
+SCRAPE_RESPONSE_BYTES = Counter('scrape_response_bytes_total', "Body bytes downloaded by the scraper")
+SCRAPES_IN_FLIGHT = Gauge('scrapes_in_flight', "Page fetches in progress", multiprocess_mode='livesum')
+
+LLM_REQUEST_SECONDS = Histogram(
+    'llm_request_seconds', "Claude call latency", ['operation', 'model'], buckets=SLOW_BUCKETS)
+LLM_REQUESTS = Counter('llm_requests_total', "Claude calls by outcome", ['operation', 'outcome'])
+LLM_TOKENS = Counter('llm_tokens_total', "Claude tokens", ['operation', 'direction'])
+LLM_IN_FLIGHT = Gauge('llm_requests_in_flight', "Claude calls in progress", ['operation'],
+                      multiprocess_mode='livesum')
+
+SERP_SECONDS = Histogram('serp_seconds', "google_search latency", ['source'], buckets=SLOW_BUCKETS)
+AUTH_VERIFY_SECONDS = Histogram(
+    'auth_verify_seconds', "Firebase ID token verification", ['source'], buckets=FAST_BUCKETS)
+DB_COMMIT_SECONDS = Histogram('db_commit_seconds', "Session commit, including the flush",
+                              buckets=FAST_BUCKETS)
+LLM_CACHE_EVENTS = Counter('llm_cache_events_total', "LLM response cache hits, misses, stores and evictions",
+                           ['event'])
+ITEM_CODEC_SECONDS = Histogram(
+    'item_codec_seconds', "ModelUrl.data JSON and compression, per row", ['direction'],
+    buckets=(.00005, .0001, .00025, .0005, .001, .0025, .005, .01, .05))
+
+
+@contextmanager
+def in_flight(gauge: Gauge):
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+@contextmanager
+def llm_call(operation: str, model: str):
+    """Times one Claude call; the caller records token usage on the returned dict."""
+    usage = {}
+    started = time.perf_counter()
+    outcome = 'error'
+    LLM_IN_FLIGHT.labels(operation).inc()
+    try:
+        yield usage
+        outcome = 'ok'
+    finally:
+        LLM_IN_FLIGHT.labels(operation).dec()
+        LLM_REQUEST_SECONDS.labels(operation, model).observe(time.perf_counter() - started)
+        LLM_REQUESTS.labels(operation, outcome).inc()
+        for direction in ('input', 'output'):
+            if usage.get(direction):
+                LLM_TOKENS.labels(operation, direction).inc(usage[direction])
+
+
+def _commit_started(session):
+    session.info['commit_started'] = time.perf_counter()
+
+
+def _commit_finished(session):
+    started = session.info.pop('commit_started', None)
+    if started is not None:
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+
+
+def instrument_sessions():
+    if not event.contains(Session, 'before_commit', _commit_started):
+        event.listen(Session, 'before_commit', _commit_started)
+        event.listen(Session, 'after_commit', _commit_finished)
+
+
+def _registry() -> CollectorRegistry:
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=MULTIPROC_DIR)
+        return registry
+    return REGISTRY
+
+
+def render() -> Tuple[bytes, str]:
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def counter_totals(counter: Counter, label: str) -> Dict[str, float]:
+    """A counter's totals by one of its labels, summed over every worker like render()."""
+    name = counter.describe()[0].name
+    totals = {}
+    for family in _registry().collect():
+        if family.name != name:
+            continue
+        for sample in family.samples:
+            if sample.name == f'{family.name}_total':
+                key = sample.labels[label]
+                totals[key] = totals.get(key, 0) + sample.value
+    return totals
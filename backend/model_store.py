@@ -0,0 +1,270 @@
+# Items live in ModelUrl rows and query runs in query_run; Model.data keeps only leftover model-level extras
+import json
+import logging
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm.attributes import flag_modified
+
+import fingerprint
+import query_history
+from compression import pack, raw_item, stored_sizes
+from models import db, Model, ModelUrl
+
+logger = logging.getLogger(__name__)
+
+INSERT_CHUNK = 1000
+
+
+def _rating_of(item: Dict[str, Any]) -> Optional[int]:
+    if isinstance(item.get('text_content-rating'), int):
+        return item['text_content-rating']
+    ratings = [v for k, v in item.items() if k.endswith('-rating') and isinstance(v, int)]
+    return ratings[-1] if ratings else None
+
+
+def _row_values(item: Dict[str, Any]) -> Dict[str, Any]:
+    data, packed = pack(item)
+    return {
+        "url": item.get('url'),
+        "scraped_at": item.get('scraped_at'),
+        "rating": _rating_of(item),
+        "simhash": item.get('simhash'),
+        "data": data,
+        "packed": packed,
+    }
+
+
+def load_blob(model: Model) -> Union[List, Dict]:
+    return json.loads(model.data) if model.data else []
+
+
+def _blob_items(blob: Union[List, Dict]) -> List:
+    if isinstance(blob, dict):
+        return blob.get('data', [])
+    return blob
+
+
+def migrate_model(model: Model) -> int:
+    """Move items still embedded in the Model.data blob into ModelUrl rows."""
+    blob = load_blob(model)
+    items = _blob_items(blob)
+    if not items:
+        return 0
+
+    # Legacy blobs could hold non-dict entries; kept rather than dropped, though with no url scrape skips them
+    add_items(model, [item if isinstance(item, dict) else {"value": item} for item in items])
+    if isinstance(blob, dict):
+        blob['data'] = []
+    else:
+        blob = []
+    model.data = json.dumps(blob)
+    logger.info(f"Migrated {len(items)} items of model {model.id} into model_url rows")
+    return len(items)
+
+
+def ensure_migrated(model: Model):
+    if migrate_model(model) + query_history.migrate_blob_queries(model):
+        db.session.commit()
+
+
+def migrate_all() -> int:
+    moved = 0
+    for model in Model.query.all():
+        moved += migrate_model(model) + query_history.migrate_blob_queries(model)
+        db.session.commit()
+    return moved
+
+
+def touch(model: Model):
+    # Incremented in SQL so concurrent writers (jobs, requests) never reuse a revision
+    model.revision = func.coalesce(Model.revision, 0) + 1
+
+
+def _next_position(model: Model) -> int:
+    # Bumping the revision first takes the model row's write lock (SQLite's database lock), held until
+    # commit, so concurrent appends to one model queue up here; the locking read then sees positions
+    # committed by the append ahead, even from inside an older REPEATABLE READ snapshot
+    if model.id is None:
+        db.session.flush()
+    touch(model)
+    db.session.flush()
+    last = db.session.query(func.max(ModelUrl.position)).filter(
+        ModelUrl.model_id == model.id).with_for_update().scalar()
+    return 0 if last is None else last + 1
+
+
+def add_items(model: Model, items: Iterable[Dict[str, Any]]) -> int:
+    # Inserted in chunks so a large streamed CSV never sits in memory as one list
+    items = iter(items)
+    chunk = list(islice(items, INSERT_CHUNK))
+    if not chunk:
+        return 0
+    position = _next_position(model)
+    added = 0
+    while chunk:
+        db.session.execute(insert(ModelUrl), [
+            {"model_id": model.id, "position": position + added + offset, **_row_values(item)}
+            for offset, item in enumerate(chunk)])
+        added += len(chunk)
+        chunk = list(islice(items, INSERT_CHUNK))
+    return added
+
+
+def add_item(model: Model, item: Dict[str, Any]) -> ModelUrl:
+    """Append one item and return its row; add_items is the bulk path."""
+    row = ModelUrl(model_id=model.id, position=_next_position(model), **_row_values(item))
+    db.session.add(row)
+    return row
+
+
+def rows(model: Model):
+    return ModelUrl.query.filter_by(model_id=model.id).order_by(ModelUrl.position)
+
+
+def count(model: Model) -> int:
+    return ModelUrl.query.filter_by(model_id=model.id).count()
+
+
+def has_url(model: Model, url: str) -> bool:
+    return db.session.query(ModelUrl.query.filter_by(model_id=model.id, url=url).exists()).scalar()
+
+
+def update_row(row: ModelUrl, updates: Dict[str, Any]):
+    # Assign a fresh dict so SQLAlchemy sees the JSON column change; untouched fields stay compressed
+    item = {**raw_item(row.data), **updates}
+    for key, value in _row_values(item).items():
+        setattr(row, key, value)
+    touch(row.model)
+
+
+def delete_rows(model: Model):
+    ModelUrl.query.filter_by(model_id=model.id).delete(synchronize_session=False)
+
+
+PAGE_FIELD_COLUMNS = {'url', 'scraped_at', 'rating'}
+SORT_COLUMNS = {
+    'position': ModelUrl.position,
+    'url': ModelUrl.url,
+    'scraped_at': ModelUrl.scraped_at,
+    'rating': ModelUrl.rating,
+}
+
+
+def page(model: Model, limit: int, offset: int = 0, after: Optional[int] = None,
+         fields: Optional[List[str]] = None, scraped: Optional[bool] = None,
+         rated: Optional[bool] = None, sort: str = 'position') -> Dict[str, Any]:
+    """One page of a model's items, filtered and sorted in SQL."""
+    query = ModelUrl.query.filter_by(model_id=model.id)
+    if scraped is not None:
+        query = query.filter(ModelUrl.scraped_at.isnot(None) if scraped else ModelUrl.scraped_at.is_(None))
+    if rated is not None:
+        query = query.filter(ModelUrl.rating.isnot(None) if rated else ModelUrl.rating.is_(None))
+    total = query.count()
+
+    descending = sort.startswith('-')
+    column = SORT_COLUMNS[sort.lstrip('-')]
+    if after is not None:
+        # Keyset pagination; only valid for position order, which the caller enforces
+        query = query.filter(ModelUrl.position > after)
+    order = [column.is_(None), column.desc() if descending else column.asc()]
+    query = query.order_by(*order, ModelUrl.position).offset(offset).limit(limit)
+
+    if fields and set(fields) <= PAGE_FIELD_COLUMNS:
+        # Everything asked for has its own column, so the JSON blobs are never loaded
+        columns = [ModelUrl.position] + [SORT_COLUMNS[field] for field in fields]
+        items = [dict(zip(['position'] + fields, values)) for values in query.with_entities(*columns)]
+    else:
+        items = []
+        for row in query:
+            item = row.data if not fields else {k: row.data[k] for k in fields if k in row.data}
+            items.append({"position": row.position, **item})
+
+    next_cursor = items[-1]['position'] if len(items) == limit and sort == 'position' else None
+    return {"items": items, "total": total, "next_cursor": next_cursor}
+
+
+def fingerprint_rows(model: Model, batch_size: int = 500) -> int:
+    """Fill in simhash for rows scraped before fingerprints were taken at scrape time."""
+    filled = 0
+    last_id = 0
+    while True:
+        batch = ModelUrl.query.filter(
+            ModelUrl.model_id == model.id, ModelUrl.id > last_id, ModelUrl.scraped_at.isnot(None),
+            ModelUrl.simhash.is_(None)).order_by(ModelUrl.id).limit(batch_size).all()
+        if not batch:
+            return filled
+        for row in batch:
+            # '' marks a page without text as done, so it isn't fingerprinted again
+            update_row(row, {"simhash": fingerprint.simhash_hex(row.data.get('text_content')) or ''})
+        filled += len(batch)
+        last_id = batch[-1].id
+        db.session.commit()
+
+
+def near_duplicates(model: Model, max_distance: int = fingerprint.DEFAULT_MAX_DISTANCE) -> Dict[str, Any]:
+    """Clusters of pages whose text_content fingerprints are within max_distance bits, largest first."""
+    pages = rows(model).filter(ModelUrl.simhash.isnot(None), ModelUrl.simhash != '').with_entities(
+        ModelUrl.position, ModelUrl.url, ModelUrl.simhash).all()
+    urls = {position: url for position, url, _ in pages}
+    duplicates = fingerprint.cluster(
+        ((position, fingerprint.from_hex(simhash)) for position, _, simhash in pages), max_distance)
+
+    clusters = {}
+    for position, (representative, distance) in duplicates.items():
+        clusters.setdefault(representative, []).append(
+            {"position": position, "url": urls[position], "distance": distance})
+    return {
+        "fingerprinted": len(pages),
+        "duplicate_count": len(duplicates),
+        "clusters": sorted(
+            ({"representative": {"position": position, "url": urls[position]},
+              "size": len(members) + 1, "members": members} for position, members in clusters.items()),
+            key=lambda cluster: (-cluster["size"], cluster["representative"]["position"])),
+    }
+
+
+def recompress(model: Model, batch_size: int = 500) -> int:
+    """Rewrite a model's rows so every large text field goes through the compressing column type."""
+    rewritten = 0
+    last_id = 0
+    while True:
+        batch = ModelUrl.query.filter(ModelUrl.model_id == model.id, ModelUrl.id > last_id).order_by(
+            ModelUrl.id).limit(batch_size).all()
+        if not batch:
+            return rewritten
+        for row in batch:
+            for key, value in _row_values(raw_item(row.data)).items():
+                setattr(row, key, value)
+            # Legacy base64 fields load as the same values they pack to, so force the UPDATE that moves them
+            flag_modified(row, 'data')
+        rewritten += len(batch)
+        last_id = batch[-1].id
+        db.session.commit()
+
+
+def storage_stats(model: Model) -> Dict[str, Any]:
+    totals = {"rows": 0, "stored": 0, "raw": 0, "compressed_fields": 0}
+    for data, packed in db.session.query(ModelUrl.data, ModelUrl.packed).filter_by(
+            model_id=model.id).yield_per(500):
+        data.attach(packed)
+        totals["rows"] += 1
+        for key, value in stored_sizes(data, packed).items():
+            totals[key] += value
+    return {
+        "rows": totals["rows"],
+        "stored_chars": totals["stored"],
+        "raw_chars": totals["raw"],
+        "compressed_fields": totals["compressed_fields"],
+        "ratio": round(totals["raw"] / totals["stored"], 2) if totals["stored"] else None,
+    }
+
+
+def model_payload(model: Model) -> Union[List, Dict]:
+    # Rebuild the legacy shape: a list of items, or {'data': items, ...extras}
+    blob = load_blob(model)
+    items = [row.data for row in rows(model)]
+    if isinstance(blob, dict):
+        return {**blob, 'data': items}
+    return items
@@ -1,5 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from sqlalchemy import event
+
+from compression import CompressedJSON, LazyItem
 
 db = SQLAlchemy()
 
@@ -20,13 +23,151 @@ class Model(db.Model):
     user_id = db.Column(db.String(128), db.ForeignKey(
         'user.id'), nullable=False)
     data = db.Column(db.JSON, nullable=False)
-    last_scraped_id = db.Column(db.Integer, default=0)
+    # Position a paused scrape stopped at, for resume; None once a scrape runs to the end
+    last_scraped_id = db.Column(db.Integer)
+    # Bumped on every change to the model or its rows; GET /api/models/<id> derives its ETag from it
+    revision = db.Column(db.Integer, default=0)
+    urls = db.relationship('ModelUrl', backref='model', lazy='dynamic',
+                           order_by='ModelUrl.position')
+
+
+class ModelUrl(db.Model):
+    # One row per URL in a model; `data` holds the full item dict (scraped fields, alt content, ratings)
+    __tablename__ = 'model_url'
+    __table_args__ = (
+        db.UniqueConstraint('model_id', 'position'),
+        # MySQL caps index keys at 3072 bytes (768 utf8mb4 characters), so long URLs are indexed by prefix
+        db.Index('ix_model_url_model_url', 'model_id', 'url', mysql_length={'url': 700}),
+        db.Index('ix_model_url_model_scraped_at', 'model_id', 'scraped_at'),
+        db.Index('ix_model_url_model_rating', 'model_id', 'rating'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    model_id = db.Column(db.Integer, db.ForeignKey('model.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    url = db.Column(db.String(2048))
+    scraped_at = db.Column(db.String(32))
+    rating = db.Column(db.Integer)
+    # SimHash of text_content as 16 hex digits (see fingerprint.py), for near-duplicate lookups
+    simhash = db.Column(db.String(16))
+    data = db.Column(CompressedJSON, nullable=False)
+    # zlib streams of data's large text fields (see compression.py); a length makes MySQL use LONGBLOB
+    packed = db.Column(db.LargeBinary(2 ** 32 - 1))
+
+
+@event.listens_for(ModelUrl, 'load')
+def _attach_packed(row, context):
+    if isinstance(row.data, LazyItem):
+        row.data.attach(row.packed)
+
+
+@event.listens_for(ModelUrl, 'refresh')
+def _reattach_packed(row, context, attrs):
+    _attach_packed(row, context)
 
 
 class CSV(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(100), nullable=False)
+    # Legacy uploads keep the file inline; new ones live on disk at `path` and leave this empty
     content = db.Column(db.Text, nullable=False)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.String(128), db.ForeignKey(
         'user.id'), nullable=False)
+    path = db.Column(db.String(512))
+    size_bytes = db.Column(db.BigInteger)
+    delimiter = db.Column(db.String(4))
+    columns = db.Column(db.JSON)
+    row_count = db.Column(db.Integer)
+
+
+class Job(db.Model):
+    # Background scrape/generate/rate run; the table doubles as the work queue
+    id = db.Column(db.String(36), primary_key=True)
+    kind = db.Column(db.String(32), nullable=False)
+    model_id = db.Column(db.Integer, db.ForeignKey('model.id'), nullable=False, index=True)
+    user_id = db.Column(db.String(128), db.ForeignKey('user.id'), nullable=False, index=True)
+    status = db.Column(db.String(16), nullable=False, default='queued', index=True)
+    params = db.Column(db.JSON, nullable=False)
+    progress = db.Column(db.Integer, default=0)
+    total = db.Column(db.Integer)
+    cursor = db.Column(db.Integer, default=-1)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    cancel_requested = db.Column(db.Boolean, default=False)
+    worker = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+
+class LLMCacheEntry(db.Model):
+    # Claude responses keyed by a hash of everything that determines the output
+    __tablename__ = 'llm_cache'
+
+    key = db.Column(db.String(64), primary_key=True)
+    model = db.Column(db.String(100), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    tokens_generated = db.Column(db.Integer, default=0)
+    input_tokens = db.Column(db.Integer, default=0)
+    hits = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+class QueryRun(db.Model):
+    # One /test run; replaces the ever-growing 'queries' list in Model.data
+    __tablename__ = 'query_run'
+    __table_args__ = (
+        db.Index('ix_query_run_model_query_created', 'model_id', 'query_text', 'created_at'),
+        db.Index('ix_query_run_model_highlighted_created', 'model_id', 'highlighted_url', 'created_at',
+                 mysql_length={'highlighted_url': 700}),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    model_id = db.Column(db.Integer, db.ForeignKey('model.id'), nullable=False)
+    query_text = db.Column(db.String(500), nullable=False)
+    method = db.Column(db.String(16), nullable=False)
+    highlighted_url = db.Column(db.String(768))
+    highlighted_rank = db.Column(db.Integer)
+    parameters = db.Column(db.JSON)
+    results = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class QueryRankDaily(db.Model):
+    # Per-day rollup of query runs older than the raw retention window
+    __tablename__ = 'query_rank_daily'
+    __table_args__ = (
+        # A unique index rather than a constraint so MySQL can take key prefixes (3072-byte limit)
+        db.Index('uq_query_rank_daily_key', 'model_id', 'query_text', 'method', 'highlighted_url', 'day',
+                 unique=True, mysql_length={'query_text': 255, 'highlighted_url': 480}),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    model_id = db.Column(db.Integer, db.ForeignKey('model.id'), nullable=False)
+    query_text = db.Column(db.String(500), nullable=False)
+    method = db.Column(db.String(16), nullable=False)
+    highlighted_url = db.Column(db.String(768))
+    day = db.Column(db.Date, nullable=False)
+    runs = db.Column(db.Integer, default=0)
+    ranked_runs = db.Column(db.Integer, default=0)
+    rank_sum = db.Column(db.Integer, default=0)
+    best_rank = db.Column(db.Integer)
+    worst_rank = db.Column(db.Integer)
+
+
+class SerpCacheEntry(db.Model):
+    # Parsed search result pages, shared by all workers; rank checks are computed against these
+    __tablename__ = 'serp_cache'
+    __table_args__ = (
+        db.Index('ix_serp_cache_query_fetched', 'query_norm', 'fetched_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    query_norm = db.Column(db.String(500), nullable=False)
+    depth = db.Column(db.Integer, nullable=False)
+    results = db.Column(db.JSON, nullable=False)
+    hits = db.Column(db.Integer, default=0)
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
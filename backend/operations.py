@@ -0,0 +1,560 @@
+# Long-running model operations, shared by the HTTP endpoints and the background job runner.
+# Each one is a generator of events: an optional 'start' with the item total, one 'item' per
+# processed URL and a final 'summary', plus 'progress' and 'checkpoint' events along the way.
+# Callers decide when to commit, and should commit on 'checkpoint'.
+import hashlib
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import crawler
+import fingerprint
+import llm_cache
+import model_store
+from llm import (DEFAULT_LLM_CONCURRENCY, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE,
+                 RATING_MAX_TOKENS, RATING_SYSTEM_PROMPT, LLMDispatcher, MessageBatchRunner,
+                 estimate_tokens, generate_claude_response, generate_content_rating, get_batches,
+                 get_client, get_rate_limiter, is_api_error, parse_rating, rating_request)
+from models import Model, ModelUrl
+from scraper import Scraper
+
+logger = logging.getLogger(__name__)
+
+Event = Dict[str, Any]
+
+# Scrapes emit a 'checkpoint' event this often; callers commit on it so a killed worker keeps its progress
+CHECKPOINT_EVERY = int(os.environ.get('SCRAPE_CHECKPOINT_EVERY', 25))
+CHECKPOINT_SECONDS = float(os.environ.get('SCRAPE_CHECKPOINT_SECONDS', 15))
+
+
+def _item_event(row: ModelUrl, status: str, message: str, **extra) -> Event:
+    return {"event": "item", "position": row.position, "url": row.data.get('url'),
+            "status": status, "message": message, **extra}
+
+
+def _near_duplicates(rows, content_type: str, max_distance: int) -> Dict[int, Tuple[ModelUrl, int]]:
+    """row.id -> (representative row, distance) for rows whose content nearly matches an earlier row's."""
+    by_id = {row.id: row for row in rows}
+
+    def row_fingerprint(row):
+        # text_content fingerprints are taken at scrape time; anything else is computed here
+        if content_type == 'text_content' and row.simhash:
+            return fingerprint.from_hex(row.simhash)
+        content = row.data.get(content_type)
+        return fingerprint.simhash(content) if isinstance(content, str) else None
+
+    duplicates = fingerprint.cluster(((row.id, row_fingerprint(row)) for row in rows), max_distance)
+    return {row_id: (by_id[rep_id], d) for row_id, (rep_id, d) in duplicates.items()}
+
+
+def _mark_duplicate(row: ModelUrl, representative: Optional[ModelUrl]):
+    url = representative.data.get('url') if representative is not None else None
+    if row.data.get('duplicate_of') != url:
+        model_store.update_row(row, {"duplicate_of": url})
+
+
+def run_scrape(model: Model, params: Dict[str, Any], start_position: int = 0) -> Iterator[Event]:
+    rescrape = params.get('rescrape', False)
+    # Counts URLs actually fetched, not rows passed over because they were already scraped
+    limit = params.get('limit', 100)
+    delay = params.get('delay', 0.1)
+    concurrency = params.get('concurrency', 1)
+    checkpoint_every = params.get('checkpointEvery', CHECKPOINT_EVERY)
+    checkpoint_seconds = params.get('checkpointSeconds', CHECKPOINT_SECONDS)
+    max_seconds = params.get('maxSeconds')
+
+    scraper = Scraper()
+    model_store.ensure_migrated(model)
+
+    if params.get('resume') and model.last_scraped_id is not None:
+        # Unscraped rows are picked up anyway; this matters for rescrapes, which revisit every row
+        start_position = max(start_position, model.last_scraped_id + 1)
+
+    # Only the rows being scraped are loaded and written back
+    query = model_store.rows(model).filter(
+        ModelUrl.position >= start_position, ModelUrl.url.isnot(None))
+    if not rescrape:
+        query = query.filter(ModelUrl.scraped_at.is_(None))
+    # One past the limit shows whether rows are left for a resumed call
+    targets = query.limit(limit + 1).all()
+    more = len(targets) > limit
+    targets = targets[:limit]
+    yield {"event": "start", "total": len(targets)}
+
+    # Fetches run concurrently; results come back in the same order as targets
+    # Previously scraped items carry ETag/Last-Modified/content hash for a conditional GET
+    results = scraper.scrape_many(
+        ((row.data['url'], row.data if 'scraped_at' in row.data else None) for row in targets),
+        model.base_url, concurrency=concurrency, delay=delay)
+
+    last_scraped_id = model.last_scraped_id
+    fetched_count = 0
+    unchanged_count = 0
+    started = last_checkpoint = time.monotonic()
+    since_checkpoint = 0
+    complete = True
+
+    try:
+        for row in targets:
+            if max_seconds and time.monotonic() - started >= max_seconds:
+                # Stop cleanly inside the caller's time budget; the next call carries on from here
+                complete = False
+                break
+
+            i = row.position
+            url = row.data['url']
+            scraped_data = next(results)
+            elapsed_ms = scraped_data.pop('elapsed_ms', None)
+            fetched_count += 1
+
+            if 'error' in scraped_data:
+                error_message = f"Failed to scrape {url}: {scraped_data['error']}"
+                logger.error(error_message)
+                event = _item_event(row, 'error', error_message, elapsed_ms=elapsed_ms)
+            elif scraped_data.pop('unchanged', False):
+                model_store.update_row(row, scraped_data)
+                unchanged_count += 1
+                event = _item_event(row, 'unchanged', f"Unchanged since last scrape: {url}",
+                                    elapsed_ms=elapsed_ms)
+            else:
+                model_store.update_row(row, scraped_data)
+                event = _item_event(row, 'scraped', f"Successfully scraped: {url}",
+                                    elapsed_ms=elapsed_ms)
+
+            last_scraped_id = i
+            model.last_scraped_id = last_scraped_id
+            yield event
+
+            since_checkpoint += 1
+            if since_checkpoint >= checkpoint_every or time.monotonic() - last_checkpoint >= checkpoint_seconds:
+                yield {"event": "checkpoint", "last_scraped_id": last_scraped_id, "fetched": fetched_count}
+                since_checkpoint = 0
+                last_checkpoint = time.monotonic()
+    finally:
+        results.close()
+
+    complete = complete and not more
+    if complete:
+        # Nothing left to resume; position 0 is a real position, so "none" is None
+        last_scraped_id = model.last_scraped_id = None
+    yield {
+        "event": "summary",
+        "message": "Scraping completed" if complete else "Scraping paused; call again with resume to continue",
+        "complete": complete,
+        "last_scraped_id": last_scraped_id,
+        "fetched_count": fetched_count,
+        "unchanged_count": unchanged_count
+    }
+
+
+def run_crawl(model: Model, params: Dict[str, Any], start_position: int = 0) -> Iterator[Event]:
+    # start_position is unused: a resumed crawl starts over from base_url and skips every URL already in
+    # the model, so links are only followed from pages it fetches itself
+    crawl = crawler.Crawler(
+        model.base_url,
+        max_urls=params.get('maxUrls', crawler.DEFAULT_MAX_URLS),
+        max_depth=params.get('maxDepth', crawler.DEFAULT_MAX_DEPTH),
+        use_sitemaps=params.get('sitemaps', True),
+        follow_links=params.get('followLinks', True),
+        respect_robots=params.get('respectRobots', True))
+    checkpoint_every = params.get('checkpointEvery', CHECKPOINT_EVERY)
+    checkpoint_seconds = params.get('checkpointSeconds', CHECKPOINT_SECONDS)
+
+    model_store.ensure_migrated(model)
+    crawl.mark_seen(url for (url,) in model_store.rows(model).with_entities(ModelUrl.url).yield_per(1000))
+    yield {"event": "start", "total": crawl.max_urls}
+
+    added_count = 0
+    error_count = 0
+    last_checkpoint = time.monotonic()
+    since_checkpoint = 0
+    pages = crawl.crawl(concurrency=params.get('concurrency', 4), delay=params.get('delay', 0.1))
+    try:
+        for url, depth, source, scraped_data in pages:
+            elapsed_ms = scraped_data.pop('elapsed_ms', None)
+            item = {"url": url, "additional_data": {"crawl_depth": depth, "crawl_source": source}}
+            if 'error' in scraped_data:
+                # Kept unscraped, so a later scrape retries it
+                error_count += 1
+                status, message = 'error', f"Failed to scrape {url}: {scraped_data['error']}"
+                logger.error(message)
+            else:
+                item.update(scraped_data)
+                status, message = 'scraped', f"Crawled {url} (depth {depth}, from {source})"
+            row = model_store.add_item(model, item)
+            added_count += 1
+            yield _item_event(row, status, message, depth=depth, source=source, elapsed_ms=elapsed_ms)
+
+            since_checkpoint += 1
+            if since_checkpoint >= checkpoint_every or time.monotonic() - last_checkpoint >= checkpoint_seconds:
+                yield {"event": "checkpoint", "added": added_count}
+                since_checkpoint = 0
+                last_checkpoint = time.monotonic()
+    finally:
+        pages.close()
+
+    yield {
+        "event": "summary",
+        "message": "Crawl completed",
+        "added_count": added_count,
+        "error_count": error_count,
+        **{f"{key}_count": value for key, value in crawl.stats.items()},
+    }
+
+
+def _alt_content_version(item: Dict[str, Any], content: str) -> Tuple[int, bool]:
+    # Identical output is not stored again as a new version
+    version = 0
+    while f'alt-content-{version}' in item:
+        if item[f'alt-content-{version}'] == content:
+            return version, False
+        version += 1
+    return version, True
+
+
+def run_generate(model: Model, params: Dict[str, Any], start_position: int = 0) -> Iterator[Event]:
+    api_key = params.get('apiKey')
+    prompt = params.get('prompt')
+    claude_model = params.get('model', "claude-3-sonnet-20240229")
+    rate_limit = params.get('rateLimit', 10)
+    max_tokens = params.get('maxTokens', 8000)
+    temperature = params.get('temperature', 0)
+    use_cache = params.get('useCache', True)
+    # 'fanout' sends one page per near-duplicate cluster and copies its output to the rest;
+    # 'flag' only marks the rest with duplicate_of and skips them
+    dedupe = params.get('dedupe', 'off')
+    max_distance = params.get('maxDistance', fingerprint.DEFAULT_MAX_DISTANCE)
+
+    logger.info(f"Starting alt content generation for model {model.id}")
+    logger.info(f"Using Claude model: {claude_model}")
+
+    model_store.ensure_migrated(model)
+    processed_count = 0
+    cached_count = 0
+    duplicate_count = 0
+    total_tokens_generated = 0
+
+    client = get_client(api_key)
+    limiter = get_rate_limiter(
+        api_key,
+        params.get('requestsPerMinute', DEFAULT_REQUESTS_PER_MINUTE),
+        params.get('tokensPerMinute', DEFAULT_TOKENS_PER_MINUTE))
+    dispatcher = LLMDispatcher(limiter, params.get('concurrency', DEFAULT_LLM_CONCURRENCY))
+
+    # rateLimit caps how many items with text are processed, cached or not
+    selected = []
+    with_text = 0
+    for row in model_store.rows(model).filter(ModelUrl.position >= start_position):
+        if with_text >= rate_limit:
+            break
+        selected.append(row)
+        with_text += 'text_content' in row.data
+    yield {"event": "start", "total": len(selected)}
+
+    with_content = [row for row in selected if 'text_content' in row.data]
+    duplicates = _near_duplicates(with_content, 'text_content', max_distance) if dedupe != 'off' else {}
+    # A fanned-out duplicate is keyed by its representative's text, so it reuses that result
+    sources = {row.id: duplicates.get(row.id, (row,))[0].data['text_content'] for row in with_content
+               if not (dedupe == 'flag' and row.id in duplicates)}
+    keys = {row_id: llm_cache.cache_key(claude_model, prompt, text, max_tokens, temperature)
+            for row_id, text in sources.items()}
+    cached = llm_cache.lookup(keys.values()) if use_cache else {}
+
+    # Each distinct input is sent once, so pages sharing boilerplate content share a call
+    to_send = {}
+    for row in selected:
+        key = keys.get(row.id)
+        if key is not None and key not in cached and key not in to_send:
+            to_send[key] = sources[row.id]
+
+    results = dispatcher.map(
+        lambda text: generate_claude_response(client, prompt, text, claude_model, max_tokens, temperature),
+        to_send.values(),
+        estimate=lambda text: estimate_tokens(prompt, text),
+        usage=lambda result: result['input_tokens'] + result['tokens_generated'])
+
+    fresh = {}
+    failed = set()
+    try:
+        for row in selected:
+            item = row.data
+            if 'text_content' not in item:
+                message = f"Skipped item: No text content available for URL {item.get('url', 'Unknown URL')}"
+                logger.warning(message)
+                yield _item_event(row, 'skipped', message)
+                continue
+
+            representative, distance = duplicates.get(row.id, (None, None))
+            if dedupe != 'off':
+                _mark_duplicate(row, representative)
+            if dedupe == 'flag' and representative is not None:
+                duplicate_count += 1
+                message = (f"Skipped item: {item.get('url', 'Unknown URL')} is a near-duplicate of "
+                           f"{representative.data.get('url')} (distance {distance})")
+                yield _item_event(row, 'duplicate', message, duplicate_of=representative.data.get('url'))
+                continue
+
+            key = keys[row.id]
+            if representative is not None and (key in cached or key in fresh):
+                entry = cached[key] if key in cached else fresh[key]
+                version, is_new = _alt_content_version(item, entry.content)
+                if is_new:
+                    model_store.update_row(row, {f'alt-content-{version}': entry.content})
+                duplicate_count += 1
+                message = (f"Copied alt content to {item.get('url', 'Unknown URL')} from near-duplicate "
+                           f"{representative.data.get('url')} (distance {distance}, alt-content-{version})")
+                yield _item_event(row, 'duplicate', message, tokens=0, duplicate_of=representative.data.get('url'))
+                continue
+
+            if key in cached or key in fresh:
+                if key in cached:
+                    entry = cached[key]
+                    llm_cache.record_hit(entry)
+                else:
+                    entry = fresh[key]
+                version, is_new = _alt_content_version(item, entry.content)
+                if is_new:
+                    model_store.update_row(row, {f'alt-content-{version}': entry.content})
+                cached_count += 1
+                message = f"Reused cached alt content for URL: {item.get('url', 'Unknown URL')} (alt-content-{version})"
+                logger.info(message)
+                yield _item_event(row, 'cached', message, tokens=0)
+                continue
+
+            if key in failed:
+                message = f"Skipped item: generation already failed for identical content at URL {item.get('url', 'Unknown URL')}"
+                yield _item_event(row, 'error', message)
+                continue
+
+            alt_content, error, elapsed_ms = next(results)
+            if use_cache:
+                llm_cache.record_miss()
+
+            if is_api_error(error):
+                error_message = f"Anthropic API error for URL {item.get('url', 'Unknown URL')}: {str(error)}"
+                logger.error(error_message)
+                yield _item_event(row, 'error', error_message, elapsed_ms=elapsed_ms)
+                break  # Stop processing if we encounter a non-retryable API error
+            if error is not None:
+                failed.add(key)
+                error_message = f"Error generating alt content for URL {item.get('url', 'Unknown URL')}: {str(error)}"
+                logger.error(error_message)
+                yield _item_event(row, 'error', error_message, elapsed_ms=elapsed_ms)
+                continue
+
+            fresh[key] = llm_cache.store(key, claude_model, alt_content)
+            version, is_new = _alt_content_version(item, alt_content['content'])
+            if is_new:
+                model_store.update_row(row, {f'alt-content-{version}': alt_content['content']})
+            tokens_generated = alt_content['tokens_generated']
+            total_tokens_generated += tokens_generated
+
+            message = f"Generated alt-content-{version} for URL: {item.get('url', 'Unknown URL')}. Tokens: {tokens_generated}"
+            logger.info(message)
+            processed_count += 1
+            yield _item_event(row, 'generated', message, tokens=tokens_generated,
+                              input_tokens=alt_content['input_tokens'], elapsed_ms=elapsed_ms)
+    finally:
+        results.close()
+
+    llm_cache.prune()
+    logger.info(
+        f"Alt content generation completed. Total tokens generated: {total_tokens_generated}")
+    yield {
+        "event": "summary",
+        "message": "Alt content generation completed",
+        "processed_count": processed_count,
+        "cached_count": cached_count,
+        "duplicate_count": duplicate_count,
+        "total_tokens_generated": total_tokens_generated
+    }
+
+
+def _content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def run_rate(model: Model, params: Dict[str, Any], start_position: int = 0) -> Iterator[Event]:
+    api_key = params.get('apiKey')
+    content_type = params.get('contentType')
+    rating_method = params.get('ratingMethod')
+    # Incremental runs skip items whose content hasn't changed since it was last rated
+    incremental = params.get('incremental', True)
+    use_batch = params.get('batch', False)
+    dedupe = params.get('dedupe', 'off')
+    max_distance = params.get('maxDistance', fingerprint.DEFAULT_MAX_DISTANCE)
+
+    logger.info(
+        f"Rating content of type {content_type} using method {rating_method}")
+
+    model_store.ensure_migrated(model)
+    total_rated = 0
+    unchanged_count = 0
+    duplicate_count = 0
+    rating_key = f'{content_type}-rating'
+    hash_key = f'{content_type}-rating-hash'
+
+    client = get_client(api_key)
+    limiter = get_rate_limiter(
+        api_key,
+        params.get('requestsPerMinute', DEFAULT_REQUESTS_PER_MINUTE),
+        params.get('tokensPerMinute', DEFAULT_TOKENS_PER_MINUTE))
+    dispatcher = LLMDispatcher(limiter, params.get('concurrency', DEFAULT_LLM_CONCURRENCY))
+
+    rows = model_store.rows(model).filter(ModelUrl.position >= start_position).all()
+    yield {"event": "start", "total": len(rows)}
+
+    with_content = [row for row in rows
+                    if isinstance(row.data.get(content_type), str) and row.data[content_type].strip()]
+    duplicates = _near_duplicates(with_content, content_type, max_distance) if dedupe != 'off' else {}
+    # Ratings still current on their own row; a fanned-out duplicate can take its representative's
+    current = {_content_hash(row.data[content_type]): row.data[rating_key] for row in with_content
+               if incremental and rating_key in row.data
+               and row.data.get(hash_key) == _content_hash(row.data[content_type])}
+
+    # Distinct contents that need a rating, keyed by hash so duplicate pages share one call.
+    # Fanned-out duplicates are rated on their representative's content.
+    to_rate = {}
+    for row in with_content:
+        content_hash = _content_hash(row.data[content_type])
+        if incremental and rating_key in row.data and row.data.get(hash_key) == content_hash:
+            continue
+        if row.id in duplicates:
+            if dedupe == 'flag':
+                continue
+            source = duplicates[row.id][0].data[content_type]
+            if _content_hash(source) in current:
+                continue
+        else:
+            source = row.data[content_type]
+        to_rate.setdefault(_content_hash(source), source)
+
+    outcomes = {}
+    results = None
+    if use_batch and to_rate:
+        runner = MessageBatchRunner(get_batches(client, dispatcher))
+        batch_ids = runner.submit({h: rating_request(content) for h, content in to_rate.items()})
+        for status in runner.wait(batch_ids):
+            yield {"event": "progress", "message": status}
+        for content_hash, (text, error) in runner.results(batch_ids).items():
+            try:
+                outcomes[content_hash] = (parse_rating(text), None, None) if error is None else (None, error, None)
+            except ValueError as e:
+                outcomes[content_hash] = (None, e, None)
+    elif to_rate:
+        results = dispatcher.map(
+            lambda content: generate_content_rating(api_key, content, rating_method, client=client),
+            to_rate.values(),
+            estimate=lambda content: estimate_tokens(RATING_SYSTEM_PROMPT, content) + RATING_MAX_TOKENS)
+
+    try:
+        for row in rows:
+            item = row.data
+            content = item.get(content_type)
+            if content is None:
+                logger.warning(
+                    f"No {content_type} found for URL {item.get('url', 'Unknown URL')}")
+                yield _item_event(row, 'skipped',
+                                  f"Skipped rating for URL {item.get('url', 'Unknown URL')}: No {content_type} found")
+                continue
+
+            if not content.strip():
+                logger.warning(
+                    f"Empty {content_type} found for URL {item.get('url', 'Unknown URL')}")
+                yield _item_event(row, 'skipped',
+                                  f"Skipped rating for URL {item.get('url', 'Unknown URL')}: Empty {content_type}")
+                continue
+
+            content_hash = _content_hash(content)
+            representative, distance = duplicates.get(row.id, (None, None))
+            if dedupe != 'off':
+                _mark_duplicate(row, representative)
+            if incremental and rating_key in item and item.get(hash_key) == content_hash:
+                unchanged_count += 1
+                yield _item_event(row, 'unchanged',
+                                  f"Kept rating for URL {item.get('url', 'Unknown URL')}: {content_type} unchanged",
+                                  rating=item.get(rating_key))
+                continue
+
+            if representative is not None:
+                duplicate_count += 1
+                duplicate_of = representative.data.get('url')
+                if dedupe == 'flag':
+                    yield _item_event(row, 'duplicate',
+                                      f"Skipped rating for URL {item.get('url', 'Unknown URL')}: near-duplicate of "
+                                      f"{duplicate_of} (distance {distance})", duplicate_of=duplicate_of)
+                    continue
+                source_hash = _content_hash(representative.data[content_type])
+                if source_hash in current:
+                    outcome = (current[source_hash], None, None)
+                else:
+                    # In batch mode outcomes already holds every result the batch returned
+                    if source_hash not in outcomes and results is not None:
+                        outcomes[source_hash] = next(results)
+                    outcome = outcomes.get(source_hash, (None, "No result returned", None))
+                rating, error, _ = outcome
+                if error is not None:
+                    error_message = (f"Error rating {content_type} for URL {item.get('url', 'Unknown URL')} "
+                                     f"via near-duplicate {duplicate_of}: {str(error)}")
+                    logger.error(error_message)
+                    yield _item_event(row, 'error', error_message)
+                    continue
+                model_store.update_row(row, {rating_key: rating, hash_key: content_hash})
+                yield _item_event(row, 'duplicate',
+                                  f"Copied rating for URL {item.get('url', 'Unknown URL')} from near-duplicate "
+                                  f"{duplicate_of} (distance {distance}): {rating}/100",
+                                  rating=rating, duplicate_of=duplicate_of)
+                continue
+
+            # Results arrive in first-occurrence order, so each hash is fetched exactly once
+            if content_hash not in outcomes and results is not None:
+                outcomes[content_hash] = next(results)
+            rating, error, elapsed_ms = outcomes.get(content_hash, (None, "No result returned", None))
+
+            if error is not None:
+                error_message = f"Error rating {content_type} for URL {item.get('url', 'Unknown URL')}: {str(error)}"
+                logger.error(error_message)
+                yield _item_event(row, 'error', error_message)
+                continue
+
+            model_store.update_row(row, {rating_key: rating, hash_key: content_hash})
+            total_rated += 1
+            message = f"Rated {content_type} for URL {item.get('url', 'Unknown URL')}: {rating}/100"
+            logger.info(message)
+            yield _item_event(row, 'rated', message, rating=rating, elapsed_ms=elapsed_ms)
+    finally:
+        if results is not None:
+            results.close()
+
+    if total_rated > 0:
+        logger.info(
+            f"Successfully rated {total_rated} items for model {model.id}")
+    else:
+        logger.warning(
+            f"No content of type {content_type} found to rate in model {model.id}")
+
+    yield {"event": "summary", "total_rated": total_rated, "unchanged_count": unchanged_count,
+           "duplicate_count": duplicate_count}
+
+
+OPERATIONS = {
+    'scrape': run_scrape,
+    'crawl': run_crawl,
+    'generate': run_generate,
+    'rate': run_rate,
+}
+
+
+def collect(events: Iterator[Event], checkpoint: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    """Drain an operation into the classic synchronous response body."""
+    messages = []
+    summary = {}
+    for event in events:
+        if event['event'] == 'item':
+            messages.append(event['message'])
+        elif event['event'] == 'checkpoint' and checkpoint is not None:
+            checkpoint()
+        elif event['event'] == 'summary':
+            summary = {k: v for k, v in event.items() if k != 'event'}
+    return {**summary, "messages": messages}
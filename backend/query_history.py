@@ -0,0 +1,159 @@
+# Rank-check history for /api/models/<id>/test. Each run is one insert; runs older than the
+# retention window are folded into per-day rollups by `flask rollup-query-history`, which the
+# app never runs itself: schedule it daily with cron (see README, Maintenance).
+import json
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from models import db, Model, QueryRankDaily, QueryRun
+
+logger = logging.getLogger(__name__)
+
+RAW_RETENTION = timedelta(days=int(os.environ.get('QUERY_HISTORY_RAW_DAYS', 30)))
+ROLLUP_RETENTION = timedelta(days=int(os.environ.get('QUERY_HISTORY_ROLLUP_DAYS', 730)))
+MAX_QUERY_LENGTH = 500
+MAX_URL_LENGTH = 768
+
+
+def highlighted_rank(results: List[Dict[str, Any]], highlighted_url: Optional[str]) -> Optional[int]:
+    if not highlighted_url:
+        return None
+    for result in results:
+        if result.get('url') == highlighted_url and isinstance(result.get('rank'), int):
+            return result['rank']
+    for position, result in enumerate(results, 1):
+        if result.get('url') == highlighted_url and 'rank' not in result:
+            return position
+    return None
+
+
+def record_run(model: Model, query: str, method: str, results: List[Dict[str, Any]],
+               parameters: Dict[str, Any], created_at: Optional[datetime] = None) -> QueryRun:
+    highlighted_url = parameters.get('highlighted_url') or None
+    run = QueryRun(
+        model_id=model.id, query_text=query.strip()[:MAX_QUERY_LENGTH], method=method,
+        highlighted_url=highlighted_url[:MAX_URL_LENGTH] if highlighted_url else None,
+        highlighted_rank=highlighted_rank(results, highlighted_url),
+        parameters=parameters, results=results, created_at=created_at or datetime.utcnow())
+    db.session.add(run)
+    return run
+
+
+def migrate_blob_queries(model: Model) -> int:
+    """Move a legacy 'queries' list out of Model.data into query_run rows."""
+    blob = json.loads(model.data) if model.data else []
+    if not isinstance(blob, dict) or 'queries' not in blob:
+        return 0
+
+    queries = blob.pop('queries') or []
+    for entry in queries:
+        try:
+            created_at = datetime.fromisoformat(entry['timestamp'])
+        except (KeyError, TypeError, ValueError):
+            created_at = None
+        record_run(model, entry.get('query') or '', entry.get('method') or 'google',
+                   entry.get('results') or [], entry.get('parameters') or {}, created_at)
+    model.data = json.dumps(blob)
+    logger.info(f"Moved {len(queries)} query runs of model {model.id} into query_run")
+    return len(queries)
+
+
+def run_to_dict(run: QueryRun) -> Dict[str, Any]:
+    return {
+        "id": run.id,
+        "query": run.query_text,
+        "method": run.method,
+        "timestamp": run.created_at.isoformat(),
+        "highlighted_url": run.highlighted_url,
+        "highlighted_rank": run.highlighted_rank,
+        "parameters": run.parameters,
+        "results": run.results,
+    }
+
+
+def recent_runs(model: Model, limit: int, query: Optional[str] = None,
+                before_id: Optional[int] = None) -> List[QueryRun]:
+    runs = QueryRun.query.filter_by(model_id=model.id)
+    if query:
+        runs = runs.filter_by(query_text=query.strip())
+    if before_id:
+        runs = runs.filter(QueryRun.id < before_id)
+    return runs.order_by(QueryRun.id.desc()).limit(limit).all()
+
+
+def rank_history(model: Model, highlighted_url: str, query: Optional[str] = None,
+                 days: int = 90) -> Dict[str, List[Dict[str, Any]]]:
+    """Rank series per query for one highlighted URL: rollups for old days, raw runs after."""
+    since = datetime.utcnow() - timedelta(days=days)
+    series = defaultdict(list)
+
+    daily = QueryRankDaily.query.filter(
+        QueryRankDaily.model_id == model.id, QueryRankDaily.highlighted_url == highlighted_url,
+        QueryRankDaily.day >= since.date())
+    if query:
+        daily = daily.filter(QueryRankDaily.query_text == query.strip())
+    for day in daily.order_by(QueryRankDaily.day):
+        series[day.query_text].append({
+            "timestamp": day.day.isoformat(),
+            "rank": round(day.rank_sum / day.ranked_runs, 1) if day.ranked_runs else None,
+            "best_rank": day.best_rank,
+            "worst_rank": day.worst_rank,
+            "runs": day.runs,
+            "rollup": True,
+        })
+
+    raw = db.session.query(QueryRun.query_text, QueryRun.created_at, QueryRun.highlighted_rank).filter(
+        QueryRun.model_id == model.id, QueryRun.highlighted_url == highlighted_url,
+        QueryRun.created_at >= since)
+    if query:
+        raw = raw.filter(QueryRun.query_text == query.strip())
+    for run_query, created_at, rank in raw.order_by(QueryRun.created_at):
+        series[run_query].append({"timestamp": created_at.isoformat(), "rank": rank})
+
+    return dict(series)
+
+
+def rollup(now: Optional[datetime] = None) -> Dict[str, int]:
+    """Fold raw runs past RAW_RETENTION into daily rows and drop rollups past ROLLUP_RETENTION."""
+    now = now or datetime.utcnow()
+    cutoff = now - RAW_RETENTION
+    groups = defaultdict(lambda: {"runs": 0, "ranked_runs": 0, "rank_sum": 0, "ranks": []})
+    old = db.session.query(QueryRun.model_id, QueryRun.query_text, QueryRun.method, QueryRun.highlighted_url,
+                           QueryRun.created_at, QueryRun.highlighted_rank).filter(QueryRun.created_at < cutoff)
+    for model_id, query, method, highlighted_url, created_at, rank in old.yield_per(1000):
+        group = groups[(model_id, query, method, highlighted_url, created_at.date())]
+        group["runs"] += 1
+        if rank is not None:
+            group["ranked_runs"] += 1
+            group["rank_sum"] += rank
+            group["ranks"].append(rank)
+
+    for (model_id, query, method, highlighted_url, day), group in groups.items():
+        row = QueryRankDaily.query.filter_by(model_id=model_id, query_text=query, method=method,
+                                             highlighted_url=highlighted_url, day=day).first()
+        if row is None:
+            row = QueryRankDaily(model_id=model_id, query_text=query, method=method,
+                                 highlighted_url=highlighted_url, day=day,
+                                 runs=0, ranked_runs=0, rank_sum=0)
+            db.session.add(row)
+        row.runs += group["runs"]
+        row.ranked_runs += group["ranked_runs"]
+        row.rank_sum += group["rank_sum"]
+        ranks = group["ranks"] + [r for r in (row.best_rank, row.worst_rank) if r is not None]
+        if ranks:
+            row.best_rank, row.worst_rank = min(ranks), max(ranks)
+
+    removed = QueryRun.query.filter(QueryRun.created_at < cutoff).delete(synchronize_session=False)
+    expired = QueryRankDaily.query.filter(
+        QueryRankDaily.day < (now - ROLLUP_RETENTION).date()).delete(synchronize_session=False)
+    db.session.commit()
+    logger.info(f"Rolled {removed} query runs into {len(groups)} daily rows, expired {expired}")
+    return {"rolled_up": removed, "daily_rows": len(groups), "expired": expired}
+
+
+def delete_for_model(model: Model):
+    QueryRun.query.filter_by(model_id=model.id).delete(synchronize_session=False)
+    QueryRankDaily.query.filter_by(model_id=model.id).delete(synchronize_session=False)
@@ -0,0 +1,862 @@
+# Every /api route and the maintenance CLI commands, registered on the app by create_app()
+import hashlib
+import hmac
+import json
+import logging
+import time
+from collections import Counter
+
+import click
+import requests
+from flask import Blueprint, Response, current_app, g, jsonify, request, stream_with_context
+
+import crawler
+import csv_processor
+import firebase_auth
+import fingerprint
+import jobs
+import llm_cache
+import metrics
+import model_store
+import operations
+import query_history
+import serp
+from http_session import get_session_manager
+from llm import RATING_METHODS
+from models import db, Model, CSV, Job
+
+logger = logging.getLogger(__name__)
+
+# cli_group=None keeps the commands at `flask run-jobs` rather than `flask api run-jobs`
+api = Blueprint('api', __name__, cli_group=None)
+
+# Commit streamed work every N items so a dropped connection loses little
+STREAM_COMMIT_EVERY = 20
+# An SSE comment this often while a job's progress stands still, so proxies don't drop the idle stream
+SSE_KEEPALIVE_SECONDS = 15
+JOB_EVENTS_POLL_SECONDS = 0.5
+
+PAGE_PARAMS = {'limit', 'offset', 'cursor', 'fields', 'sort', 'scraped', 'rated'}
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+CSV_PREVIEW_ROWS = 10
+CSV_MAX_PREVIEW_ROWS = 100
+
+
+def sse_format(event):
+    return f"event: {event['event']}\ndata: {current_app.json.dumps(event)}\n\n"
+
+
+def event_stream(events):
+    """Stream an operation's events as Server-Sent Events instead of buffering messages."""
+    def generate():
+        uncommitted = 0
+        try:
+            for event in events:
+                if event['event'] == 'item':
+                    uncommitted += 1
+                if uncommitted >= STREAM_COMMIT_EVERY or event['event'] in ('checkpoint', 'summary'):
+                    db.session.commit()
+                    uncommitted = 0
+                yield sse_format(event)
+        finally:
+            events.close()
+            db.session.commit()
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def parse_bool_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def dedupe_error(data):
+    if data.get('dedupe', 'off') not in fingerprint.DEDUPE_MODES:
+        return f"dedupe must be one of {', '.join(fingerprint.DEDUPE_MODES)}"
+    max_distance = data.get('maxDistance', fingerprint.DEFAULT_MAX_DISTANCE)
+    if not isinstance(max_distance, int) or not 0 <= max_distance <= fingerprint.MAX_DISTANCE:
+        return f"maxDistance must be an integer from 0 to {fingerprint.MAX_DISTANCE}"
+    return None
+
+
+def crawl_error(data):
+    for name, default in (('maxUrls', crawler.DEFAULT_MAX_URLS), ('maxDepth', crawler.DEFAULT_MAX_DEPTH)):
+        value = data.get(name, default)
+        if not isinstance(value, int) or value < 0:
+            return f"{name} must be a non-negative integer"
+    if data.get('maxUrls', crawler.DEFAULT_MAX_URLS) > crawler.MAX_URLS:
+        return f"maxUrls must be at most {crawler.MAX_URLS}"
+    return None
+
+
+def csv_to_dict(csv_file):
+    return {
+        "id": csv_file.id,
+        "filename": csv_file.filename,
+        "uploaded_at": csv_file.uploaded_at,
+        "row_count": csv_file.row_count,
+        "columns": csv_processor.csv_record_columns(csv_file),
+        "delimiter": csv_file.delimiter or csv_processor.DEFAULT_DELIMITER,
+        "size_bytes": csv_file.size_bytes,
+    }
+
+
+def get_current_user():
+    token = request.headers.get('Authorization')
+    if not token:
+        return None
+    try:
+        decoded_token = firebase_auth.verify_id_token(token.split('Bearer ')[1])
+        return firebase_auth.get_or_create_user(decoded_token)
+    except Exception:
+        return None
+
+
+@api.before_app_request
+def start_job_runner():
+    jobs.ensure_started(current_app._get_current_object())
+
+
+@api.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    metrics.HTTP_REQUESTS_IN_FLIGHT.inc()
+
+
+@api.after_app_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.HTTP_REQUESTS_IN_FLIGHT.dec()
+        # Route pattern rather than path, so model ids don't explode the label set.
+        # Streamed responses are timed until their headers go out.
+        metrics.HTTP_REQUEST_SECONDS.labels(
+            request.method, request.url_rule.rule if request.url_rule else 'unmatched',
+            response.status_code).observe(time.perf_counter() - started)
+    return response
+
+
+@api.route('/api/health')
+def health_check():
+    return jsonify({"status": "healthy", "startup": current_app.extensions.get('startup')}), 200
+
+
+@api.route('/api/metrics')
+def prometheus_metrics():
+    if not metrics.METRICS_TOKEN:
+        return jsonify({"error": "Metrics are disabled; set METRICS_TOKEN to enable them"}), 404
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(token.encode(), metrics.METRICS_TOKEN.encode()):
+        return jsonify({"error": "Unauthorized"}), 401, {'WWW-Authenticate': 'Bearer'}
+
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+
+@api.route('/api/scraper/stats')
+def scraper_stats():
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    return jsonify(get_session_manager().snapshot()), 200
+
+
+@api.route('/api/llm-cache/stats')
+def llm_cache_stats():
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    return jsonify(llm_cache.stats()), 200
+
+
+@api.route('/api/csvs', methods=['GET', 'POST'])
+def handle_csvs():
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    if request.method == 'GET':
+        csvs = CSV.query.filter_by(user_id=user.id).all()
+        return jsonify([csv_to_dict(csv_file) for csv_file in csvs])
+
+    if request.method == 'POST':
+        if 'file' not in request.files:
+            return jsonify({"error": "No file part"}), 400
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({"error": "No selected file"}), 400
+        if file and file.filename.endswith('.csv'):
+            # Streamed to disk; only the sniffed header and counts are kept in the database
+            info = csv_processor.save_upload(file, current_app.config['CSV_UPLOAD_DIR'])
+            new_csv = CSV(filename=file.filename, content='', user_id=user.id, **info)
+            db.session.add(new_csv)
+            db.session.commit()
+            return jsonify({"message": "CSV uploaded successfully", "id": new_csv.id,
+                            "row_count": new_csv.row_count, "columns": new_csv.columns}), 201
+        return jsonify({"error": "Invalid file type"}), 400
+
+
+@api.route('/api/csvs/<int:csv_id>/preview')
+def preview_csv(csv_id):
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    csv_file = db.session.get(CSV, csv_id)
+    if not csv_file or csv_file.user_id != user.id:
+        return jsonify({"error": "CSV not found or unauthorized"}), 404
+
+    limit = max(0, min(request.args.get('rows', CSV_PREVIEW_ROWS, type=int), CSV_MAX_PREVIEW_ROWS))
+    columns = None
+    if request.args.get('columns'):
+        columns = request.args['columns'].split(',')
+        unknown = [column for column in columns if column not in csv_processor.csv_record_columns(csv_file)]
+        if unknown:
+            return jsonify({"error": f"Unknown columns: {', '.join(unknown)}"}), 400
+    return jsonify({
+        **csv_to_dict(csv_file),
+        "rows": csv_processor.preview_csv_rows(csv_processor.csv_record_rows(csv_file), limit, columns),
+    }), 200
+
+
+@api.route('/api/models', methods=['GET', 'POST'])
+def handle_models():
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    if request.method == 'GET':
+        models = Model.query.filter_by(user_id=user.id).all()
+        return jsonify([{"id": model.id, "name": model.name, "created_at": model.created_at} for model in models])
+
+    if request.method == 'POST':
+        data = request.json
+        
+        # Handle URL-based model creation
+        if 'url' in data:
+            url = data.get('url')
+            model_name = data.get('model_name')
+            
+            if not all([url, model_name]):
+                return jsonify({"error": "Missing required fields"}), 400
+            
+            try:
+                url = csv_processor.canonicalize_url(url)
+            except ValueError as e:
+                return jsonify({"error": f"Invalid URL: {str(e)}"}), 400
+
+            # Create a single-URL model with the same structure as CSV-based models
+            processed_data = [{
+                "url": url,
+                "additional_data": {}  # Empty additional_data to match CSV structure
+            }]
+            
+            new_model = Model(
+                name=model_name,
+                base_url="",  # Empty base_url as per requirement
+                url_column="url",  # Use "url" as the default column name
+                user_id=user.id,
+                data=json.dumps([])
+            )
+            
+            db.session.add(new_model)
+            model_store.add_items(new_model, processed_data)
+            db.session.commit()
+            
+            return jsonify({"message": "Model created successfully", "id": new_model.id}), 201
+        
+        # Crawl-based model creation: the pages are discovered from base_url by a background job
+        if data.get('crawl'):
+            try:
+                base_url = crawler.normalize_base_url(data.get('base_url'))
+            except ValueError as e:
+                return jsonify({"error": f"Invalid base_url: {str(e)}"}), 400
+            model_name = data.get('model_name')
+            if not all([base_url, model_name]):
+                return jsonify({"error": "Missing required fields"}), 400
+
+            crawl_params = data['crawl'] if isinstance(data['crawl'], dict) else {}
+            error = crawl_error(crawl_params)
+            if error:
+                return jsonify({"error": error}), 400
+
+            new_model = Model(name=model_name, base_url=base_url, url_column="url",
+                              user_id=user.id, data=json.dumps([]))
+            db.session.add(new_model)
+            db.session.commit()
+            job = jobs.enqueue('crawl', new_model, user, crawl_params)
+            return jsonify({"message": "Model created; crawl job queued", "id": new_model.id,
+                            "job_id": job.id}), 202
+
+        # Handle CSV-based model creation (existing logic)
+        csv_id = data.get('csv_id')
+        url_column = data.get('url_column')
+        base_url = data.get('base_url', '')
+        model_name = data.get('model_name')
+
+        if not all([csv_id, url_column, model_name]):
+            return jsonify({"error": "Missing required fields"}), 400
+        try:
+            # Every row joins onto base_url, so a bad one would otherwise drop them all as invalid
+            csv_processor.canonicalize_url('', base_url)
+        except ValueError as e:
+            return jsonify({"error": f"Invalid base_url: {str(e)}"}), 400
+
+        csv_file = CSV.query.get(csv_id)
+        if not csv_file or csv_file.user_id != user.id:
+            return jsonify({"error": "CSV not found or unauthorized"}), 404
+
+        if url_column not in csv_processor.csv_record_columns(csv_file):
+            return jsonify({"error": f"URL column '{url_column}' not found in CSV"}), 400
+
+        # One streaming pass: parse, canonicalize, drop duplicates, insert in chunks
+        stats = Counter()
+        items = csv_processor.ingest_rows(
+            csv_processor.csv_record_rows(csv_file), url_column, base_url, stats)
+
+        new_model = Model(name=model_name, base_url=base_url, url_column=url_column,
+                          user_id=user.id, data=json.dumps([]))
+        db.session.add(new_model)
+        url_count = model_store.add_items(new_model, items)
+        db.session.commit()
+
+        dropped = csv_processor.dropped_counts(stats)
+        logger.info(f"Created model {new_model.id} with {url_count} URLs from {stats['rows_read']} rows, dropped {dropped}")
+        return jsonify({"message": "Model created successfully", "id": new_model.id,
+                        "url_count": url_count, "rows_read": stats['rows_read'],
+                        "dropped": dropped}), 201
+
+@api.route('/api/models/<int:model_id>', methods=['GET', 'DELETE'])
+def handle_model(model_id):
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    model = Model.query.get(model_id)
+    if not model or model.user_id != user.id:
+        return jsonify({"error": "Model not found or unauthorized"}), 404
+
+    if request.method == 'GET':
+        model_store.ensure_migrated(model)
+        # Unchanged models cost one primary-key lookup
+        etag = hashlib.sha1(f"{model.id}:{model.revision or 0}:{request.query_string.decode()}".encode()).hexdigest()
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers={"ETag": f'"{etag}"'})
+
+        body = {
+            "id": model.id,
+            "name": model.name,
+            "base_url": model.base_url,
+            "url_column": model.url_column,
+            "created_at": model.created_at,
+        }
+        if not PAGE_PARAMS & set(request.args):
+            # No paging parameters: the full legacy payload
+            body["data"] = model_store.model_payload(model)
+        else:
+            sort = request.args.get('sort', 'position')
+            fields = [f for f in request.args.get('fields', '').split(',') if f] or None
+            cursor = request.args.get('cursor', type=int)
+            if sort.lstrip('-') not in model_store.SORT_COLUMNS:
+                return jsonify({"error": f"Cannot sort by {sort}"}), 400
+            if cursor is not None and sort != 'position':
+                return jsonify({"error": "cursor pagination requires sort=position"}), 400
+
+            limit = max(1, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+            offset = max(0, request.args.get('offset', 0, type=int))
+            body.update(model_store.page(
+                model, limit, offset=offset, after=cursor, fields=fields,
+                scraped=parse_bool_arg('scraped'), rated=parse_bool_arg('rated'), sort=sort))
+            body.update({"limit": limit, "offset": offset})
+
+        response = jsonify(body)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    if request.method == 'DELETE':
+        model_store.delete_rows(model)
+        query_history.delete_for_model(model)
+        jobs.delete_for_model(model)
+        db.session.delete(model)
+        db.session.commit()
+        return jsonify({"message": "Model deleted successfully"}), 200
+
+
+@api.route('/api/models/<int:model_id>/storage')
+def model_storage(model_id):
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    model = db.session.get(Model, model_id)
+    if not model or model.user_id != user.id:
+        return jsonify({"error": "Model not found or unauthorized"}), 404
+
+    model_store.ensure_migrated(model)
+    return jsonify({"id": model.id, **model_store.storage_stats(model)}), 200
+
+
+@api.route('/api/models/<int:model_id>/duplicates')
+def model_duplicates(model_id):
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    model = db.session.get(Model, model_id)
+    if not model or model.user_id != user.id:
+        return jsonify({"error": "Model not found or unauthorized"}), 404
+
+    max_distance = request.args.get('maxDistance', fingerprint.DEFAULT_MAX_DISTANCE, type=int)
+    if not 0 <= max_distance <= fingerprint.MAX_DISTANCE:
+        return jsonify({"error": f"maxDistance must be from 0 to {fingerprint.MAX_DISTANCE}"}), 400
+
+    model_store.ensure_migrated(model)
+    model_store.fingerprint_rows(model)
+    return jsonify({"id": model.id, "max_distance": max_distance,
+                    **model_store.near_duplicates(model, max_distance)}), 200
+
+
+@api.route('/api/models/<int:model_id>/scrape', methods=['POST'])
+def scrape_model(model_id):
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    model = Model.query.get(model_id)
+    if not model or model.user_id != user.id:
+        return jsonify({"error": "Model not found or unauthorized"}), 404
+
+    data = request.json
+    if data.get('background'):
+        job = jobs.enqueue('scrape', model, user, data)
+        return jsonify({"message": "Scrape job queued", "job_id": job.id}), 202
+
+    if data.get('stream'):
+        return event_stream(operations.run_scrape(model, data))
+
+    result = operations.collect(operations.run_scrape(model, data), checkpoint=db.session.commit)
+    db.session.commit()
+
+    return jsonify(result), 200
+
+@api.route('/api/models/<int:model_id>/crawl', methods=['POST'])
+def crawl_model(model_id):
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    model = db.session.get(Model, model_id)
+    if not model or model.user_id != user.id:
+        return jsonify({"error": "Model not found or unauthorized"}), 404
+
+    data = request.json or {}
+    if data.get('base_url'):
+        try:
+            model.base_url = crawler.normalize_base_url(data['base_url'])
+        except ValueError as e:
+            return jsonify({"error": f"Invalid base_url: {str(e)}"}), 400
+    if not model.base_url:
+        return jsonify({"error": "Model has no base_url to crawl from"}), 400
+
+    error = crawl_error(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    if data.get('background'):
+        db.session.commit()
+        job = jobs.enqueue('crawl', model, user, data)
+        return jsonify({"message": "Crawl job queued", "job_id": job.id}), 202
+
+    if data.get('stream'):
+        return event_stream(operations.run_crawl(model, data))
+
+    result = operations.collect(operations.run_crawl(model, data), checkpoint=db.session.commit)
+    db.session.commit()
+
+    return jsonify(result), 200
+
+
+@api.route('/api/models/<int:model_id>/generate-alt-content', methods=['POST'])
+def generate_alt_content(model_id):
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    model = db.session.get(Model, model_id)  # Updated to use session.get()
+    if not model or model.user_id != user.id:
+        return jsonify({"error": "Model not found or unauthorized"}), 404
+
+    data = request.json
+    api_key = data.get('apiKey')
+    logger.info(f"Received model name from frontend: {data.get('model')}")
+
+    if not api_key:
+        return jsonify({"error": "API key is required"}), 400
+
+    error = dedupe_error(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    if data.get('background'):
+        job = jobs.enqueue('generate', model, user, data)
+        return jsonify({"message": "Alt content job queued", "job_id": job.id}), 202
+
+    if data.get('stream'):
+        return event_stream(operations.run_generate(model, data))
+
+    result = operations.collect(operations.run_generate(model, data))
+    db.session.commit()
+
+    return jsonify(result), 200
+
+
+@api.route('/api/models/<int:model_id>/rate-content', methods=['POST'])
+def rate_content(model_id):
+    logger.info(f"Received request to rate content for model {model_id}")
+    user = get_current_user()
+    if not user:
+        logger.warning("Unauthorized access attempt")
+        return jsonify({"error": "Unauthorized"}), 401
+
+    model = Model.query.get(model_id)
+    if not model or model.user_id != user.id:
+        logger.warning(f"Model not found or unauthorized for user {user.id}")
+        return jsonify({"error": "Model not found or unauthorized"}), 404
+
+    data = request.json
+    api_key = data.get('apiKey')
+    content_type = data.get('contentType')
+    rating_method = data.get('ratingMethod')
+
+    if not all([api_key, content_type, rating_method]):
+        logger.warning("Missing required fields in request")
+        return jsonify({"error": "Missing required fields"}), 400
+
+    if rating_method not in RATING_METHODS:
+        return jsonify({"error": "Unsupported rating method"}), 400
+
+    error = dedupe_error(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    if data.get('background'):
+        job = jobs.enqueue('rate', model, user, data)
+        return jsonify({"message": "Rating job queued", "job_id": job.id}), 202
+
+    if data.get('stream'):
+        return event_stream(operations.run_rate(model, data))
+
+    result = operations.collect(operations.run_rate(model, data))
+    db.session.commit()
+
+    return jsonify(result), 200
+
+
+@api.route('/api/models/<int:model_id>/test', methods=['POST'])
+def test_model(model_id):
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    model = Model.query.get(model_id)
+    if not model or model.user_id != user.id:
+        return jsonify({"error": "Model not found or unauthorized"}), 404
+
+    data = request.json
+    query = data.get('query')
+    test_method = data.get('testMethod')
+    max_return = data.get('maxReturn', 5)
+    max_highlight_search = data.get('maxHighlightSearch', 50)
+    highlighted_url = data.get('highlightedUrl')
+
+    if not query or not test_method:
+        return jsonify({"error": "Missing required fields"}), 400
+
+    try:
+        # Get results based on test method
+        if test_method == 'google':
+            results = google_search(query, max_return, max_highlight_search, highlighted_url,
+                                    refresh=data.get('refresh', False))
+        elif test_method == 'gpt':
+            results = gpt_search(query, max_return)
+        else:
+            return jsonify({"error": "Unsupported test method"}), 400
+
+        # One insert per run; history lives in query_run, not in the model blob
+        model_store.ensure_migrated(model)
+        query_history.record_run(model, query, test_method, results, {
+            'max_return': max_return,
+            'max_highlight_search': max_highlight_search,
+            'highlighted_url': highlighted_url
+        })
+        db.session.commit()
+
+        response = jsonify(results)
+        if 'serp_cache' in g:
+            response.headers['X-SERP-Cache'] = g.serp_cache
+        return response, 200
+
+    except requests.RequestException as e:
+        # Google failing (429/503 when it rate-limits us, timeouts) isn't this server's error
+        logger.warning(f"Search request failed in test_model: {str(e)}")
+        return jsonify({"error": f"Search provider error: {str(e)}"}), 502
+    except Exception as e:
+        logger.exception(f"Error in test_model: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def google_search(query, max_return, max_highlight_search, highlighted_url, refresh=False):
+    # The highlighted URL's rank is computed against the (possibly cached) result list
+    started = time.perf_counter()
+    serp_results, cached = serp.cached_serp(query, max_highlight_search, refresh=refresh)
+    metrics.SERP_SECONDS.labels('cache' if cached else 'google').observe(time.perf_counter() - started)
+    g.serp_cache = 'hit' if cached else 'miss'
+    return serp.rank_results(serp_results, max_return, highlighted_url, max_highlight_search)
+
+
+def gpt_search(query, max_return):
+    # Dummy function for GPT search
+    dummy_results = [
+        {"title": f"GPT Result {i}", "url": f"https://example.com/gpt-result-{i}"}
+        for i in range(1, max_return + 1)
+    ]
+    return dummy_results
+
+
+@api.route('/api/models/<int:model_id>/queries')
+def model_queries(model_id):
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    model = db.session.get(Model, model_id)
+    if not model or model.user_id != user.id:
+        return jsonify({"error": "Model not found or unauthorized"}), 404
+
+    model_store.ensure_migrated(model)
+    limit = max(1, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    runs = query_history.recent_runs(model, limit, query=request.args.get('query'),
+                                     before_id=request.args.get('before', type=int))
+    return jsonify({
+        "queries": [query_history.run_to_dict(run) for run in runs],
+        "next_before": runs[-1].id if len(runs) == limit else None,
+    }), 200
+
+
+@api.route('/api/models/<int:model_id>/rank-history')
+def model_rank_history(model_id):
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    model = db.session.get(Model, model_id)
+    if not model or model.user_id != user.id:
+        return jsonify({"error": "Model not found or unauthorized"}), 404
+
+    highlighted_url = request.args.get('url')
+    if not highlighted_url:
+        return jsonify({"error": "url is required"}), 400
+
+    model_store.ensure_migrated(model)
+    days = request.args.get('days', 90, type=int)
+    return jsonify({
+        "url": highlighted_url,
+        "days": days,
+        "series": query_history.rank_history(model, highlighted_url, request.args.get('query'), days),
+    }), 200
+
+
+@api.route('/api/models/<int:model_id>/add-url', methods=['POST'])
+def add_url_to_model(model_id):
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    model = Model.query.get(model_id)
+    if not model or model.user_id != user.id:
+        return jsonify({"error": "Model not found or unauthorized"}), 404
+
+    data = request.json
+    url = data.get('url')
+    if not url:
+        return jsonify({"error": "URL is required"}), 400
+
+    try:
+        url = csv_processor.canonicalize_url(url)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid URL: {str(e)}"}), 400
+    try:
+        model_store.ensure_migrated(model)
+        if model_store.has_url(model, url):
+            return jsonify({"error": "URL already in model"}), 409
+        model_store.add_items(model, [{
+            "url": url,
+            "additional_data": {}
+        }])
+        db.session.commit()
+        
+        return jsonify({"message": "URL added successfully"}), 200
+    except Exception as e:
+        logger.error(f"Error in add_url_to_model: {str(e)}")
+        return jsonify({"error": f"Failed to add URL: {str(e)}"}), 500
+
+
+@api.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    query = Job.query.filter_by(user_id=user.id)
+    if request.args.get('model_id'):
+        query = query.filter_by(model_id=request.args.get('model_id', type=int))
+    found = query.order_by(Job.created_at.desc()).limit(50).all()
+    return jsonify([jobs.job_to_dict(job) for job in found]), 200
+
+
+@api.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    job = db.session.get(Job, job_id)
+    if not job or job.user_id != user.id:
+        return jsonify({"error": "Job not found or unauthorized"}), 404
+
+    return jsonify(jobs.job_to_dict(job)), 200
+
+
+@api.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    job = db.session.get(Job, job_id)
+    if not job or job.user_id != user.id:
+        return jsonify({"error": "Job not found or unauthorized"}), 404
+
+    def generate():
+        last_progress = None
+        last_sent = time.monotonic()
+        while True:
+            # Ends the read transaction too; under REPEATABLE READ (MySQL) each poll would otherwise
+            # see the snapshot taken by the first one
+            db.session.rollback()
+            current = db.session.get(Job, job_id)
+            if current is None:
+                yield sse_format({"event": "summary", "id": job_id, "status": "deleted",
+                                  "error": "Job was deleted along with its model"})
+                return
+            if current.progress != last_progress or current.status not in ('queued', 'running'):
+                last_progress = current.progress
+                messages = (current.result or {}).get('messages') or [None]
+                yield sse_format({"event": "progress", "status": current.status,
+                                  "progress": current.progress, "total": current.total,
+                                  "message": messages[-1]})
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= SSE_KEEPALIVE_SECONDS:
+                yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+            if current.status not in ('queued', 'running'):
+                yield sse_format({"event": "summary", **jobs.job_to_dict(current)})
+                return
+            time.sleep(JOB_EVENTS_POLL_SECONDS)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@api.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    job = db.session.get(Job, job_id)
+    if not job or job.user_id != user.id:
+        return jsonify({"error": "Job not found or unauthorized"}), 404
+    if job.status not in ('queued', 'running'):
+        return jsonify({"error": f"Job is already {job.status}"}), 409
+
+    jobs.request_cancel(job)
+    return jsonify(jobs.job_to_dict(job)), 200
+
+
+@api.route('/api/jobs/<job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    job = db.session.get(Job, job_id)
+    if not job or job.user_id != user.id:
+        return jsonify({"error": "Job not found or unauthorized"}), 404
+    if job.status not in jobs.RESUMABLE_STATUSES:
+        return jsonify({"error": f"Cannot resume a {job.status} job"}), 409
+
+    # API keys aren't kept once a run ends, so jobs that need one are resumed with it
+    data = request.get_json(silent=True) or {}
+    missing = jobs.missing_secrets(job, data)
+    if missing:
+        return jsonify({"error": f"{', '.join(missing)} required to resume a {job.kind} job"}), 400
+
+    jobs.resume(job, {name: data[name] for name in jobs.SECRET_PARAMS.get(job.kind, ())})
+    return jsonify(jobs.job_to_dict(job)), 202
+
+
+@api.cli.command('run-jobs')
+def run_jobs_command():
+    """Process queued jobs in the foreground (for JOB_RUNNER=off deployments)."""
+    jobs.JobRunner(current_app._get_current_object(), workers=jobs.JOB_WORKERS).run_forever()
+
+
+@api.cli.command('migrate-models')
+def migrate_models_command():
+    """Move URL items and query history out of Model.data blobs into their own tables."""
+    moved = model_store.migrate_all()
+    print(f"Migrated {moved} items and query runs")
+
+
+@api.cli.command('compress-models')
+@click.option('--vacuum', is_flag=True, help="Run VACUUM afterwards so SQLite returns the freed pages.")
+def compress_models_command(vacuum):
+    """Rewrite every model's rows with large text fields compressed into model_url.packed."""
+    model_store.migrate_all()
+    rewritten = sum(model_store.recompress(model) for model in Model.query.all())
+    print(f"Rewrote {rewritten} rows")
+    if vacuum and db.engine.dialect.name == 'sqlite':
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql('VACUUM')
+        print("Vacuumed database")
+
+
+@api.cli.command('rollup-query-history')
+def rollup_query_history_command():
+    """Fold old query runs into daily rank rollups and apply retention. Run daily from cron."""
+    print(query_history.rollup())
+
+
+@api.cli.command('prune-serp-cache')
+def prune_serp_cache_command():
+    """Delete expired search result pages."""
+    removed = serp.prune()
+    db.session.commit()
+    print(f"Deleted {removed} entries")
+
+
+@api.cli.command('prune-llm-cache')
+def prune_llm_cache_command():
+    """Evict expired and least recently used LLM cache entries."""
+    removed = llm_cache.prune()
+    db.session.commit()
+    print(f"Evicted {removed} entries")
+
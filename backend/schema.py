@@ -0,0 +1,37 @@
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_schema():
+    # No migration framework: create new tables, then add any columns/indexes missing from old ones
+    try:
+        db.create_all()
+    except OperationalError as e:
+        # Another gunicorn worker created the tables first
+        logger.warning(f"create_all raced with another worker: {str(e)}")
+
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            quote = db.engine.dialect.identifier_preparer.quote
+            logger.info(f"Adding column {table.name}.{column.name}")
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}'))
+            except OperationalError as e:
+                logger.warning(f"Could not add column {table.name}.{column.name}: {str(e)}")
+        for index in table.indexes:
+            try:
+                index.create(bind=db.engine, checkfirst=True)
+            except OperationalError as e:
+                logger.warning(f"Could not create index {index.name}: {str(e)}")
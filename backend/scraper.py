@@ -1,84 +1,240 @@
 import requests
-from bs4 import BeautifulSoup
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Iterable, Iterator, Tuple, Optional
 from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import hashlib
 import logging
+import threading
+import time
 import traceback
 from urllib.parse import urlparse, urljoin
+from http_session import SessionManager, get_session_manager
+from url_resolver import UrlResolver
+from extractors import Extractor, get_extractor
+import fingerprint
+import metrics
+
+# Hard ceiling on simultaneous fetches across every scrape running in this process
+MAX_SCRAPE_CONCURRENCY = 50
+DEFAULT_PER_HOST_CONCURRENCY = 2
+REQUEST_TIMEOUT = 10
+# Short first timeout used while probing URL variations in parallel
+PROBE_TIMEOUT = 3
+
+_global_slots = threading.BoundedSemaphore(MAX_SCRAPE_CONCURRENCY)
+_probe_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix='url-probe')
+
+
+class HostThrottle:
+    """Per-host politeness: caps parallel requests to a host and spaces their start times by `delay`."""
+
+    def __init__(self, delay: float = 0.0, per_host: int = DEFAULT_PER_HOST_CONCURRENCY):
+        self.delay = max(0.0, float(delay or 0))
+        self.per_host = max(1, int(per_host))
+        self._lock = threading.Lock()
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._next_start: Dict[str, float] = {}
+
+    @contextmanager
+    def slot(self, host: str):
+        with self._lock:
+            host_slots = self._slots.setdefault(
+                host, threading.BoundedSemaphore(self.per_host))
+        host_slots.acquire()
+        try:
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_start.get(host, now))
+                self._next_start[host] = start + self.delay
+            if start > now:
+                time.sleep(start - now)
+            yield
+        finally:
+            host_slots.release()
 
 
 class Scraper:
-    def __init__(self):
+    def __init__(self, session: Optional[SessionManager] = None, resolver: Optional[UrlResolver] = None,
+                 extractor: Optional[Extractor] = None, collect_links: bool = False):
         self.logger = logging.getLogger(__name__)
+        self.session = session or get_session_manager()
+        self.resolver = resolver or UrlResolver()
+        self.extractor = extractor or get_extractor()
+        # Crawls want each page's outgoing links; they come back as absolute URLs under "links"
+        self.collect_links = collect_links
+
+    def scrape_many(self, targets: Iterable[Tuple[str, Optional[Dict[str, Any]]]], base_url: str = '',
+                    concurrency: int = 1, delay: float = 0.0,
+                    per_host: int = DEFAULT_PER_HOST_CONCURRENCY) -> Iterator[Dict[str, Any]]:
+        """Scrape (url, validators) pairs on a bounded thread pool, yielding results in input order."""
+        concurrency = max(1, min(int(concurrency), MAX_SCRAPE_CONCURRENCY))
+        throttle = HostThrottle(delay, min(per_host, concurrency))
 
-    def scrape_url(self, url: str, base_url: str = '') -> Dict[str, Any]:
+        executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix='scraper')
+        pending = deque()
+        try:
+            for url, validators in targets:
+                pending.append(executor.submit(
+                    self._throttled_scrape, throttle, url, base_url, validators))
+                # Keep a small window in flight so huge models don't queue every URL up front
+                if len(pending) >= concurrency * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _throttled_scrape(self, throttle: HostThrottle, url: str, base_url: str,
+                          validators: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        with throttle.slot(self.host_key(url, base_url)):
+            with _global_slots:
+                started = time.perf_counter()
+                result = self.scrape_url(url, base_url, validators)
+                # Not part of the item; callers pop it for progress reporting
+                result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+                return result
+
+    def host_key(self, url: str, base_url: str = '') -> str:
+        return self.resolver.host_for(url, base_url) or (base_url or '')
+
+    def scrape_url(self, url: str, base_url: str = '',
+                   validators: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         self.logger.info(f"Attempting to scrape URL: {url}")
 
-        url_variations = self.generate_url_variations(url, base_url)
+        candidates = self.generate_url_variations(url, base_url)
+        reachable = [c for c in candidates if self.resolver.resolves(self.resolver.host(c))]
+        if candidates and not reachable:
+            error_msg = f"Failed to scrape {url}: DNS resolution failed"
+            self.logger.error(error_msg)
+            return {"error": error_msg}
 
-        for variation in url_variations:
+        # A scheme that already worked for this host gets the full timeout on its own
+        if reachable and self.resolver.preferred(reachable[0]):
             try:
-                self.logger.info(f"Trying URL variation: {variation}")
-                return self._perform_scrape(variation)
+                return self._scrape_candidate(reachable[0], validators, REQUEST_TIMEOUT)
             except requests.RequestException as e:
-                self.logger.warning(f"Failed to scrape {variation}: {str(e)}")
+                self.logger.warning(f"Failed to scrape {reachable[0]}: {str(e)}")
+                reachable = reachable[1:]
+
+        if len(reachable) == 1:
+            try:
+                return self._scrape_candidate(reachable[0], validators, REQUEST_TIMEOUT)
+            except requests.RequestException as e:
+                self.logger.warning(f"Failed to scrape {reachable[0]}: {str(e)}")
+        elif reachable:
+            result = self._probe_candidates(reachable, validators)
+            if result is not None:
+                return result
 
         error_msg = f"Failed to scrape {url} after trying multiple variations"
         self.logger.error(error_msg)
         return {"error": error_msg}
 
+    def _probe_candidates(self, candidates: List[str],
+                          validators: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        # Probe every variation at once with a short timeout and keep the best-ranked success
+        futures = [_probe_pool.submit(self._perform_scrape, c, validators, PROBE_TIMEOUT)
+                   for c in candidates]
+        timed_out = []
+        try:
+            for candidate, future in zip(candidates, futures):
+                self.logger.info(f"Trying URL variation: {candidate}")
+                try:
+                    result, final_url = future.result()
+                except requests.Timeout as e:
+                    self.logger.warning(f"Failed to scrape {candidate}: {str(e)}")
+                    timed_out.append(candidate)
+                except requests.RequestException as e:
+                    self.logger.warning(f"Failed to scrape {candidate}: {str(e)}")
+                else:
+                    # Only the winner is remembered; lower-ranked probes still running are ignored
+                    self.resolver.remember(candidate, final_url)
+                    return result
+        finally:
+            for future in futures:
+                future.cancel()
+
+        # Slow hosts get one more chance with the full timeout
+        for candidate in timed_out:
+            try:
+                return self._scrape_candidate(candidate, validators, REQUEST_TIMEOUT)
+            except requests.RequestException as e:
+                self.logger.warning(f"Failed to scrape {candidate}: {str(e)}")
+        return None
+
+    def _scrape_candidate(self, url: str, validators: Optional[Dict[str, Any]],
+                          timeout: float) -> Dict[str, Any]:
+        result, final_url = self._perform_scrape(url, validators, timeout)
+        self.resolver.remember(url, final_url)
+        return result
+
     def generate_url_variations(self, url: str, base_url: str) -> List[str]:
-        variations = [
-            url,  # Original URL
-            urljoin(base_url, url),  # Combine with base_url
-            f"https://{url}",  # Add https://
-            f"http://{url}",  # Add http://
-            f"https:{url}",  # Add https:
-            f"http:{url}",  # Add http:
-            f"https:/{url}",  # Add https:/
-            f"http:/{url}",  # Add http:/
-            f"https://{url}",  # Add https://
-            f"http://{url}",  # Add http://
-        ]
-
-        # Remove duplicates while preserving order
-        return list(dict.fromkeys(variations))
-
-    def _perform_scrape(self, url: str) -> Dict[str, Any]:
+        return self.resolver.candidates(url, base_url)
+
+    @staticmethod
+    def conditional_headers(validators: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        headers = {}
+        if validators:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+        return headers
+
+    def _perform_scrape(self, url: str, validators: Optional[Dict[str, Any]] = None,
+                        timeout: float = REQUEST_TIMEOUT) -> Tuple[Dict[str, Any], str]:
+        """The scraped fields, and the URL the response finally came from after any redirects."""
+        with metrics.in_flight(metrics.SCRAPES_IN_FLIGHT):
+            try:
+                result, final_url = self._fetch_and_extract(url, validators, timeout)
+            except Exception:
+                metrics.SCRAPE_REQUESTS.labels('error').inc()
+                raise
+            metrics.SCRAPE_REQUESTS.labels('unchanged' if result.get('unchanged') else 'fetched').inc()
+            return result, final_url
+
+    def _fetch_and_extract(self, url: str, validators: Optional[Dict[str, Any]],
+                           timeout: float) -> Tuple[Dict[str, Any], str]:
         try:
-            response = requests.get(url, timeout=10)
+            started = time.perf_counter()
+            response = self.session.get(
+                url, timeout=timeout, headers=self.conditional_headers(validators) or None)
+            # response.elapsed stops once the headers are parsed; the rest is the body download
+            fetch_seconds = time.perf_counter() - started
+            headers_seconds = min(response.elapsed.total_seconds(), fetch_seconds)
+            metrics.SCRAPE_STAGE_SECONDS.labels('headers').observe(headers_seconds)
+            metrics.SCRAPE_STAGE_SECONDS.labels('body').observe(fetch_seconds - headers_seconds)
+            metrics.SCRAPE_RESPONSE_BYTES.inc(len(response.content))
+
+            if response.status_code == 304:
+                self.logger.info(f"Not modified since last scrape: {url}")
+                return self._unchanged_result(url, response, (validators or {}).get('content_hash')), response.url
             response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            title = soup.title.string if soup.title else 'Not found'
-            h1 = soup.find('h1').text if soup.find('h1') else 'Not found'
-            description = soup.find('meta', {'name': 'description'})
-            description = description['content'] if description else 'Not found'
-
-            main_content = soup.find('main') or soup.find(
-                'div', class_=['content', 'main', 'article'])
-            if main_content:
-                for elem in main_content.select('nav, header, footer, .navigation, .menu, .sidebar'):
-                    elem.decompose()
-                content_elements = main_content.find_all(
-                    ['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
-            else:
-                content_elements = soup.find_all(
-                    ['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
-
-            text_content = '\n\n'.join(
-                [elem.get_text(strip=True) for elem in content_elements])
+
+            content_hash = hashlib.sha256(response.content).hexdigest()
+            if validators and validators.get('content_hash') == content_hash:
+                self.logger.info(f"Content unchanged since last scrape: {url}")
+                return self._unchanged_result(url, response, content_hash), response.url
+
+            started = time.perf_counter()
+            fields = self.extractor.extract(response.text, links=self.collect_links)
+            if 'links' in fields:
+                # Not part of the item; resolved against the final URL in case of redirects
+                fields["links"] = [urljoin(response.url, href) for href in fields['links']]
+            fields["simhash"] = fingerprint.simhash_hex(fields.get('text_content'))
+            metrics.SCRAPE_STAGE_SECONDS.labels('parse').observe(time.perf_counter() - started)
 
             return {
                 "url": url,
-                "title": title,
-                "h1": h1,
-                "meta_description": description,
-                "text_content": text_content,
+                **fields,
+                **self._cache_fields(response, content_hash),
                 "scraped_at": datetime.now().isoformat()
-            }
+            }, response.url
         except requests.Timeout:
-            raise requests.RequestException(
+            raise requests.Timeout(
                 f"Request timed out for URL: {url}")
         except requests.HTTPError as e:
             raise requests.RequestException(
@@ -86,3 +242,21 @@ class Scraper:
         except requests.RequestException as e:
             raise requests.RequestException(
                 f"An error occurred while requesting the URL: {str(e)}")
+
+    @staticmethod
+    def _cache_fields(response: requests.Response, content_hash: Optional[str]) -> Dict[str, Any]:
+        # Validators stored next to the item so the next rescrape can be a conditional GET
+        fields = {"content_hash": content_hash}
+        if response.headers.get('ETag'):
+            fields["etag"] = response.headers['ETag']
+        if response.headers.get('Last-Modified'):
+            fields["last_modified"] = response.headers['Last-Modified']
+        return fields
+
+    def _unchanged_result(self, url: str, response: requests.Response, content_hash: Optional[str]) -> Dict[str, Any]:
+        return {
+            "url": url,
+            "unchanged": True,
+            **self._cache_fields(response, content_hash),
+            "scraped_at": datetime.now().isoformat()
+        }
@@ -0,0 +1,84 @@
+# Google result pages for /api/models/<id>/test, cached in the database so every gunicorn worker
+# shares them. A cached page fetched at depth N serves any request for depth <= N.
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from http_session import get_session_manager
+from models import db, SerpCacheEntry
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_SEARCH_URL = os.environ.get('GOOGLE_SEARCH_URL', 'https://www.google.com/search')
+SERP_CACHE_TTL = timedelta(seconds=int(os.environ.get('SERP_CACHE_TTL_SECONDS', 6 * 3600)))
+SERP_TIMEOUT = 10
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r'\s+', ' ', query).strip().lower()[:500]
+
+
+def fetch_serp(query: str, depth: int) -> List[Dict[str, str]]:
+    # Raises requests.RequestException when Google can't be reached or answers with an error status
+    # Note: In a production environment, use a proper Google Search API or a more robust scraping method
+    url = f"{GOOGLE_SEARCH_URL}?{urlencode({'q': query, 'num': depth})}"
+    response = get_session_manager().get(url, timeout=SERP_TIMEOUT, headers={"User-Agent": USER_AGENT})
+    response.raise_for_status()
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(response.text, 'html.parser')
+
+    results = []
+    for result in soup.find_all('div', class_='yuRUbf'):
+        if result.a is None:
+            continue
+        results.append({"title": result.h3.text if result.h3 else "No title", "url": result.a['href']})
+        if len(results) >= depth:
+            break
+    return results
+
+
+def cached_serp(query: str, depth: int, refresh: bool = False) -> Tuple[List[Dict[str, str]], bool]:
+    """Organic results for a query down to `depth`, and whether they came from the cache."""
+    query_norm = normalize_query(query)
+    if not refresh:
+        entry = SerpCacheEntry.query.filter(
+            SerpCacheEntry.query_norm == query_norm, SerpCacheEntry.depth >= depth,
+            SerpCacheEntry.fetched_at >= datetime.utcnow() - SERP_CACHE_TTL,
+        ).order_by(SerpCacheEntry.fetched_at.desc()).first()
+        if entry is not None:
+            entry.hits = (entry.hits or 0) + 1
+            return entry.results, True
+
+    results = fetch_serp(query, depth)
+    if not results:
+        # A captcha or consent page parses to nothing; caching it would hide real results for the TTL
+        logger.warning(f"No results parsed for '{query_norm}' at depth {depth}; not caching")
+        return results, False
+    # Older or shallower pages for this query are superseded by the one just fetched
+    SerpCacheEntry.query.filter(
+        SerpCacheEntry.query_norm == query_norm,
+        (SerpCacheEntry.depth <= depth) | (SerpCacheEntry.fetched_at < datetime.utcnow() - SERP_CACHE_TTL),
+    ).delete(synchronize_session=False)
+    db.session.add(SerpCacheEntry(query_norm=query_norm, depth=depth, results=results))
+    logger.info(f"Fetched {len(results)} results for '{query_norm}' at depth {depth}")
+    return results, False
+
+
+def rank_results(serp: List[Dict[str, str]], max_return: int, highlighted_url: Optional[str],
+                 depth: int) -> List[Dict[str, Any]]:
+    """The /test response: top results, plus the highlighted URL's rank when it isn't among them."""
+    results = [dict(r) for r in serp[:max_return]]
+    if highlighted_url and highlighted_url not in [r['url'] for r in results]:
+        rank = next((idx for idx, r in enumerate(serp[:depth], 1) if r['url'] == highlighted_url), None)
+        results.append({"title": "Highlighted URL", "url": highlighted_url,
+                        "rank": rank if rank else f"Not found in top {depth}"})
+    return results
+
+
+def prune() -> int:
+    return SerpCacheEntry.query.filter(
+        SerpCacheEntry.fetched_at < datetime.utcnow() - SERP_CACHE_TTL).delete(synchronize_session=False)
@@ -0,0 +1,108 @@
+# The suite drives the app through Flask's test client against the local stand-ins in
+# benchmarks/servers.py. It uses a temporary SQLite database, or TEST_DATABASE_URL when set
+# (a scratch database on the mysql service in docker-compose.yml), which also enables the tests
+# marked `server_db`. Every table but user is emptied after each test.
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.run import emulator_token, PROJECT_ID  # noqa: E402
+from benchmarks.servers import FakeAnthropic, FixtureSite  # noqa: E402
+
+WORKDIR = tempfile.mkdtemp(prefix='ai-seo-tests-')
+ANTHROPIC = FakeAnthropic(latency=0).start()
+
+# Read at import time by app and its modules, so this must run before importing them
+os.environ.update({
+    'DATABASE_URL': os.environ.get('TEST_DATABASE_URL') or f"sqlite:///{os.path.join(WORKDIR, 'test.db')}",
+    'CSV_UPLOAD_DIR': os.path.join(WORKDIR, 'uploads'),
+    'JOB_RUNNER': 'off',
+    'GOOGLE_CLOUD_PROJECT': PROJECT_ID,
+    'FIREBASE_AUTH_EMULATOR_HOST': '127.0.0.1:9099',
+    'ANTHROPIC_BASE_URL': ANTHROPIC.base_url,
+    'LLM_BATCH_BACKEND': 'local',
+})
+os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+import app as app_module  # noqa: E402
+from models import db, Model, User  # noqa: E402
+
+USER_ID = 'test-user'
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', "server_db: needs TEST_DATABASE_URL pointing at a database server")
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.environ.get('TEST_DATABASE_URL'):
+        return
+    skip = pytest.mark.skip(reason="set TEST_DATABASE_URL to run against a database server")
+    for item in items:
+        if 'server_db' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope='session')
+def app():
+    return app_module.app
+
+
+@pytest.fixture(autouse=True)
+def clean_tables(app):
+    yield
+    # Users stay: firebase_auth caches them in memory across requests
+    with app.app_context():
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            if table.name != User.__tablename__:
+                db.session.execute(table.delete())
+        db.session.commit()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def headers():
+    return {"Authorization": f"Bearer {emulator_token(USER_ID, 'test@example.com')}"}
+
+
+@pytest.fixture
+def ctx(app, client, headers):
+    # The first request creates the user row
+    client.get('/api/models', headers=headers)
+    with app.app_context():
+        yield
+
+
+@pytest.fixture
+def anthropic():
+    return ANTHROPIC
+
+
+@pytest.fixture
+def site():
+    server = FixtureSite(latency=0, page_bytes=2000).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def make_model(ctx):
+    """Creates models owned by the test user, with the given items appended."""
+    import model_store
+
+    def make(items=(), base_url='', name='test') -> Model:
+        model = Model(name=name, base_url=base_url, url_column='url', user_id=USER_ID, data='[]')
+        db.session.add(model)
+        model_store.add_items(model, [dict(item) for item in items])
+        db.session.commit()
+        return model
+    return make
@@ -0,0 +1,92 @@
+import base64
+import json
+import zlib
+
+from flask import jsonify
+from sqlalchemy import text
+
+import model_store
+from compression import COMPRESS_MIN_CHARS, Compressed, raw_item
+from models import db, ModelUrl
+
+LONG = ' '.join(f'word{n % 50}' for n in range(400))
+SHORT = 'x' * (COMPRESS_MIN_CHARS - 1)
+ITEM = {"url": "https://example.com/" + 'u' * COMPRESS_MIN_CHARS, "text_content": LONG,
+        "alt-content-1": LONG.upper(), "title": SHORT}
+
+
+def reload(model):
+    db.session.expire_all()
+    return model_store.rows(model).one()
+
+
+def stored(row):
+    data, packed = db.session.execute(text('SELECT data, packed FROM model_url WHERE id = :id'),
+                                      {"id": row.id}).one()
+    return (json.loads(data) if isinstance(data, str) else data), packed
+
+
+def test_round_trip(make_model):
+    row = reload(make_model([ITEM]))
+
+    assert row.data['text_content'] == LONG
+    assert row.data.get('alt-content-1') == LONG.upper()
+    assert {**row.data} == ITEM
+    assert dict(row.data) == ITEM
+    assert json.loads(jsonify(row.data).get_data()) == ITEM
+
+
+def test_only_long_fields_move_to_packed(make_model):
+    data, packed = stored(reload(make_model([ITEM])))
+
+    # Below the threshold, or a lookup field: left as-is
+    assert (data['title'], data['url']) == (SHORT, ITEM['url'])
+    first, second = data['text_content']['$zlib'], data['alt-content-1']['$zlib']
+    assert data['text_content']['n'] == len(LONG)
+    assert zlib.decompress(packed[first[0]:first[0] + first[1]]).decode() == LONG
+    assert zlib.decompress(packed[second[0]:second[0] + second[1]]).decode() == LONG.upper()
+    assert len(packed) == first[1] + second[1] < len(LONG)
+
+
+def test_updates_keep_untouched_fields_compressed(make_model):
+    model = make_model([ITEM])
+    row = reload(model)
+    raw = raw_item(row.data)
+    assert isinstance(raw['text_content'], Compressed) and raw['title'] == SHORT
+
+    model_store.update_row(row, {"title": "new", "text_content-rating": 80})
+    db.session.commit()
+    row = reload(model)
+    assert raw_item(row.data)['alt-content-1'] == raw['alt-content-1']
+    assert {**row.data} == {**ITEM, "title": "new", "text_content-rating": 80}
+    assert row.rating == 80
+
+
+def test_legacy_inline_rows_read_and_recompress(make_model, client, headers):
+    model = make_model([{"url": "https://example.com/"}])
+    legacy = {"url": "https://example.com/",
+              "text_content": {"$zlib": base64.b64encode(zlib.compress(LONG.encode())).decode(), "n": len(LONG)}}
+    db.session.execute(text('UPDATE model_url SET data = :data, packed = NULL WHERE model_id = :id'),
+                       {"data": json.dumps(legacy), "id": model.id})
+    db.session.commit()
+
+    assert reload(model).data['text_content'] == LONG
+    stats = client.get(f'/api/models/{model.id}/storage', headers=headers).get_json()
+    assert (stats['rows'], stats['compressed_fields']) == (1, 1)
+
+    assert model_store.recompress(model) == 1
+    row = reload(model)
+    data, packed = stored(row)
+    assert data['text_content']['$zlib'] == [0, len(packed)]
+    assert row.data['text_content'] == LONG
+
+
+def test_storage_migrates_blob_models_first(make_model, client, headers):
+    model = make_model()
+    model.data = json.dumps([ITEM])
+    db.session.commit()
+
+    stats = client.get(f'/api/models/{model.id}/storage', headers=headers).get_json()
+    assert (stats['rows'], stats['compressed_fields']) == (1, 2)
+    assert stats['raw_chars'] > stats['stored_chars']
+    assert ModelUrl.query.filter_by(model_id=model.id).count() == 1
@@ -0,0 +1,126 @@
+import gzip
+
+import pytest
+
+from benchmarks.servers import _QuietHandler, _Server, build_page, FixtureSite
+from crawler import Crawler
+
+PAGES = 10
+
+
+def sitemap(port, pages):
+    entries = ''.join(f'<url><loc>http://127.0.0.1:{port}/page/{n}</loc></url>' for n in range(pages))
+    return f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>'.encode()
+
+
+class _SitemapHandler(_QuietHandler):
+    def do_GET(self):
+        site = self.owner
+        site.count()
+        if self.path == '/robots.txt':
+            if site.robots_status != 200:
+                return self._send(site.robots_status, b'', 'text/plain')
+            return self._send(200, f"User-agent: *\nSitemap: http://127.0.0.1:{site.port}{site.sitemap_path}\n".encode(),
+                              'text/plain')
+        if self.path == site.sitemap_path:
+            body = sitemap(site.port, site.pages)
+            content_type = 'application/xml'
+            if self.path.endswith('.gz'):
+                body, content_type = gzip.compress(body), 'application/gzip'
+            if not site.truncate:
+                return self._send(200, body, content_type)
+            # Promises the whole body, sends part of it and drops the connection
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body[:int(len(body) * site.truncate)])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        if self.path.startswith('/page/'):
+            return self._send(200, build_page(int(self.path.rsplit('/', 1)[-1]), 500), 'text/html; charset=utf-8')
+        self._send(404, b'not found', 'text/plain')
+
+
+class SitemapSite(_Server):
+    """A site with no links between pages, found only through its one sitemap."""
+    handler = _SitemapHandler
+
+    def __init__(self, sitemap_path='/sitemap.xml', truncate=None, robots_status=200, pages=PAGES):
+        self.sitemap_path = sitemap_path
+        self.pages = pages
+        self.truncate = truncate
+        self.robots_status = robots_status
+        super().__init__()
+
+
+@pytest.fixture
+def sitemap_site(request):
+    server = SitemapSite(**getattr(request, 'param', {})).start()
+    yield server
+    server.stop()
+
+
+def crawl_pages(port, **options):
+    crawler = Crawler(f'http://127.0.0.1:{port}/', max_urls=200, **options)
+    pages = {url.rsplit('/', 1)[-1] for url, depth, source, result in crawler.crawl() if '/page/' in url}
+    return pages, crawler.stats
+
+
+def test_crawl_follows_sitemap_index_and_links_and_honours_robots():
+    site = FixtureSite(latency=0, page_bytes=500, page_count=40).start()
+    try:
+        pages, stats = crawl_pages(site.port)
+    finally:
+        site.stop()
+
+    assert pages == {str(n) for n in range(40)}
+    assert site.private_hits == 0 and stats['robots_blocked'] > 0
+    assert stats['sitemaps'] == 2 and stats['sitemap_urls'] == 20
+    assert stats['off_site'] > 0
+
+
+def test_robots_can_be_ignored():
+    site = FixtureSite(latency=0, page_bytes=500, page_count=8).start()
+    try:
+        crawl_pages(site.port, respect_robots=False, use_sitemaps=False)
+    finally:
+        site.stop()
+    assert site.private_hits > 0
+
+
+def read_sitemaps(port):
+    crawler = Crawler(f'http://127.0.0.1:{port}/')
+    crawler.load_robots()
+    return list(crawler.sitemap_urls())
+
+
+@pytest.mark.parametrize('sitemap_site', [{"sitemap_path": '/sitemap.xml.gz', "pages": 3000}], indirect=True)
+def test_gzip_sitemap(sitemap_site):
+    urls = read_sitemaps(sitemap_site.port)
+    assert urls == [f'http://127.0.0.1:{sitemap_site.port}/page/{n}' for n in range(3000)]
+
+
+@pytest.mark.parametrize('sitemap_site', [{"truncate": 0.5, "pages": 3000},
+                                          {"sitemap_path": '/sitemap.xml.gz', "truncate": 0.5, "pages": 3000}],
+                         indirect=True)
+def test_truncated_sitemap_keeps_the_entries_that_arrived(sitemap_site):
+    urls = read_sitemaps(sitemap_site.port)
+    assert 1000 < len(urls) < 3000
+    assert urls == [f'http://127.0.0.1:{sitemap_site.port}/page/{n}' for n in range(len(urls))]
+
+
+@pytest.mark.parametrize('sitemap_site', [{"truncate": 0.6}], indirect=True)
+def test_crawl_carries_on_past_truncated_sitemap(sitemap_site):
+    pages, stats = crawl_pages(sitemap_site.port)
+    assert 0 < stats['sitemap_urls'] < PAGES
+    assert pages == {str(n) for n in range(stats['sitemap_urls'])}
+
+
+@pytest.mark.parametrize('sitemap_site', [{"robots_status": 500, "sitemap_path": '/missing.xml'}], indirect=True)
+def test_missing_robots_and_sitemap_still_crawl_base_url(sitemap_site):
+    crawler = Crawler(f'http://127.0.0.1:{sitemap_site.port}/', max_urls=10)
+    results = list(crawler.crawl())
+    assert [source for url, depth, source, result in results] == ['base']
+    assert crawler.stats['sitemaps'] == 1 and crawler.stats['sitemap_urls'] == 0
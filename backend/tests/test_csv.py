@@ -0,0 +1,79 @@
+import io
+import os
+
+import pytest
+
+import model_store
+from models import db, CSV, Model
+
+
+def upload(client, headers, text, filename='urls.csv'):
+    response = client.post('/api/csvs', headers=headers, content_type='multipart/form-data',
+                           data={"file": (io.BytesIO(text.encode('utf-8')), filename)})
+    assert response.status_code == 201
+    return db.session.get(CSV, response.get_json()['id'])
+
+
+def csv_text(rows, delimiter=','):
+    lines = [delimiter.join(['url', 'title', 'notes'])]
+    lines += [delimiter.join([f'https://example.com/{n}', f'Page {n}', f'note {n}']) for n in range(rows)]
+    return '\n'.join(lines) + '\n'
+
+
+def preview(client, headers, record, **args):
+    return client.get(f'/api/csvs/{record.id}/preview', headers=headers, query_string=args)
+
+
+def test_upload_streams_to_disk(ctx, client, headers):
+    # BOM, and a quoted newline that a line count would get wrong
+    record = upload(client, headers, '﻿' + csv_text(3000) + '"https://example.com/x","multi\nline",n\n')
+
+    assert record.content == ''
+    assert os.path.getsize(record.path) == record.size_bytes
+    assert (record.row_count, record.columns, record.delimiter) == (3001, ['url', 'title', 'notes'], ',')
+
+    response = client.post('/api/models', headers=headers,
+                           json={"csv_id": record.id, "url_column": "url", "model_name": "from csv"})
+    assert response.status_code == 201
+    assert response.get_json()['url_count'] == 3001
+    model = db.session.get(Model, response.get_json()['id'])
+    assert model_store.rows(model).all()[-1].data['additional_data'] == {"title": "multi\nline", "notes": "n"}
+
+
+@pytest.mark.parametrize('delimiter', [',', ';', '\t', '|'])
+def test_delimiter_is_sniffed(ctx, client, headers, delimiter):
+    record = upload(client, headers, csv_text(5, delimiter))
+
+    assert (record.delimiter, record.columns, record.row_count) == (delimiter, ['url', 'title', 'notes'], 5)
+    assert preview(client, headers, record).get_json()['rows'][0] == \
+        {"url": "https://example.com/0", "title": "Page 0", "notes": "note 0"}
+
+
+def test_single_column_falls_back_to_comma(ctx, client, headers):
+    record = upload(client, headers, 'url\nhttps://example.com/a\nhttps://example.com/b\n')
+    assert (record.delimiter, record.columns, record.row_count) == (',', ['url'], 2)
+
+
+def test_preview_limits_rows_and_columns(ctx, client, headers):
+    record = upload(client, headers, csv_text(150))
+
+    assert len(preview(client, headers, record).get_json()['rows']) == 10
+    assert len(preview(client, headers, record, rows=3).get_json()['rows']) == 3
+    assert len(preview(client, headers, record, rows=1000).get_json()['rows']) == 100
+    response = preview(client, headers, record, rows=-1)
+    assert (response.status_code, response.get_json()['rows']) == (200, [])
+
+    rows = preview(client, headers, record, rows=2, columns='title,url').get_json()['rows']
+    assert rows == [{"title": "Page 0", "url": "https://example.com/0"},
+                    {"title": "Page 1", "url": "https://example.com/1"}]
+    assert preview(client, headers, record, columns='url,missing').status_code == 400
+
+
+def test_preview_of_inline_legacy_record(ctx, client, headers):
+    record = CSV(filename='old.csv', content=csv_text(4), user_id='test-user')
+    db.session.add(record)
+    db.session.commit()
+
+    body = preview(client, headers, record, rows=2, columns='url').get_json()
+    assert body['columns'] == ['url', 'title', 'notes']
+    assert body['rows'] == [{"url": "https://example.com/0"}, {"url": "https://example.com/1"}]
@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+
+import pytest
+
+import database
+import jobs
+import model_store
+import routes
+from models import db, Job, ModelUrl
+
+
+def parse_events(chunks):
+    return [json.loads(line[len('data: '):]) for line in b''.join(chunks).decode().splitlines()
+            if line.startswith('data: ')]
+
+
+def test_job_events_sees_commits_made_after_it_started(app, make_model, client, headers, site, monkeypatch):
+    model = make_model([{"url": f"http://127.0.0.1:{site.port}/page/{n}"} for n in range(2)])
+    job_id = client.post(f'/api/models/{model.id}/scrape', headers=headers,
+                         json={"background": True, "delay": 0}).get_json()['job_id']
+
+    polls = []
+
+    def sleep(seconds):
+        # The stream's first poll has read the queued job; a worker on its own connection runs it now
+        if not polls:
+            with app.app_context():
+                assert jobs._claim('worker-1') == job_id
+                jobs.run_job(job_id)
+        polls.append(seconds)
+        assert len(polls) < 10, "job_events never saw the job finish"
+
+    class PatchedTime:
+        def __getattr__(self, name):
+            return sleep if name == 'sleep' else getattr(time, name)
+
+    # Only the route's view of time.sleep, so the worker's own scrape is unaffected
+    monkeypatch.setattr(routes, 'time', PatchedTime())
+    response = client.get(f'/api/jobs/{job_id}/events', headers=headers, buffered=False)
+    events = parse_events(response.response)
+
+    assert events[0]['status'] == 'queued'
+    assert events[-1]['event'] == 'summary' and events[-1]['status'] == 'completed'
+    assert events[-1]['progress'] == 2
+
+
+def test_concurrent_claims_take_each_job_once(app, make_model, client, headers, site):
+    model = make_model([{"url": f"http://127.0.0.1:{site.port}/page/0"}])
+    job_ids = {client.post(f'/api/models/{model.id}/scrape', headers=headers,
+                           json={"background": True}).get_json()['job_id'] for _ in range(12)}
+    claimed = []
+
+    def worker(n):
+        with app.app_context():
+            while True:
+                job_id = jobs._claim(f'worker-{n}')
+                if job_id is None and not Job.query.filter_by(status='queued').count():
+                    return
+                if job_id is not None:
+                    claimed.append(job_id)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == sorted(job_ids)
+
+
+@pytest.mark.server_db
+def test_server_database_uses_connection_pool(app):
+    with app.app_context():
+        info = database.describe(db.engine)
+        assert info['backend'] != 'sqlite'
+        assert info['pool'] == 'QueuePool' and info['pool_size'] == database.POOL_SIZE
+        assert db.engine.pool._pre_ping
+
+
+@pytest.mark.server_db
+def test_server_database_round_trips_rows(make_model):
+    text = 'word ' * 100000
+    model = make_model([{"url": "https://example.com/a", "text_content": text}, {"title": "no url"}])
+
+    db.session.expire_all()
+    rows = model_store.rows(model).all()
+    assert [row.position for row in rows] == [0, 1]
+    assert rows[0].data['text_content'] == text
+    assert ModelUrl.query.filter(ModelUrl.url.is_(None)).count() == 1
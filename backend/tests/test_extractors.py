@@ -0,0 +1,63 @@
+import pytest
+
+from benchmarks.servers import build_page
+from extractors import get_extractor, LxmlExtractor, SoupExtractor
+
+ARTICLE = """<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>Trail running shoes &amp; boots</title>
+<meta name="description" content="Our pick of trail shoes for 2024">
+<style>p { color: red }</style><script>var p = "<p>not text</p>";</script></head>
+<body><header><a href="/">Home</a><p>Free shipping over $50</p></header>
+<nav class="menu"><a href="/shoes">Shoes</a> <a href="/login" rel="nofollow">Log in</a></nav>
+<main><article><h1>Best trail <em>running</em> shoes</h1>
+<p>Grip, <strong>cushioning</strong> and fit&nbsp;matter most.<br>Here is how we tested.</p>
+<div class="sidebar"><h3>Related</h3><p>Hiking boots</p></div>
+<h2>1. Speedgoat</h2><p>Light and <a href="/speedgoat" rel="external">well priced</a>.</p>
+<template><p>Loaded later</p></template>
+<footer><p>Updated weekly</p></footer></article></main>
+<footer><p>&copy; 2024 Example</p><a href="https://twitter.com/example">Twitter</a></footer>
+</body></html>"""
+
+CONTENT_DIV = """<html><head><title>Guide</title></head><body>
+<div class="navigation"><p>Skip me</p></div>
+<div class="page content"><h2>Sizing</h2><p>Go half a size up.</p><nav><p>Next page</p></nav></div>
+<p>Outside the content div</p></body></html>"""
+
+NO_CONTAINER = """<html><head><title>Plain</title></head><body>
+<h1>Plain page</h1><p>First paragraph.</p><nav><p>Still counted without a container</p></nav>
+<h4>Small heading</h4><p>Last <span>paragraph</span>.</p></body></html>"""
+
+PAGES = {
+    "article": ARTICLE,
+    "content_div": CONTENT_DIV,
+    "no_container": NO_CONTAINER,
+    "fixture": build_page(7, 3000, links=['/page/15', '/private/7']).decode(),
+    "xml_declaration": '<?xml version="1.0" encoding="utf-8"?>' + NO_CONTAINER,
+    "no_title": "<html><body><main><p>Only body text</p></main></body></html>",
+    "empty_meta": '<html><head><meta name="description"></head><body><h1> Spaced </h1></body></html>',
+}
+
+
+@pytest.mark.parametrize('name', PAGES)
+def test_lxml_matches_soup(name):
+    html = PAGES[name]
+    assert LxmlExtractor().extract(html, links=True) == SoupExtractor().extract(html, links=True)
+
+
+def test_article_fields():
+    fields = SoupExtractor().extract(ARTICLE, links=True)
+    assert fields['title'] == 'Trail running shoes & boots'
+    assert fields['h1'] == 'Best trail running shoes'
+    assert fields['text_content'].split('\n\n') == [
+        'Best trailrunningshoes', 'Grip,cushioningand fit\xa0matter most.Here is how we tested.',
+        '1. Speedgoat', 'Light andwell priced.', '']
+    assert '/login' not in fields['links'] and '/speedgoat' in fields['links']
+
+
+def test_soup_is_the_default(monkeypatch):
+    monkeypatch.delenv('SCRAPER_EXTRACTOR', raising=False)
+    assert isinstance(get_extractor(), SoupExtractor)
+    monkeypatch.setenv('SCRAPER_EXTRACTOR', 'lxml')
+    assert isinstance(get_extractor(), LxmlExtractor)
+    with pytest.raises(ValueError):
+        get_extractor('html5lib')
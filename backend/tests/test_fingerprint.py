@@ -0,0 +1,29 @@
+import fingerprint
+from fingerprint import LSHIndex
+
+
+def test_nearest_prefers_the_closest_key():
+    index = LSHIndex(max_distance=3)
+    index.add('far', 0b111)
+    index.add('near', 0b1)
+
+    assert index.nearest(0) == ('near', 1)
+    assert index.nearest(0b1111 << 20) is None
+
+
+def test_nearest_breaks_ties_by_insertion_order():
+    index = LSHIndex(max_distance=3)
+    # Both one bit from 0, but 'late' shares the first band with it and is met there first
+    index.add('early', 1)
+    index.add('late', 1 << 63)
+
+    assert index.nearest(0) == ('early', 1)
+    index.add('early', 1)
+    assert index.nearest(0) == ('early', 1)
+
+
+def test_cluster_members_join_the_first_equally_close_representative():
+    # Four bits apart, so both are representatives; 'page' is two bits from each
+    keys = [('early', 0b11), ('late', 0b11 << 62), ('page', 0), ('blank', None)]
+
+    assert fingerprint.cluster(keys, max_distance=3) == {'page': ('early', 2)}
@@ -0,0 +1,141 @@
+import json
+import time
+
+import pytest
+
+import firebase_auth
+from benchmarks.run import emulator_token
+from benchmarks.servers import _QuietHandler, _Server
+
+
+class Stop(Exception):
+    pass
+
+
+class Clock:
+    """Stands in for firebase_auth.time: wall-clock time() is shifted, everything else is real."""
+
+    def __init__(self):
+        self.offset = 0.0
+        self.sleeps = []
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+    def time(self):
+        return time.time() + self.offset
+
+    def sleep(self, seconds):
+        # Ends PublicKeySet._run's loop after its third wait
+        self.sleeps.append(seconds)
+        if len(self.sleeps) == 3:
+            raise Stop()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(firebase_auth, 'time', clock)
+    monkeypatch.setattr(firebase_auth, '_tokens', type(firebase_auth._tokens)())
+    return clock
+
+
+@pytest.fixture
+def verifications(monkeypatch):
+    calls = []
+    verify = firebase_auth._verify
+
+    def counting(token):
+        calls.append(token)
+        return verify(token)
+
+    monkeypatch.setattr(firebase_auth, '_verify', counting)
+    return calls
+
+
+def test_verified_tokens_are_cached_until_exp(app, clock, verifications):
+    token = emulator_token('cache-user', 'cache@example.com')
+    claims = firebase_auth.verify_id_token(token)
+    assert claims['uid'] == 'cache-user'
+
+    clock.offset = claims['exp'] - time.time() - 1
+    assert firebase_auth.verify_id_token(token) == claims
+    assert len(verifications) == 1
+
+    # At exp the cached claims are dropped and the token goes back to the verifier
+    clock.offset = claims['exp'] - time.time()
+    firebase_auth.verify_id_token(token)
+    assert len(verifications) == 2 and len(firebase_auth._tokens) == 1
+
+
+def test_rejected_tokens_are_not_cached(app, clock, verifications):
+    with pytest.raises(Exception):
+        firebase_auth.verify_id_token('not-a-token')
+    with pytest.raises(Exception):
+        firebase_auth.verify_id_token('not-a-token')
+    assert len(verifications) == 2 and len(firebase_auth._tokens) == 0
+
+
+def test_requests_share_the_token_cache(client, clock, verifications):
+    auth = {"Authorization": f"Bearer {emulator_token('cache-user', 'cache@example.com')}"}
+    for _ in range(3):
+        assert client.get('/api/models', headers=auth).status_code == 200
+    assert len(verifications) == 1
+
+
+class _CertHandler(_QuietHandler):
+    def do_GET(self):
+        keys = self.owner
+        keys.count()
+        if keys.failing:
+            return self._send(503, b"unavailable", 'text/plain')
+        self._send(200, json.dumps({f"kid-{keys.version}": "certificate"}).encode(), 'application/json',
+                   {'Cache-Control': f'public, max-age={keys.max_age}, must-revalidate'})
+
+
+class CertServer(_Server):
+    """Serves a one-key certificate set like Google's securetoken endpoint; bump `version` to rotate."""
+    handler = _CertHandler
+
+    def __init__(self):
+        self.version = 1
+        self.max_age = 120
+        self.failing = False
+        super().__init__()
+
+
+@pytest.fixture
+def certs():
+    server = CertServer().start()
+    yield server
+    server.stop()
+
+
+def test_key_set_refreshes_at_half_max_age(certs, clock):
+    keys = firebase_auth.PublicKeySet(f"http://127.0.0.1:{certs.port}/")
+    assert keys.certs() is None
+
+    def rotate_then_fail():
+        # Between refreshes: rotate the keys, then take the endpoint down
+        if len(clock.sleeps) == 1:
+            certs.version, certs.max_age = 2, 7200
+        elif len(clock.sleeps) == 2:
+            certs.failing = True
+    refresh = keys.refresh
+    keys.refresh = lambda: (rotate_then_fail(), refresh())[1]
+
+    with pytest.raises(Stop):
+        keys._run()
+
+    assert clock.sleeps == [60, 3600, firebase_auth.KEY_RETRY_SECONDS]
+    # The failed refresh kept the last good keys
+    assert keys.certs() == {"kid-2": "certificate"} and certs.requests == 3
+
+
+def test_short_max_age_is_floored(certs, clock):
+    certs.max_age = 10
+    keys = firebase_auth.PublicKeySet(f"http://127.0.0.1:{certs.port}/")
+
+    with pytest.raises(Stop):
+        keys._run()
+    assert clock.sleeps == [firebase_auth.KEY_RETRY_SECONDS] * 3
@@ -0,0 +1,62 @@
+import threading
+
+import pytest
+
+from http_session import SessionManager
+
+
+@pytest.fixture
+def manager():
+    manager = SessionManager()
+    yield manager
+    manager.close()
+
+
+def test_keep_alive_connections_are_reused(site, manager):
+    for n in range(5):
+        assert manager.get(f"http://127.0.0.1:{site.port}/page/{n}").status_code == 200
+
+    stats = manager.snapshot()
+    assert (stats['requests'], stats['new_connections'], stats['reused_connections']) == (5, 1, 4)
+    assert stats['reuse_ratio'] == 0.8
+    assert stats['handshake_ms_avg'] == stats['handshake_ms_total'] > 0
+
+
+def test_each_host_gets_its_own_connection(site, manager):
+    for host in ('127.0.0.1', 'localhost', '127.0.0.1', 'localhost'):
+        manager.get(f"http://{host}:{site.port}/page/0")
+
+    stats = manager.snapshot()
+    assert (stats['requests'], stats['new_connections'], stats['reused_connections']) == (4, 2, 2)
+
+
+def test_concurrent_requests_share_a_bounded_pool(site):
+    manager = SessionManager(pool_maxsize=4)
+
+    def fetch():
+        for n in range(5):
+            manager.get(f"http://127.0.0.1:{site.port}/page/{n}")
+
+    threads = [threading.Thread(target=fetch) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    manager.close()
+
+    stats = manager.snapshot()
+    assert stats['requests'] == 20 and site.requests == 20
+    assert 1 <= stats['new_connections'] <= 4
+    assert stats['reused_connections'] == 20 - stats['new_connections']
+
+
+def test_scrapes_show_up_in_the_stats_endpoint(make_model, client, headers, site):
+    before = client.get('/api/scraper/stats', headers=headers).get_json()
+    model = make_model([{"url": f"http://127.0.0.1:{site.port}/page/{n}"} for n in range(3)])
+    client.post(f'/api/models/{model.id}/scrape', headers=headers, json={"delay": 0})
+
+    after = client.get('/api/scraper/stats', headers=headers).get_json()
+    assert after['requests'] - before['requests'] == 3
+    # A fresh FixtureSite port is a new host to the shared pool, reached over one connection
+    assert after['new_connections'] - before['new_connections'] == 1
+    assert (after['pool_connections'], after['pool_maxsize'], after['http2']) == (50, 10, False)
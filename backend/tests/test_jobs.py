@@ -0,0 +1,218 @@
+import json
+import time
+
+import jobs
+import model_store
+import operations
+import routes
+from models import db, Job, ModelUrl
+
+
+def page_items(site, count):
+    return [{"url": f"http://127.0.0.1:{site.port}/page/{n}"} for n in range(count)]
+
+
+def queue_scrape(client, headers, model, **params):
+    response = client.post(f'/api/models/{model.id}/scrape', headers=headers,
+                           json={"background": True, "delay": 0, **params})
+    assert response.status_code == 202
+    return response.get_json()['job_id']
+
+
+def test_claim_runs_to_completion(make_model, client, headers, site):
+    model = make_model(page_items(site, 3))
+    job_id = queue_scrape(client, headers, model)
+
+    assert jobs._claim('worker-1') == job_id
+    # Already running, so a second worker finds nothing
+    assert jobs._claim('worker-2') is None
+    jobs.run_job(job_id)
+
+    job = db.session.get(Job, job_id)
+    assert (job.status, job.progress, job.total, job.cursor) == ('completed', 3, 3, 2)
+    assert job.result['fetched_count'] == 3
+
+
+def test_cancel_queued_job(make_model, client, headers, site):
+    model = make_model(page_items(site, 1))
+    job_id = queue_scrape(client, headers, model)
+
+    response = client.post(f'/api/jobs/{job_id}/cancel', headers=headers)
+    assert response.get_json()['status'] == 'cancelled'
+    assert jobs._claim('worker-1') is None
+    assert client.post(f'/api/jobs/{job_id}/cancel', headers=headers).status_code == 409
+
+
+def test_cancel_running_job_then_resume(make_model, client, headers, site):
+    model = make_model(page_items(site, 4))
+    job_id = queue_scrape(client, headers, model)
+    assert jobs._claim('worker-1') == job_id
+
+    client.post(f'/api/jobs/{job_id}/cancel', headers=headers)
+    jobs.run_job(job_id)
+    job = db.session.get(Job, job_id)
+    # Stops after the first item is committed
+    assert (job.status, job.progress, job.cursor) == ('cancelled', 1, 0)
+
+    response = client.post(f'/api/jobs/{job_id}/resume', headers=headers)
+    assert response.status_code == 202
+    assert jobs._claim('worker-1') == job_id
+    jobs.run_job(job_id)
+
+    db.session.expire_all()
+    job = db.session.get(Job, job_id)
+    assert (job.status, job.progress, job.total, job.cursor) == ('completed', 4, 4, 3)
+    # The resumed run only fetched what the cancelled one hadn't
+    assert job.result['fetched_count'] == 3
+    assert all(row.scraped_at for row in model_store.rows(model))
+    assert client.post(f'/api/jobs/{job_id}/resume', headers=headers).status_code == 409
+
+
+def test_stale_running_job_is_interrupted(make_model, client, headers, site):
+    model = make_model(page_items(site, 1))
+    job_id = queue_scrape(client, headers, model)
+    jobs._claim('worker-1')
+    job = db.session.get(Job, job_id)
+    job.heartbeat_at = job.heartbeat_at - jobs.STALE_AFTER * 2
+    db.session.commit()
+
+    assert jobs._claim('worker-2') is None
+    db.session.expire_all()
+    assert db.session.get(Job, job_id).status == 'interrupted'
+    assert client.post(f'/api/jobs/{job_id}/resume', headers=headers).status_code == 202
+
+
+def test_deleting_model_deletes_its_jobs(make_model, client, headers, site):
+    model = make_model(page_items(site, 2))
+    queue_scrape(client, headers, model)
+    job_id = queue_scrape(client, headers, model)
+    jobs._claim('worker-1')
+    jobs.run_job(job_id)
+
+    assert client.delete(f'/api/models/{model.id}', headers=headers).status_code == 200
+    assert Job.query.count() == 0
+
+
+def test_deleting_model_stops_its_running_job(make_model, client, headers, site, monkeypatch):
+    model = make_model(page_items(site, 4))
+    model_id = model.id
+    job_id = queue_scrape(client, headers, model)
+    scrape = operations.OPERATIONS['scrape']
+
+    def scrape_then_delete(*args, **kwargs):
+        for event in scrape(*args, **kwargs):
+            yield event
+            if event['event'] == 'item':
+                # The first item is committed; the model goes before the second
+                assert client.delete(f'/api/models/{model_id}', headers=headers).status_code == 200
+
+    monkeypatch.setitem(operations.OPERATIONS, 'scrape', scrape_then_delete)
+    assert jobs._claim('worker-1') == job_id
+    jobs.run_job(job_id)
+
+    db.session.expire_all()
+    assert db.session.get(Job, job_id) is None
+    assert ModelUrl.query.filter_by(model_id=model_id).count() == 0
+    response = client.get(f'/api/jobs/{job_id}/events', headers=headers)
+    assert response.status_code == 404
+
+
+def test_job_events_keeps_idle_stream_alive(app, make_model, client, headers, site, monkeypatch):
+    model = make_model(page_items(site, 1))
+    job_id = queue_scrape(client, headers, model)
+    polls = []
+
+    class IdleTime:
+        # Progress stands still for three polls, then a worker runs the job
+        def __getattr__(self, name):
+            return getattr(time, name)
+
+        def sleep(self, seconds):
+            polls.append(seconds)
+            if len(polls) == 3:
+                with app.app_context():
+                    jobs._claim('worker-1')
+                    jobs.run_job(job_id)
+
+    monkeypatch.setattr(routes, 'time', IdleTime())
+    monkeypatch.setattr(routes, 'SSE_KEEPALIVE_SECONDS', 0)
+    body = client.get(f'/api/jobs/{job_id}/events', headers=headers).get_data(as_text=True)
+
+    assert body.count(': keepalive\n\n') == 2
+    summary = json.loads(body.rstrip().splitlines()[-1][len('data: '):])
+    assert (summary['event'], summary['status']) == ('summary', 'completed')
+
+
+def queue_rate(client, headers, model):
+    response = client.post(f'/api/models/{model.id}/rate-content', headers=headers, json={
+        "apiKey": "secret-key", "contentType": "text_content", "ratingMethod": "claude", "background": True})
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+    assert db.session.get(Job, job_id).params['apiKey'] == 'secret-key'
+    return job_id
+
+
+def stored_params(job_id):
+    db.session.expire_all()
+    return db.session.get(Job, job_id).params
+
+
+def test_api_key_is_dropped_however_a_job_ends(make_model, client, headers, monkeypatch):
+    model = make_model([{"url": f"https://example.com/{n}", "text_content": f"page {n} " * 50} for n in range(3)])
+
+    cancelled_queued = queue_rate(client, headers, model)
+    client.post(f'/api/jobs/{cancelled_queued}/cancel', headers=headers)
+
+    interrupted = queue_rate(client, headers, model)
+    assert jobs._claim('worker-1') == interrupted
+    job = db.session.get(Job, interrupted)
+    job.heartbeat_at = job.heartbeat_at - jobs.STALE_AFTER * 2
+    db.session.commit()
+
+    cancelled_running = queue_rate(client, headers, model)
+    assert jobs._claim('worker-2') == cancelled_running
+    client.post(f'/api/jobs/{cancelled_running}/cancel', headers=headers)
+    jobs.run_job(cancelled_running)
+
+    failed = queue_rate(client, headers, model)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("upstream exploded")
+        yield
+
+    with monkeypatch.context() as patch:
+        patch.setitem(operations.OPERATIONS, 'rate', broken)
+        assert jobs._claim('worker-3') == failed
+        jobs.run_job(failed)
+
+    completed = queue_rate(client, headers, model)
+    assert jobs._claim('worker-4') == completed
+    jobs.run_job(completed)
+
+    for job_id, status in [(cancelled_queued, 'cancelled'), (interrupted, 'interrupted'),
+                           (cancelled_running, 'cancelled'), (failed, 'failed'), (completed, 'completed')]:
+        assert db.session.get(Job, job_id).status == status
+        params = stored_params(job_id)
+        assert 'apiKey' not in params and params['contentType'] == 'text_content'
+
+
+def test_resuming_a_keyed_job_needs_the_key_again(make_model, client, headers):
+    model = make_model([{"url": f"https://example.com/{n}", "text_content": f"page {n} " * 50} for n in range(3)])
+    job_id = queue_rate(client, headers, model)
+    assert jobs._claim('worker-1') == job_id
+    client.post(f'/api/jobs/{job_id}/cancel', headers=headers)
+    jobs.run_job(job_id)
+
+    response = client.post(f'/api/jobs/{job_id}/resume', headers=headers)
+    assert response.status_code == 400
+    assert db.session.get(Job, job_id).status == 'cancelled'
+
+    response = client.post(f'/api/jobs/{job_id}/resume', headers=headers, json={"apiKey": "new-key"})
+    assert response.status_code == 202
+    assert stored_params(job_id)['apiKey'] == 'new-key'
+    assert jobs._claim('worker-1') == job_id
+    jobs.run_job(job_id)
+
+    job = db.session.get(Job, job_id)
+    assert (job.status, job.progress) == ('completed', 3)
+    assert 'apiKey' not in stored_params(job_id)
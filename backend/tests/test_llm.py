@@ -0,0 +1,52 @@
+import random
+
+import anthropic
+import pytest
+
+import llm
+from benchmarks.servers import FakeAnthropic, WORDS
+
+rng = random.Random(2)
+CONTENTS = [' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 200))) for _ in range(24)]
+
+
+def expected_rating(content):
+    # What FakeAnthropic answers for a prompt of this length
+    return 70 + max(1, len(content) // 4) % 30
+
+
+@pytest.fixture
+def throttled():
+    server = FakeAnthropic(latency=0, throttle_rate=0.3, seed=3).start()
+    yield server
+    server.stop()
+
+
+def test_dispatcher_retries_throttled_calls_in_order(throttled, monkeypatch):
+    client = anthropic.Anthropic(api_key='test-key', base_url=throttled.base_url, max_retries=0)
+    limiter = llm.RateLimiter(requests_per_minute=6000, tokens_per_minute=10 ** 7)
+    pauses = []
+    pause = limiter.pause
+    monkeypatch.setattr(limiter, 'pause', lambda seconds: (pauses.append(seconds), pause(seconds)))
+
+    def rate(content):
+        message = client.messages.create(**llm.rating_request(content))
+        return llm.parse_rating(message.content[0].text)
+
+    dispatcher = llm.LLMDispatcher(limiter, concurrency=4)
+    results = list(dispatcher.map(rate, CONTENTS, estimate=llm.estimate_tokens))
+
+    assert [error for _, error, _ in results] == [None] * len(CONTENTS)
+    assert [rating for rating, _, _ in results] == [expected_rating(content) for content in CONTENTS]
+    # Some calls were throttled, and each waited the server's retry-after (0.1s), not 2**attempt
+    assert pauses and throttled.requests == len(CONTENTS) + len(pauses)
+    assert set(pauses) == {0.1}
+
+
+def test_retry_delay_falls_back_to_backoff():
+    class Throttled(Exception):
+        status_code = 429
+        response = type('Response', (), {'headers': {}})()
+
+    assert 4 <= llm._retry_delay(Throttled(), 2) <= 5
+    assert llm._retry_delay(ValueError(), 0) is None
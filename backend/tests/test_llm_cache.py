@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+
+import llm_cache
+import metrics
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER = """
+import llm_cache
+for _ in range(3):
+    llm_cache.record_miss()
+llm_cache._count('hits', 2)
+"""
+
+
+def test_stats_count_this_process(ctx):
+    before = llm_cache.stats()
+    llm_cache.record_miss()
+    llm_cache._count('hits', 3)
+    after = llm_cache.stats()
+    assert (after['hits'] - before['hits'], after['misses'] - before['misses']) == (3, 1)
+    assert after['entries'] == 0
+
+
+def test_stats_sum_every_worker(ctx, tmp_path, monkeypatch):
+    # Two "gunicorn workers" write their samples to the shared directory, as under gunicorn.conf.py
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+    for _ in range(2):
+        subprocess.run([sys.executable, '-c', WORKER], cwd=BACKEND, env=env, check=True)
+
+    monkeypatch.setattr(metrics, 'MULTIPROC_DIR', str(tmp_path))
+    stats = llm_cache.stats()
+    assert (stats['hits'], stats['misses'], stats['stores']) == (4, 6, 0)
+    assert stats['hit_rate'] == 0.4
@@ -0,0 +1,25 @@
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def token(monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_TOKEN', 'scrape-secret')
+    return 'scrape-secret'
+
+
+def test_metrics_disabled_without_token(client, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_TOKEN', None)
+    assert client.get('/api/metrics').status_code == 404
+
+
+def test_metrics_require_bearer_token(client, headers, token):
+    assert client.get('/api/metrics').status_code == 401
+    # A signed-in user's Firebase token is not the scrape token
+    response = client.get('/api/metrics', headers=headers)
+    assert response.status_code == 401 and response.headers['WWW-Authenticate'] == 'Bearer'
+
+    response = client.get('/api/metrics', headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert b'http_request_seconds' in response.data
@@ -0,0 +1,97 @@
+import pytest
+
+import model_store
+from models import db
+
+# Even positions scraped; every third position rated, with ratings that don't follow position order
+ITEMS = [{"url": f"https://example.com/{chr(ord('g') - n)}", "title": f"Page {n}",
+          **({"scraped_at": f"2026-10-0{n + 1}T00:00:00"} if n % 2 == 0 else {}),
+          **({"text_content-rating": [50, 90, 70][n // 3]} if n % 3 == 0 else {})}
+         for n in range(7)]
+
+
+@pytest.fixture
+def model(make_model):
+    return make_model(ITEMS)
+
+
+def get(client, headers, model, **args):
+    response = client.get(f'/api/models/{model.id}', headers=headers, query_string=args)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def positions(body):
+    return [item['position'] for item in body['items']]
+
+
+def test_without_paging_params_returns_legacy_payload(client, headers, model):
+    body = get(client, headers, model)
+    assert [item['url'] for item in body['data']] == [item['url'] for item in ITEMS]
+    assert 'items' not in body
+
+
+def test_cursor_and_offset_pagination(client, headers, model):
+    first = get(client, headers, model, limit=3)
+    assert (positions(first), first['total'], first['next_cursor']) == ([0, 1, 2], 7, 2)
+    second = get(client, headers, model, limit=3, cursor=first['next_cursor'])
+    assert (positions(second), second['next_cursor']) == ([3, 4, 5], 5)
+    last = get(client, headers, model, limit=3, cursor=second['next_cursor'])
+    assert (positions(last), last['next_cursor']) == ([6], None)
+
+    assert positions(get(client, headers, model, limit=2, offset=5)) == [5, 6]
+    # Out-of-range limits are clamped rather than rejected
+    assert len(get(client, headers, model, limit=0)['items']) == 1
+    assert get(client, headers, model, limit=5000)['limit'] == 1000
+
+
+def test_field_projection(client, headers, model):
+    # Column-backed fields are read without loading the item JSON
+    assert get(client, headers, model, limit=2, fields='url,rating')['items'] == [
+        {"position": 0, "url": "https://example.com/g", "rating": 50},
+        {"position": 1, "url": "https://example.com/f", "rating": None}]
+    assert get(client, headers, model, limit=2, fields='title,scraped_at')['items'] == [
+        {"position": 0, "title": "Page 0", "scraped_at": "2026-10-01T00:00:00"},
+        {"position": 1, "title": "Page 1"}]
+
+
+def test_filters(client, headers, model):
+    assert positions(get(client, headers, model, scraped='true')) == [0, 2, 4, 6]
+    assert positions(get(client, headers, model, scraped='false')) == [1, 3, 5]
+    assert positions(get(client, headers, model, rated='true')) == [0, 3, 6]
+    body = get(client, headers, model, scraped='true', rated='false')
+    assert (positions(body), body['total']) == ([2, 4], 2)
+
+
+def test_sorting(client, headers, model):
+    assert positions(get(client, headers, model, sort='url')) == [6, 5, 4, 3, 2, 1, 0]
+    # Unrated rows sort last either way, in position order
+    assert positions(get(client, headers, model, sort='-rating')) == [3, 6, 0, 1, 2, 4, 5]
+    assert positions(get(client, headers, model, sort='rating', limit=2, offset=1)) == [6, 3]
+
+    assert client.get(f'/api/models/{model.id}?sort=title', headers=headers).status_code == 400
+    assert client.get(f'/api/models/{model.id}?sort=url&cursor=1', headers=headers).status_code == 400
+
+
+def test_etag_revalidation(client, headers, model):
+    url = f'/api/models/{model.id}?limit=2'
+    response = client.get(url, headers=headers)
+    etag = response.headers['ETag']
+
+    assert client.get(url, headers={**headers, "If-None-Match": etag}).status_code == 304
+    # Different parameters are a different representation
+    other = client.get(f'/api/models/{model.id}?limit=3', headers={**headers, "If-None-Match": etag})
+    assert other.status_code == 200
+
+    model_store.update_row(model_store.rows(model).first(), {"title": "changed"})
+    db.session.commit()
+    response = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+    assert response.get_json()['items'][0]['title'] == 'changed'
+
+
+def test_page_helper_matches_route(model):
+    body = model_store.page(model, 2, fields=['url'], scraped=True, sort='-url')
+    assert body == {"items": [{"position": 0, "url": "https://example.com/g"},
+                              {"position": 2, "url": "https://example.com/e"}],
+                    "total": 4, "next_cursor": None}
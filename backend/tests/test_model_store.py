@@ -0,0 +1,44 @@
+import threading
+
+import model_store
+from models import db, Model
+
+
+def test_concurrent_appends_get_distinct_positions(app, make_model):
+    model_id = make_model([{"url": "https://example.com/0"}]).id
+    errors = []
+
+    def append(worker):
+        with app.app_context():
+            try:
+                for n in range(10):
+                    model = db.session.get(Model, model_id)
+                    if n % 2:
+                        model_store.add_item(model, {"url": f"https://example.com/{worker}/{n}"})
+                    else:
+                        model_store.add_items(model, [{"url": f"https://example.com/{worker}/{n}/{m}"}
+                                                      for m in range(3)])
+                    db.session.commit()
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=append, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    db.session.expire_all()
+    model = db.session.get(Model, model_id)
+    positions = [row.position for row in model_store.rows(model)]
+    assert positions == list(range(1 + 4 * (5 + 5 * 3)))
+    assert model.revision == 1 + 4 * 10
+
+
+def test_appending_nothing_leaves_model_untouched(make_model):
+    model = make_model([{"url": "https://example.com/"}])
+    revision = model.revision
+    assert model_store.add_items(model, iter([])) == 0
+    db.session.commit()
+    assert model.revision == revision
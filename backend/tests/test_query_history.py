@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import query_history
+from models import db, QueryRankDaily, QueryRun
+
+URL = "https://example.com/shoes"
+NOW = datetime.utcnow()
+
+
+def days_ago(days, hour=12):
+    return (NOW - timedelta(days=days)).replace(hour=hour, minute=0, second=0, microsecond=0)
+
+
+def results(rank):
+    # The highlighted URL at `rank`, or missing from the results when rank is None
+    urls = [f"https://other.com/{n}" for n in range(1, 6)]
+    if rank is not None:
+        urls[rank - 1] = URL
+    return [{"url": url, "rank": n} for n, url in enumerate(urls, 1)]
+
+
+def record(model, query, rank, created_at, method='google'):
+    return query_history.record_run(model, query, method, results(rank), {"highlighted_url": URL}, created_at)
+
+
+@pytest.fixture
+def model(make_model):
+    model = make_model()
+    # Three raw days past the 30-day retention window, two inside it
+    for query, rank, created_at in [
+        ("running shoes", 3, days_ago(40, 9)), ("running shoes", 5, days_ago(40, 15)),
+        ("running shoes", None, days_ago(40, 18)), ("running shoes", 2, days_ago(35)),
+        ("trail shoes", 4, days_ago(35)),
+        ("running shoes", 1, days_ago(2)), ("running shoes", None, days_ago(1)),
+    ]:
+        record(model, query, rank, created_at)
+    db.session.commit()
+    return model
+
+
+def test_record_run_finds_the_highlighted_rank(make_model):
+    model = make_model()
+    ranked = record(model, "  running shoes ", 2, None)
+    unranked = query_history.record_run(model, "q", 'google', [{"url": "https://other.com/"}, {"url": URL}],
+                                        {"highlighted_url": URL})
+    missing = record(model, "q", None, None)
+    db.session.commit()
+
+    assert (ranked.query_text, ranked.highlighted_rank) == ("running shoes", 2)
+    # Results without a 'rank' fall back to their position
+    assert unranked.highlighted_rank == 2
+    assert missing.highlighted_rank is None
+    assert QueryRun.query.count() == 3
+
+
+def test_rollup_folds_old_runs_into_days(model):
+    expired = QueryRankDaily(model_id=model.id, query_text="running shoes", method='google',
+                             highlighted_url=URL, day=days_ago(800).date(), runs=1, ranked_runs=1, rank_sum=7)
+    db.session.add(expired)
+    db.session.commit()
+
+    assert query_history.rollup() == {"rolled_up": 5, "daily_rows": 3, "expired": 1}
+
+    days = {(row.query_text, row.day): (row.runs, row.ranked_runs, row.rank_sum, row.best_rank, row.worst_rank)
+            for row in QueryRankDaily.query}
+    assert days == {
+        ("running shoes", days_ago(40).date()): (3, 2, 8, 3, 5),
+        ("running shoes", days_ago(35).date()): (1, 1, 2, 2, 2),
+        ("trail shoes", days_ago(35).date()): (1, 1, 4, 4, 4),
+    }
+    assert sorted(run.created_at for run in QueryRun.query) == [days_ago(2), days_ago(1)]
+
+    # Nothing left to fold; a late run for a rolled-up day is merged into its row
+    assert query_history.rollup() == {"rolled_up": 0, "daily_rows": 0, "expired": 0}
+    record(model, "running shoes", 1, days_ago(40, 20))
+    db.session.commit()
+    query_history.rollup()
+    day = QueryRankDaily.query.filter_by(query_text="running shoes", day=days_ago(40).date()).one()
+    assert (day.runs, day.ranked_runs, day.rank_sum, day.best_rank, day.worst_rank) == (4, 3, 9, 1, 5)
+
+
+def test_rank_history_joins_rollups_and_raw_runs(model, client, headers):
+    before = query_history.rank_history(model, URL)
+    query_history.rollup()
+    after = query_history.rank_history(model, URL)
+
+    assert after["running shoes"] == [
+        {"timestamp": days_ago(40).date().isoformat(), "rank": 4.0, "best_rank": 3, "worst_rank": 5,
+         "runs": 3, "rollup": True},
+        {"timestamp": days_ago(35).date().isoformat(), "rank": 2.0, "best_rank": 2, "worst_rank": 2,
+         "runs": 1, "rollup": True},
+        {"timestamp": days_ago(2).isoformat(), "rank": 1},
+        {"timestamp": days_ago(1).isoformat(), "rank": None},
+    ]
+    # Before the rollup the same days came from raw runs
+    assert [point["rank"] for point in before["running shoes"]] == [3, 5, None, 2, 1, None]
+    assert [point["rank"] for point in after["trail shoes"]] == [4.0]
+    assert list(query_history.rank_history(model, URL, query="trail shoes")) == ["trail shoes"]
+    assert list(query_history.rank_history(model, URL, days=10)) == ["running shoes"]
+
+    body = client.get(f'/api/models/{model.id}/rank-history', headers=headers,
+                      query_string={"url": URL, "query": "running shoes", "days": 36}).get_json()
+    assert [point["timestamp"] for point in body["series"]["running shoes"]] == \
+        [days_ago(35).date().isoformat(), days_ago(2).isoformat(), days_ago(1).isoformat()]
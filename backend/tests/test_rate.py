@@ -0,0 +1,68 @@
+import json
+import random
+
+import pytest
+
+import llm
+import operations
+from benchmarks.servers import WORDS
+
+rng = random.Random(1)
+BASE = ' '.join(rng.choice(WORDS) for _ in range(400))
+CONTENTS = [
+    BASE,
+    BASE.replace(' ', ' extra ', 1),  # near-duplicate of BASE
+    ' '.join(rng.choice(WORDS) for _ in range(300)),
+    ' '.join(rng.choice(WORDS) for _ in range(250)),
+]
+
+
+def expected_rating(content):
+    # What FakeAnthropic answers for a prompt of this length
+    return 70 + max(1, len(content) // 4) % 30
+
+
+@pytest.fixture
+def model(make_model):
+    items = [{"url": f"https://example.com/{n}", "text_content": content} for n, content in enumerate(CONTENTS)]
+    return make_model(items + [{"url": "https://example.com/empty", "text_content": ''}])
+
+
+def rate(client, headers, model, **params):
+    response = client.post(f'/api/models/{model.id}/rate-content', headers=headers, json={
+        "apiKey": "test-key", "contentType": "text_content", "ratingMethod": "claude", "stream": True,
+        "incremental": False, **params})
+    assert response.status_code == 200
+    events = [json.loads(line[len('data: '):]) for line in response.get_data(as_text=True).splitlines()
+              if line.startswith('data: ')]
+    return {event['url']: event for event in events if event['event'] == 'item'}
+
+
+@pytest.mark.parametrize('dedupe', ['off', 'fanout'])
+def test_batch_results_map_to_their_rows(client, headers, model, dedupe):
+    direct = rate(client, headers, model, dedupe=dedupe)
+    batched = rate(client, headers, model, dedupe=dedupe, batch=True)
+
+    assert {url: event.get('rating') for url, event in batched.items()} == \
+        {url: event.get('rating') for url, event in direct.items()}
+    assert batched['https://example.com/2']['rating'] == expected_rating(CONTENTS[2])
+    assert batched['https://example.com/empty']['status'] == 'skipped'
+    if dedupe == 'fanout':
+        assert batched['https://example.com/1']['duplicate_of'] == 'https://example.com/0'
+        assert batched['https://example.com/1']['rating'] == expected_rating(CONTENTS[0])
+
+
+def test_missing_batch_results_are_reported_per_row(client, headers, model, monkeypatch):
+    results = llm.MessageBatchRunner.results
+    dropped = {operations._content_hash(CONTENTS[0]), operations._content_hash(CONTENTS[2])}
+
+    def drop_some(self, batch_ids):
+        return {custom_id: outcome for custom_id, outcome in results(self, batch_ids).items()
+                if custom_id not in dropped}
+
+    monkeypatch.setattr(llm.MessageBatchRunner, 'results', drop_some)
+    events = rate(client, headers, model, dedupe='fanout', batch=True)
+
+    for url in ('https://example.com/0', 'https://example.com/1', 'https://example.com/2'):
+        assert events[url]['status'] == 'error' and 'No result returned' in events[url]['message']
+    assert events['https://example.com/3']['rating'] == expected_rating(CONTENTS[3])
@@ -0,0 +1,62 @@
+import re
+
+import pytest
+
+import extractors
+import model_store
+import scraper
+from models import db
+
+
+def scrape(client, headers, model, **params):
+    response = client.post(f'/api/models/{model.id}/scrape', headers=headers, json={"delay": 0, **params})
+    assert response.status_code == 200
+    body = response.get_json()
+    positions = [int(n) for message in body['messages'] for n in re.findall(r'/page/(\d+)', message)]
+    return body, positions
+
+
+def test_rescrape_resumes_in_chunks_and_resets_when_complete(make_model, client, headers, site):
+    model = make_model([{"url": f"http://127.0.0.1:{site.port}/page/{n}"} for n in range(5)])
+    body, positions = scrape(client, headers, model)
+    assert body['complete'] and positions == [0, 1, 2, 3, 4]
+    assert body['last_scraped_id'] is None
+
+    chunks = []
+    for _ in range(3):
+        body, positions = scrape(client, headers, model, rescrape=True, resume=True, limit=2)
+        chunks.append((positions, body['complete'], body['last_scraped_id']))
+    assert chunks == [([0, 1], False, 1), ([2, 3], False, 3), ([4], True, None)]
+
+    db.session.expire_all()
+    assert model.last_scraped_id is None
+    # A finished rescrape leaves nothing to resume, so the next one starts over
+    _, positions = scrape(client, headers, model, rescrape=True, resume=True, limit=1)
+    assert positions == [0]
+
+
+def test_resume_after_position_zero(make_model, client, headers, site):
+    model = make_model([{"url": f"http://127.0.0.1:{site.port}/page/{n}"} for n in range(3)])
+    body, positions = scrape(client, headers, model, rescrape=True, limit=1)
+    assert positions == [0] and body['last_scraped_id'] == 0
+
+    body, positions = scrape(client, headers, model, rescrape=True, resume=True)
+    assert positions == [1, 2] and body['complete']
+
+
+def test_rescrape_of_unchanged_pages_is_conditional(make_model, client, headers, site, monkeypatch):
+    model = make_model([{"url": f"http://127.0.0.1:{site.port}/page/{n}"} for n in range(3)])
+    scrape(client, headers, model)
+    db.session.expire_all()
+    before = {row.position: (row.data['etag'], row.data['text_content']) for row in model_store.rows(model)}
+
+    extractor = extractors.get_extractor()
+    monkeypatch.setattr(extractor, 'extract', lambda *args, **kwargs: pytest.fail("unchanged page parsed"))
+    monkeypatch.setattr(scraper, 'get_extractor', lambda: extractor)
+    body, positions = scrape(client, headers, model, rescrape=True)
+
+    assert (body['fetched_count'], body['unchanged_count'], positions) == (3, 3, [0, 1, 2])
+    db.session.expire_all()
+    # Scrape time moves on; the validators and content from the last full fetch stay
+    assert {row.position: (row.data['etag'], row.data['text_content'])
+            for row in model_store.rows(model)} == before
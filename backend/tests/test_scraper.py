@@ -0,0 +1,204 @@
+import socket
+import threading
+import time
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+import pytest
+import requests
+
+import scraper as scraper_module
+import url_resolver
+from benchmarks.servers import FixtureSite
+from extractors import SoupExtractor
+from http_session import get_session_manager
+from scraper import Scraper
+from url_resolver import UrlResolver
+
+
+@pytest.fixture
+def resolving(monkeypatch):
+    monkeypatch.setattr(UrlResolver, 'resolves', lambda self, host: True)
+
+
+def fake_fetches(scraper, delays, redirects=None):
+    """Replace the network: each candidate succeeds after delays[url] seconds, or is refused if None."""
+    finished = []
+
+    def perform(url, validators=None, timeout=None):
+        if delays[url] is None:
+            raise requests.ConnectionError(f"Connection refused: {url}")
+        time.sleep(delays[url])
+        finished.append(url)
+        return {"url": url, "title": url}, (redirects or {}).get(url, url)
+
+    scraper._perform_scrape = perform
+    return finished
+
+
+def test_probe_remembers_only_the_winner(resolving):
+    scraper = Scraper()
+    # The https variation ranks first and wins; the slower http one finishes afterwards
+    finished = fake_fetches(scraper, {"https://example.test/a": 0.05, "http://example.test/a": 0.2})
+
+    result = scraper.scrape_url('example.test/a')
+    assert result['url'] == 'https://example.test/a'
+    time.sleep(0.3)
+    assert finished == ['https://example.test/a', 'http://example.test/a']
+    assert scraper.resolver.preferred('https://example.test/b')
+
+
+def test_probe_remembers_scheme_after_redirect(resolving):
+    scraper = Scraper()
+    # https is refused; http answers by redirecting to https
+    fake_fetches(scraper, {"https://example.test/a": None, "http://example.test/a": 0.0},
+                 redirects={"http://example.test/a": "https://example.test/a"})
+    scraper.scrape_url('example.test/a')
+    assert scraper.resolver.preferred('https://example.test/b')
+
+
+def test_failed_dns_lookups_expire(monkeypatch):
+    resolver = UrlResolver()
+    lookups = []
+
+    def getaddrinfo(host, port):
+        lookups.append(host)
+        if len(lookups) == 1:
+            raise socket.gaierror('temporary failure')
+        return []
+
+    clock = [1000.0]
+    monkeypatch.setattr(socket, 'getaddrinfo', getaddrinfo)
+    monkeypatch.setattr(url_resolver, 'time', SimpleNamespace(monotonic=lambda: clock[0]))
+
+    assert not resolver.resolves('example.test')
+    assert not resolver.resolves('example.test')
+    assert len(lookups) == 1
+
+    clock[0] += url_resolver.NEGATIVE_DNS_TTL + 1
+    assert resolver.resolves('example.test')
+    clock[0] += 10 * url_resolver.NEGATIVE_DNS_TTL
+    assert resolver.resolves('example.test')
+    assert len(lookups) == 2
+
+
+class RecordingSession:
+    """The shared session manager, noting each GET's headers, start time and how many ran alongside it."""
+
+    def __init__(self):
+        self.sent = []
+        self.started = []
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def get(self, url, timeout=10, headers=None):
+        with self._lock:
+            self.sent.append(headers or {})
+            self.started.append((urlsplit(url).hostname, time.monotonic()))
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            return get_session_manager().get(url, timeout=timeout, headers=headers)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+class CountingExtractor(SoupExtractor):
+    def __init__(self):
+        self.parsed = 0
+
+    def extract(self, html, links=False):
+        self.parsed += 1
+        return super().extract(html, links)
+
+
+@pytest.fixture
+def recording():
+    session, extractor = RecordingSession(), CountingExtractor()
+    return Scraper(session=session, extractor=extractor), session, extractor
+
+
+def test_first_fetch_stores_validators(site, recording):
+    scraper, session, extractor = recording
+    url = f"http://127.0.0.1:{site.port}/page/3"
+
+    result = scraper.scrape_url(url)
+    assert session.sent == [{}]
+    assert (result['etag'], len(result['content_hash'])) == ('"page-3"', 64)
+    assert result['title'] and extractor.parsed == 1
+
+
+def test_not_modified_skips_parsing(site, recording):
+    scraper, session, extractor = recording
+    url = f"http://127.0.0.1:{site.port}/page/3"
+    first = scraper.scrape_url(url)
+
+    again = scraper.scrape_url(url, validators=first)
+    assert session.sent[-1] == {"If-None-Match": '"page-3"'}
+    assert again['unchanged'] and 'title' not in again
+    # A 304 has no body, so the stored hash is carried over
+    assert again['content_hash'] == first['content_hash']
+    assert extractor.parsed == 1
+
+
+def test_identical_body_counts_as_unchanged(site, recording):
+    scraper, session, extractor = recording
+    url = f"http://127.0.0.1:{site.port}/page/3"
+    first = scraper.scrape_url(url)
+    # No ETag to match, so the site answers 200 and the body hash decides
+    validators = {"last_modified": "Sat, 17 Oct 2026 10:00:00 GMT", "content_hash": first['content_hash']}
+
+    again = scraper.scrape_url(url, validators=validators)
+    assert session.sent[-1] == {"If-Modified-Since": "Sat, 17 Oct 2026 10:00:00 GMT"}
+    assert again['unchanged'] and extractor.parsed == 1
+
+    changed = scraper.scrape_url(url, validators={"content_hash": "0" * 64})
+    assert 'unchanged' not in changed and changed['title'] == first['title']
+    assert extractor.parsed == 2
+
+
+@pytest.fixture
+def slow_site():
+    server = FixtureSite(latency=0.1, page_bytes=2000).start()
+    yield server
+    server.stop()
+
+
+def pages(site, count, host='127.0.0.1'):
+    return [(f"http://{host}:{site.port}/page/{n}", None) for n in range(count)]
+
+
+def test_requests_to_one_host_are_spaced_and_capped(site, recording):
+    scraper, session, _ = recording
+    targets = pages(site, 4) + pages(site, 4, host='localhost')
+
+    results = list(scraper.scrape_many(targets, concurrency=8, delay=0.2, per_host=4))
+
+    assert all('error' not in result for result in results)
+    for host in ('127.0.0.1', 'localhost'):
+        starts = sorted(started for name, started in session.started if name == host)
+        assert len(starts) == 4
+        assert min(b - a for a, b in zip(starts, starts[1:])) >= 0.19
+    # The hosts are spaced independently, so both start straight away
+    first = {}
+    for name, started in session.started:
+        first.setdefault(name, started)
+    assert abs(first['127.0.0.1'] - first['localhost']) < 0.15
+
+
+def test_per_host_concurrency_cap(slow_site, recording):
+    scraper, session, _ = recording
+
+    list(scraper.scrape_many(pages(slow_site, 8), concurrency=8, per_host=2))
+    assert session.peak == 2
+
+
+def test_process_wide_cap_spans_hosts(slow_site, recording, monkeypatch):
+    scraper, session, _ = recording
+    monkeypatch.setattr(scraper_module, '_global_slots', threading.BoundedSemaphore(3))
+    targets = pages(slow_site, 6) + pages(slow_site, 6, host='localhost')
+
+    results = list(scraper.scrape_many(targets, concurrency=12, per_host=6))
+    assert len(results) == 12 and session.peak == 3
@@ -0,0 +1,106 @@
+from datetime import datetime
+
+import pytest
+
+import serp
+from benchmarks.servers import FixtureSite
+from models import db, SerpCacheEntry, QueryRun
+
+
+@pytest.fixture
+def search(site, monkeypatch):
+    monkeypatch.setattr(serp, 'GOOGLE_SEARCH_URL', f'http://127.0.0.1:{site.port}/search')
+    return site
+
+
+def test_repeat_query_is_served_from_cache(ctx, search):
+    results, cached = serp.cached_serp('Running Shoes', 10)
+    assert not cached and len(results) == 10
+    db.session.commit()
+
+    # Normalized, and a shallower depth is a prefix of the stored page
+    again, cached = serp.cached_serp('  running   shoes ', 5)
+    assert cached and again == results
+    assert search.requests == 1
+    assert SerpCacheEntry.query.one().hits == 1
+
+
+def test_deeper_query_refetches_and_replaces_entry(ctx, search):
+    serp.cached_serp('shoes', 10)
+    db.session.commit()
+    results, cached = serp.cached_serp('shoes', 20)
+    db.session.commit()
+
+    assert not cached and len(results) == 20
+    assert search.requests == 2
+    assert [entry.depth for entry in SerpCacheEntry.query.all()] == [20]
+
+
+def test_expired_entry_is_refetched(ctx, search):
+    serp.cached_serp('shoes', 10)
+    entry = SerpCacheEntry.query.one()
+    entry.fetched_at = datetime.utcnow() - serp.SERP_CACHE_TTL * 2
+    db.session.commit()
+
+    _, cached = serp.cached_serp('shoes', 10)
+    db.session.commit()
+    assert not cached and search.requests == 2
+    assert SerpCacheEntry.query.count() == 1
+    assert serp.prune() == 0
+
+
+def test_refresh_bypasses_cache(ctx, search):
+    serp.cached_serp('shoes', 10)
+    db.session.commit()
+    _, cached = serp.cached_serp('shoes', 10, refresh=True)
+    assert not cached and search.requests == 2
+
+
+def test_empty_result_page_is_not_cached(ctx, site, monkeypatch):
+    # A page without organic results, like a captcha or consent interstitial
+    monkeypatch.setattr(serp, 'GOOGLE_SEARCH_URL', f'http://127.0.0.1:{site.port}/page/0')
+
+    assert serp.cached_serp('shoes', 10) == ([], False)
+    db.session.commit()
+    assert SerpCacheEntry.query.count() == 0
+    assert serp.cached_serp('shoes', 10) == ([], False)
+    assert site.requests == 2
+
+
+def test_empty_refresh_keeps_the_cached_page(ctx, search, monkeypatch):
+    results, _ = serp.cached_serp('shoes', 10)
+    db.session.commit()
+
+    monkeypatch.setattr(serp, 'GOOGLE_SEARCH_URL', f'http://127.0.0.1:{search.port}/page/0')
+    assert serp.cached_serp('shoes', 10, refresh=True) == ([], False)
+    db.session.commit()
+    assert serp.cached_serp('shoes', 10) == (results, True)
+
+
+@pytest.fixture
+def failing_search(monkeypatch):
+    server = FixtureSite(latency=0, error_rate=1.0).start()
+    monkeypatch.setattr(serp, 'GOOGLE_SEARCH_URL', f'http://127.0.0.1:{server.port}/page/0')
+    yield server
+    server.stop()
+
+
+def test_upstream_error_is_a_bad_gateway(make_model, client, headers, failing_search):
+    model = make_model()
+
+    response = client.post(f'/api/models/{model.id}/test', headers=headers,
+                           json={"query": "shoes", "testMethod": "google"})
+    assert response.status_code == 502
+    assert '500' in response.get_json()['error']
+    assert SerpCacheEntry.query.count() == 0 and QueryRun.query.count() == 0
+
+
+def test_unreachable_upstream_is_a_bad_gateway(make_model, client, headers, monkeypatch):
+    model = make_model()
+    server = FixtureSite(latency=0).start()
+    server.stop()
+    monkeypatch.setattr(serp, 'GOOGLE_SEARCH_URL', f'http://127.0.0.1:{server.port}/search')
+
+    response = client.post(f'/api/models/{model.id}/test', headers=headers,
+                           json={"query": "shoes", "testMethod": "google"})
+    assert response.status_code == 502
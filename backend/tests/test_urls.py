@@ -0,0 +1,70 @@
+from collections import Counter
+
+import pytest
+
+import model_store
+from csv_processor import canonicalize_url, ingest_rows
+
+
+@pytest.mark.parametrize('url, base_url, expected', [
+    ('HTTP://Example.COM:80/Path/?b=2&a=1#top', '', 'http://example.com/Path?a=1&b=2'),
+    ('https://example.com:443', '', 'https://example.com/'),
+    ('https://example.com:8443/a/', '', 'https://example.com:8443/a'),
+    ('https://example.com/?utm_source=x&gclid=y&id=3', '', 'https://example.com/?id=3'),
+    # Relative URLs are resolved with urljoin, so they follow the base's directory and '..'
+    ('page', 'https://example.com/blog/', 'https://example.com/blog/page'),
+    ('../about', 'https://example.com/blog/post', 'https://example.com/about'),
+    ('/about', 'https://example.com/blog/', 'https://example.com/about'),
+    ('https://other.com/x', 'https://example.com/', 'https://other.com/x'),
+    # Scheme-less bases are joined as text, for the scraper to pick the scheme
+    ('/about', 'example.com', 'example.com/about'),
+])
+def test_canonicalize_url(url, base_url, expected):
+    assert canonicalize_url(url, base_url) == expected
+
+
+@pytest.mark.parametrize('url, base_url', [('http://host:abc/', ''), ('/a', 'http://host:abc/'),
+                                           (5, ''), ('/a', ['http://example.com'])])
+def test_canonicalize_rejects_bad_urls(url, base_url):
+    with pytest.raises(ValueError):
+        canonicalize_url(url, base_url)
+
+
+def test_ingest_drops_duplicates_and_invalid_rows():
+    rows = [{"url": "https://example.com/a", "n": "1"}, {"url": "https://EXAMPLE.com/a/#x", "n": "2"},
+            {"url": "", "n": "3"}, {"url": "http://host:abc/", "n": "4"},
+            {"url": "/b?utm_medium=mail", "n": "5"}, {"url": "https://example.com/b", "n": "6"}]
+    stats = Counter()
+
+    items = list(ingest_rows(rows, 'url', 'https://example.com/', stats))
+
+    assert [(item['url'], item['additional_data']['n']) for item in items] == \
+        [('https://example.com/a', '1'), ('https://example.com/b', '5')]
+    assert (stats['rows_read'], stats['empty'], stats['invalid'], stats['duplicate']) == (6, 1, 1, 2)
+
+
+def test_add_url_canonicalizes_and_rejects_duplicates(make_model, client, headers):
+    model = make_model([{"url": "https://example.com/a"}])
+
+    def add(url):
+        return client.post(f'/api/models/{model.id}/add-url', headers=headers, json={"url": url})
+
+    assert add('https://Example.com/a/?utm_source=x').status_code == 409
+    assert add('https://example.com/b#top').status_code == 200
+    assert add('https://example.com/b').status_code == 409
+    assert [row.url for row in model_store.rows(model)] == ['https://example.com/a', 'https://example.com/b']
+
+
+@pytest.mark.parametrize('url', ['http://host:abc/', 5])
+def test_bad_urls_are_client_errors(make_model, client, headers, url):
+    model = make_model()
+
+    response = client.post(f'/api/models/{model.id}/add-url', headers=headers, json={"url": url})
+    assert response.status_code == 400
+    response = client.post('/api/models', headers=headers, json={"url": url, "model_name": "single"})
+    assert response.status_code == 400
+    response = client.post('/api/models', headers=headers,
+                           json={"crawl": True, "base_url": url, "model_name": "crawl"})
+    assert response.status_code == 400
+    response = client.post(f'/api/models/{model.id}/crawl', headers=headers, json={"base_url": url})
+    assert response.status_code == 400
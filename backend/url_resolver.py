@@ -0,0 +1,92 @@
+import re
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+_SCHEME_RE = re.compile(r'^(https?):/*', re.IGNORECASE)
+_HOSTLIKE_RE = re.compile(r'^(localhost|[\w-]+(\.[\w-]+)+)(:\d+)?$')
+# A failed lookup is retried after this long: it may have been a resolver hiccup, or a domain
+# registered since. Successful lookups are kept for the resolver's lifetime.
+NEGATIVE_DNS_TTL = 60
+
+
+class UrlResolver:
+    """Turns raw model URLs into fetch candidates, remembering per host which scheme worked."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._schemes: Dict[str, str] = {}
+        # host -> (resolves, monotonic time the answer expires, or None for never)
+        self._dns: Dict[str, Tuple[bool, Optional[float]]] = {}
+
+    def candidates(self, url: str, base_url: str = '') -> List[str]:
+        url = (url or '').strip()
+        base_url = self._normalize_base(base_url)
+        if not url:
+            return [base_url] if base_url else []
+
+        match = _SCHEME_RE.match(url)
+        if match:
+            # Absolute, possibly with a mangled "https:/" prefix
+            candidates = [f"{match.group(1).lower()}://{url[match.end():]}"]
+        else:
+            bare = url.lstrip('/')
+            joined = [urljoin(base_url, url)] if base_url else []
+            schemes = [f"https://{bare}", f"http://{bare}"]
+            if url.startswith('//') or _HOSTLIKE_RE.match(bare.split('/', 1)[0]):
+                candidates = schemes + joined
+            else:
+                candidates = joined or schemes
+
+        return self._prefer_known_scheme(list(dict.fromkeys(candidates)))
+
+    def host_for(self, url: str, base_url: str = '') -> str:
+        candidates = self.candidates(url, base_url)
+        return self.host(candidates[0]) if candidates else ''
+
+    @staticmethod
+    def host(url: str) -> str:
+        return (urlparse(url).hostname or '').lower()
+
+    def preferred(self, url: str) -> bool:
+        parsed = urlparse(url)
+        with self._lock:
+            return self._schemes.get((parsed.hostname or '').lower()) == parsed.scheme
+
+    def remember(self, url: str, final_url: Optional[str] = None):
+        """Record the scheme that worked for url's host: final_url's, if the fetch was redirected."""
+        scheme = urlparse(final_url or url).scheme
+        if scheme not in ('http', 'https'):
+            return
+        with self._lock:
+            self._schemes[self.host(url)] = scheme
+
+    def resolves(self, host: str) -> bool:
+        with self._lock:
+            known = self._dns.get(host)
+        if known is not None and (known[1] is None or known[1] > time.monotonic()):
+            return known[0]
+        try:
+            socket.getaddrinfo(host, None)
+            ok = True
+        except (socket.gaierror, UnicodeError):
+            ok = False
+        with self._lock:
+            self._dns[host] = (ok, None if ok else time.monotonic() + NEGATIVE_DNS_TTL)
+        return ok
+
+    def _prefer_known_scheme(self, candidates: List[str]) -> List[str]:
+        known = [c for c in candidates if self.preferred(c)]
+        return known + [c for c in candidates if c not in known]
+
+    @staticmethod
+    def _normalize_base(base_url: Optional[str]) -> str:
+        base_url = (base_url or '').strip()
+        if base_url and not _SCHEME_RE.match(base_url):
+            base_url = f"https://{base_url.lstrip('/')}"
+        match = _SCHEME_RE.match(base_url)
+        if match:
+            base_url = f"{match.group(1).lower()}://{base_url[match.end():]}"
+        return base_url